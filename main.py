@@ -3,16 +3,43 @@
 """
 Module Docstring
 """
+
+import datetime
+import json
+import pathlib
+import signal
 import sys
+import threading
 
 import click
+from pymongo.errors import OperationFailure
+
+from docuparse import config, get_logger
+from docuparse.containers import ArchiveDataSource, DataContainer, FileDataDirectory, is_archive
+from docuparse.docbins import DocBinStore
+from docuparse.extraction import ExtractionEngine
+from docuparse.fingerprint import FingerprintIndex
+from docuparse.fuzzy import TrigramIndex, TrigramIndexWriter
+from docuparse.memory import MB
+from docuparse.rastercache import RasterCache
+from docuparse.search import IndexBuilder, LocalIndex, mongo_search
+from docuparse.server import OCRService, ServiceHTTPServer, UnixServiceServer
+from docuparse.stats import local_stats, mongo_stats
+from docuparse.store import JSONLDataReader, JSONLDataWriter, MongoDBConnection, MongoDBDataReader, MongoDBDataWriter
+from docuparse.text_analysis import NLPEnricher, load_pipeline
+from docuparse.vectors import IVFIndex, VectorStore, similar_documents
+from docuparse.watch import Watcher
+from docuparse.wordboxes import GridIndex
 
-from docuparse import get_logger
-from docuparse.containers import FileDataDirectory
+
+def _container(directory: str, workers: int = 1, cpus: int = 0) -> DataContainer:
+    if is_archive(directory):
+        return ArchiveDataSource(directory, workers=workers, cpus=cpus)
+    return FileDataDirectory(directory, workers=workers, cpus=cpus)
 
 
 def _execute(directory: str, force: bool):
-    FileDataDirectory(directory).process_files(force=bool(force))
+    _container(directory).process_files(force=bool(force))
 
 
 @click.group()
@@ -26,18 +53,351 @@ def docuparse():
 @click.option("--force", is_flag=True, help="Force data overwrite.")
 @click.option("--verbose", is_flag=True, help="Enable verbose mode.")
 @click.option("--dry-run", is_flag=True, help="Enable verbose mode.")
+@click.option("--workers", default=1, help="Number of worker processes. 0 picks from the cpu budget.")
+@click.option("--cpus", default=0, help="Cpu budget for workers and tesseract threads. 0 uses all cpus.")
+@click.option("--image-timeout", type=float, default=None, help="Seconds each image may spend in tesseract.")
+@click.option("--document-timeout", type=float, default=None, help="Seconds each document may take.")
+@click.option(
+    "--memory-limit",
+    type=int,
+    default=None,
+    help="Megabytes of decoded images in flight over the run, split between workers. 0 for no bound.",
+)
+@click.option("--dedupe", is_flag=True, help="Link duplicates of processed documents instead of processing them.")
+@click.option("--fuzzy-index", default=None, help="Also add documents to the fuzzy search index at this path.")
+@click.option("--jsonl", default=None, help="Also append documents to JSONL shards in this directory.")
+@click.option("--gzip", "gzip_jsonl", is_flag=True, help="Gzip the JSONL shards.")
+@click.option("--raster-cache", default=None, help="Keep decoded pdf images in this directory for later runs.")
+@click.option("--raster-cache-mb", default=config.raster_cache_mb, help="Megabytes the raster cache may hold.")
 @click.argument("directory", default="data/test/pdf/")
-def run(directory: str, force: bool, verbose: bool, dry_run):
+def run(
+    directory: str,
+    force: bool,
+    verbose: bool,
+    dry_run,
+    workers: int,
+    cpus: int,
+    image_timeout: float | None,
+    document_timeout: float | None,
+    memory_limit: int | None,
+    dedupe: bool,
+    fuzzy_index: str | None,
+    jsonl: str | None,
+    gzip_jsonl: bool,
+    raster_cache: str | None,
+    raster_cache_mb: int,
+):  # pylint: disable=too-many-arguments
     """
-    Runs collection against a small test dataset.
+    Runs collection against a directory or a zip/tar archive of documents.
     """
     logger = get_logger(verbose)
     click.echo("beginning collection of test")
     logger.info("beginning run.")
-    FileDataDirectory(directory).process_files(force=bool(force), dry_run=dry_run)
+    container = _container(directory, workers, cpus)
+    container.set_time_budget(image_timeout, document_timeout)
+    if memory_limit is not None:
+        container.memory_limit_mb = memory_limit
+    if raster_cache:
+        container.set_raster_cache(RasterCache(raster_cache, raster_cache_mb * MB))
+    if dedupe:
+        connection = MongoDBConnection(collection_name=f"{config.mongo_collection}_fingerprints")
+        container.fingerprints = FingerprintIndex(connection.collection)
+    fuzzy_writer = TrigramIndexWriter(fuzzy_index) if fuzzy_index else None
+    if fuzzy_writer:
+        container.register_writer(fuzzy_writer)
+    jsonl_writer = JSONLDataWriter(jsonl, compress=gzip_jsonl) if jsonl else None
+    if jsonl_writer:
+        container.register_writer(jsonl_writer)
+    try:
+        if not dry_run:
+            MongoDBConnection().ensure_indexes()
+        report = container.process_files(force=bool(force), dry_run=dry_run)
+    finally:
+        # flush the buffered shards and merge the fuzzy index even when the run fails
+        for writer in (fuzzy_writer, jsonl_writer):
+            if writer:
+                writer.close()
+    click.echo(report.summary())
+
+
+@click.command()
+@click.option("--index", "index_path", default=None, help="Search a local index built by build-index instead of mongo.")
+@click.option("--fuzzy", "fuzzy_path", default=None, help="Approximate search on a fuzzy index built by build-index.")
+@click.option("--distance", default=2, help="Edits allowed per word in fuzzy search.")
+@click.option("--limit", default=10, help="Number of documents to return.")
+@click.option("--pages", default=5, help="Page hits to show per document.")
+@click.argument("query")
+def search(
+    query: str, index_path: str | None, fuzzy_path: str | None, distance: int, limit: int, pages: int
+):  # pylint: disable=too-many-arguments
+    """
+    Ranked full text search over processed documents.
+    """
+    if fuzzy_path:
+        results = TrigramIndex(fuzzy_path).search(query, distance, limit)
+        for result in results:
+            result.pages = result.pages[:pages]
+    elif index_path:
+        with LocalIndex(index_path) as index:
+            results = index.search(query, limit, pages)
+    else:
+        try:
+            results = mongo_search(MongoDBDataReader(), query, limit, pages)
+        except OperationFailure as e:
+            raise click.ClickException(f"{e}.  Build the text index with `python main.py indexes`.") from e
+    if not results:
+        click.echo("no matches")
+    for result in results:
+        click.echo(result.describe())
+
+
+@click.command()
+@click.option("--fuzzy", is_flag=True, help="Build a fuzzy search index file instead.")
+@click.argument("path")
+def build_index(path: str, fuzzy: bool):
+    """
+    Build a local search index at path from the documents in mongo.
+    """
+    if fuzzy:
+        writer = TrigramIndexWriter(path)
+        projection = {"pages_data.combined_text": 1, "merged_text": 1}
+        for document in MongoDBDataReader().iter_data(projection=projection):
+            writer.write_data({str(document["_id"]): document}, force=True)
+        writer.close()
+        click.echo(f"indexed {len(writer.index.terms)} terms of {len(writer.index.documents)} documents")
+        return
+    builder = IndexBuilder(path)
+    builder.add_documents(MongoDBDataReader().iter_data(projection={"pages_data.combined_text": 1}))
+    index = builder.finish()
+    click.echo(f"indexed {index.page_count} pages of {len(index.documents)} documents")
+    index.close()
+
+
+@click.command()
+@click.option("--model", default="en_core_web_lg", help="spacy pipeline to load.")
+@click.option("--batch-size", default=64, help="Pages per nlp batch.")
+@click.option("--processes", default=1, help="Processes for nlp. Each loads the model once.")
+@click.option("--force", is_flag=True, help="Redo documents that already have entities.")
+@click.option("--docbins", default=None, help="Directory of DocBin shards to keep annotated pages in and reuse.")
+def nlp(model: str, batch_size: int, processes: int, force: bool, docbins: str | None):
+    """
+    Add named entities to the processed documents in mongo.
+    """
+    store = DocBinStore(docbins) if docbins else None
+    enricher = NLPEnricher(model, batch_size=batch_size, n_process=processes, docbins=store)
+    updated = enricher.enrich_collection(MongoDBDataReader(), MongoDBDataWriter(), force=force)
+    click.echo(f"added entities to {updated} documents")
+
+
+@click.command()
+@click.option("--gazetteer", default=None, help="File of subdivision names, one per line.")
+@click.option("--force", is_flag=True, help="Redo documents that already have extractions.")
+@click.option("--bulk-size", default=500, help="Documents per bulk write.")
+def extract(gazetteer: str | None, force: bool, bulk_size: int):
+    """
+    Extract subdivisions, lots, blocks, bearings, instrument numbers and registrations from documents in mongo.
+    """
+    engine = ExtractionEngine.from_file(gazetteer) if gazetteer else ExtractionEngine()
+    writer = MongoDBDataWriter()
+    # extracted_at marks done documents and, unlike the extractions array, is indexed
+    query = {} if force else {"extracted_at": {"$exists": False}}
+    updated = 0
+    pending: dict[str, dict] = {}
+    for document in MongoDBDataReader().iter_data(query, {"pages_data.combined_text": 1, "merged_text": 1}):
+        pending[str(document["_id"])] = {
+            "extractions": [e.as_dict() for e in engine.extract_document(document)],
+            "extracted_at": datetime.datetime.now(datetime.timezone.utc),
+        }
+        if len(pending) >= bulk_size:
+            updated += writer.bulk_update(pending)
+            pending = {}
+    updated += writer.bulk_update(pending)
+    click.echo(f"added extractions to {updated} documents")
+
+
+@click.command()
+@click.option("--model", default="en_core_web_lg", help="spacy pipeline whose word vectors are used.")
+@click.option("--batch-size", default=256, help="Pages per tokenizer batch.")
+@click.option("--approximate", is_flag=True, help="Also build the approximate index for large collections.")
+@click.option("--clusters", default=0, help="Clusters of the approximate index. 0 uses the square root of the pages.")
+@click.argument("path")
+def build_vectors(path: str, model: str, batch_size: int, approximate: bool, clusters: int):
+    """
+    Build a page vector store at PATH from the processed documents in mongo.
+    """
+    store = VectorStore(path)
+    done = {doc_id for doc_id, _ in store.keys}
+    documents = (
+        d
+        for d in MongoDBDataReader().iter_data({}, {"pages_data.combined_text": 1, "merged_text": 1})
+        if str(d["_id"]) not in done
+    )
+    added = store.add_documents(load_pipeline(model, ()), documents, batch_size)
+    click.echo(f"added {added} page vectors, {len(store)} in {path}")
+    if approximate and len(store):
+        IVFIndex(store).build(clusters or None)
+
+
+@click.command()
+@click.option("--vectors", "vectors_path", required=True, help="Vector store built by build-vectors.")
+@click.option("--limit", default=10, help="Number of documents to return.")
+@click.option("--approximate", is_flag=True, help="Use the approximate index instead of scanning every page.")
+@click.option("--probes", default=8, help="Clusters searched by the approximate index.")
+@click.argument("doc_id")
+def similar(doc_id: str, vectors_path: str, limit: int, approximate: bool, probes: int):
+    """
+    Find the documents most similar to DOC_ID.
+    """
+    store = VectorStore(vectors_path)
+    index = IVFIndex(store, probes) if approximate else None
+    for neighbor in similar_documents(store, doc_id, limit, index):
+        click.echo(f"{neighbor.score:8.3f}  {neighbor.doc_id}  page {neighbor.page + 1}")
+
+
+@click.command()
+@click.option("--workers", default=1, help="Number of worker processes. 0 picks from the cpu budget.")
+@click.option("--cpus", default=0, help="Cpu budget for workers and tesseract threads. 0 uses all cpus.")
+@click.option("--settle", default=2.0, help="Seconds a file must stay unchanged before it is processed.")
+@click.option("--interval", default=1.0, help="Seconds between polls of the directory.")
+@click.option("--jsonl", default=None, help="Also append documents to JSONL shards in this directory.")
+@click.argument("directory")
+def watch(directory: str, workers: int, cpus: int, settle: float, interval: float, jsonl: str | None):
+    """
+    Process files as they are dropped into DIRECTORY until interrupted.
+    """
+    container = FileDataDirectory(directory, workers=workers, cpus=cpus)
+    jsonl_writer = JSONLDataWriter(jsonl) if jsonl else None
+    if jsonl_writer:
+        container.register_writer(jsonl_writer)
+    stop = threading.Event()
+    signal.signal(signal.SIGTERM, lambda *_: stop.set())
+    watcher = Watcher(container, settle=settle, interval=interval)
+    try:
+        MongoDBConnection().ensure_indexes()
+        watcher.run(stop)
+    except KeyboardInterrupt:
+        watcher.stop()
+    finally:
+        if jsonl_writer:
+            jsonl_writer.close()
+    click.echo(watcher.stats.describe())
+
+
+@click.command()
+@click.option("--check", is_flag=True, help="Explain the common queries and report collection scans instead.")
+@click.option("--poll", default=5.0, help="Seconds between build progress reports.")
+def indexes(check: bool, poll: float):
+    """
+    Build the store indexes on the document collection, or check which common queries scan the whole collection.
+    """
+    connection = MongoDBConnection()
+    if check:
+        plans = connection.query_plans()
+        for name, stages in plans.items():
+            click.echo(f"{'SCAN' if 'COLLSCAN' in stages else 'ok':4}  {name}: {' <- '.join(stages)}")
+        sys.exit(1 if any("COLLSCAN" in stages for stages in plans.values()) else 0)
+
+    build = threading.Thread(target=connection.ensure_indexes, kwargs={"background": True}, daemon=True)
+    build.start()
+    while build.is_alive():
+        build.join(poll)
+        for op in connection.index_builds():
+            progress = f" {op['done']}/{op['total']}" if op["total"] else ""
+            click.echo(f"building {', '.join(op['indexes'])}: {op['message']}{progress}")
+    click.echo("indexes are built")
+
+
+@click.command()
+@click.option("--page", default=1, help="Page number, from 1.")
+@click.option("--box", default=None, help="Region x0,y0,x1,y1 in page points to print the text of.")
+@click.option("--near", default=None, help="Point x,y in page points to print the nearest words to.")
+@click.option("--match", default=None, help="Only words matching this regular expression, for --near.")
+@click.option("--limit", default=5, help="Number of words for --near.")
+@click.argument("doc_id")
+def words(
+    doc_id: str, page: int, box: str | None, near: str | None, match: str | None, limit: int
+):  # pylint: disable=too-many-arguments
+    """
+    Print the text in a region of a page of DOC_ID, or the words nearest a point.
+    """
+    documents = MongoDBDataReader().read_data({"_id": doc_id})
+    if not documents:
+        raise click.ClickException(f"{doc_id} is not in the store")
+    index = GridIndex.from_document(documents[0])
+    if near:
+        x, y = (float(v) for v in near.split(","))
+        for hit in index.nearest(page - 1, (x, y), limit, match):
+            click.echo(f"{hit.distance:8.1f}  {hit.word}  {', '.join(f'{v:.0f}' for v in hit.box)}")
+        return
+    rect = [float(v) for v in box.split(",")] if box else [-1e9, -1e9, 1e9, 1e9]
+    click.echo(index.text(page - 1, rect))
+
+
+@click.command()
+@click.option("--jsonl", default=None, help="Summarize the documents of this JSONL directory instead of mongo.")
+@click.option("--directory", "source_directory", default=None, help="Only documents from this source directory.")
+@click.option("--slowest", default=10, help="Number of slowest documents to list.")
+@click.option("--json", "as_json", is_flag=True, help="Print the statistics as json.")
+def stats(jsonl: str | None, source_directory: str | None, slowest: int, as_json: bool):
+    """
+    Summarize the processed collection: pages per document, ocr quality, image rotations and the slowest documents.
+    """
+    query = {"source_directory": source_directory} if source_directory else None
+    if jsonl:
+        result = local_stats(JSONLDataReader(jsonl).iter_data(query), slowest)
+    else:
+        result = mongo_stats(MongoDBDataReader(), query, slowest)
+    click.echo(json.dumps(result.as_dict(), indent=2) if as_json else result.describe())
+
+
+@click.command()
+@click.option("--host", default="127.0.0.1", help="Address to listen on.")
+@click.option("--port", default=8750, help="Port to listen on.")
+@click.option("--socket", "socket_path", default=None, help="Listen on this unix socket instead of a port.")
+@click.option("--workers", default=1, help="Number of worker processes. 0 picks from the cpu budget.")
+@click.option("--cpus", default=0, help="Cpu budget for workers and tesseract threads. 0 uses all cpus.")
+@click.option("--queue", default=16, help="Requests that may wait for a worker before new ones get 503.")
+@click.option("--queue-timeout", default=60.0, help="Seconds a request may wait for a worker. 0 for no bound.")
+def serve(
+    host: str, port: int, socket_path: str | None, workers: int, cpus: int, queue: int, queue_timeout: float
+):  # pylint: disable=too-many-arguments
+    """
+    Serve ocr of uploaded pdfs and images over http until interrupted.
+    """
+    service = OCRService(DataContainer(workers=workers, cpus=cpus), max_queue=queue, queue_timeout=queue_timeout)
+    service.start()
+    if socket_path:
+        pathlib.Path(socket_path).unlink(missing_ok=True)
+        server: ServiceHTTPServer | UnixServiceServer = UnixServiceServer(socket_path, service)
+        click.echo(f"serving on {socket_path}")
+    else:
+        server = ServiceHTTPServer((host, port), service)
+        click.echo(f"serving on http://{host}:{server.server_address[1]}")
+    # shutdown waits for serve_forever to return, so it cannot run on the thread serving
+    signal.signal(signal.SIGTERM, lambda *_: threading.Thread(target=server.shutdown).start())
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+        service.close()
+        if socket_path:
+            pathlib.Path(socket_path).unlink(missing_ok=True)
 
 
 docuparse.add_command(run)
+docuparse.add_command(search)
+docuparse.add_command(build_index)
+docuparse.add_command(nlp)
+docuparse.add_command(extract)
+docuparse.add_command(build_vectors)
+docuparse.add_command(similar)
+docuparse.add_command(indexes)
+docuparse.add_command(watch)
+docuparse.add_command(words)
+docuparse.add_command(serve)
+docuparse.add_command(stats)
 
 
 def main() -> int:
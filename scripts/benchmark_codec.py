@@ -0,0 +1,87 @@
+"""
+Compact storage benchmark.
+
+Compares the BSON size and read throughput of processed documents stored as they are and in the compact schema.
+Documents are the mongo shell exports under data/extract, converted to the current processed document layout.
+Reading is timed as BSON decoding plus, for compact documents, codec.decode, which is what a reader pays.
+
+    python scripts/benchmark_codec.py --repeat 200 data/extract
+"""
+
+import ast
+import pathlib
+import re
+import time
+from typing import Any
+
+import bson
+import click
+
+from docuparse import codec
+
+SHELL_LITERALS = {"true": "True", "false": "False", "null": "None"}
+
+
+def load_export(path: pathlib.Path) -> dict[str, Any]:
+    """
+    A document exported from the mongo shell, with its pages converted to the processed document layout.
+    """
+    text = path.read_text(encoding="utf8")
+    text = re.sub(r"^(\s*)(\w+):", r"\1'\2':", text, flags=re.M)
+    text = re.sub(
+        r": (true|false|null)(,?)$", lambda m: f": {SHELL_LITERALS[m.group(1)]}{m.group(2)}", text, flags=re.M
+    )
+    exported = ast.literal_eval(text)
+    pages = []
+    for page in exported.get("pages", []):
+        for content in page.values():
+            images = content.get("images", [])
+            pages.append({"images": images, "combined_text": [i.get("text", "") for i in images] + [content["text"]]})
+    return {
+        "_id": exported["_id"],
+        "merged_text": "".join(" ".join(p["combined_text"]) for p in pages),
+        "pages_data": pages,
+    }
+
+
+def read_seconds(blobs: list[bytes], decode: bool) -> float:
+    """
+    Seconds to decode every blob into a processed document.
+    """
+    start = time.perf_counter()
+    for blob in blobs:
+        document = bson.decode(blob)
+        if decode:
+            codec.decode(document)
+    return time.perf_counter() - start
+
+
+@click.command()
+@click.option("--repeat", default=100, help="Copies of each sample document read per timing.")
+@click.option("--compress-over", default=codec.COMPRESS_OVER, help="Compress texts of at least this many characters.")
+@click.argument("paths", nargs=-1)
+def main(paths: tuple[str, ...], repeat: int, compress_over: int):
+    """
+    Run the storage benchmark.
+    """
+    files = [f for p in paths or ("data/extract",) for f in sorted(pathlib.Path(p).glob("*.json"))]
+    documents = [load_export(f) for f in files]
+    for document in documents:
+        assert codec.decode(codec.encode(document, compress_over)) == document, document["_id"]
+    plain = [bson.encode(d) for d in documents]
+    compact = [bson.encode(codec.encode(d, compress_over)) for d in documents]
+    plain_bytes, compact_bytes = sum(map(len, plain)), sum(map(len, compact))
+    plain_seconds = read_seconds(plain * repeat, decode=False)
+    compact_seconds = read_seconds(compact * repeat, decode=True)
+    mb = 1024 * 1024
+    click.echo(
+        f"documents={len(documents)} plain={plain_bytes}B compact={compact_bytes}B "
+        f"ratio={plain_bytes / compact_bytes:.2f}x "
+        f"plain_read={plain_bytes * repeat / mb / plain_seconds:.1f}MB/s {len(plain) * repeat / plain_seconds:.0f}docs/s "
+        f"compact_read={compact_bytes * repeat / mb / compact_seconds:.1f}MB/s "
+        f"{len(compact) * repeat / compact_seconds:.0f}docs/s"
+    )
+
+
+if __name__ == "__main__":
+    main()  # pylint: disable=no-value-for-parameter
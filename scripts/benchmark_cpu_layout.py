@@ -0,0 +1,54 @@
+"""
+Cpu layout benchmark.
+
+Processes a directory once per layout of the cpu budget, from one worker with every cpu given to tesseract
+threads to one single threaded tesseract per cpu, and prints the wall clock time of each.  Nothing is written.
+
+    python scripts/benchmark_cpu_layout.py data/test/plats --cpus 8
+"""
+
+import time
+from typing import Any
+
+import click
+
+from docuparse.containers import FileDataDirectory, ocr
+from docuparse.ocr import CPUBudget
+
+
+class NullWriter:
+    """
+    Accepts every document and keeps nothing.
+    """
+
+    def write_data(self, data: dict[str, Any], force: bool = False) -> bool:  # pylint: disable=unused-argument
+        """Discard data."""
+        return True
+
+    def exists(self, uri: str) -> bool:  # pylint: disable=unused-argument
+        """Nothing exists."""
+        return False
+
+    def close(self) -> None:
+        """Nothing to close."""
+
+
+@click.command()
+@click.option("--cpus", default=0, help="Cpu budget. 0 uses all cpus.")
+@click.argument("directory", default="data/test/plats")
+def main(directory: str, cpus: int):
+    """
+    Time a run over directory for every layout of the cpu budget.
+    """
+    budget = CPUBudget(cpus or None, ocr_threads=ocr.workers)
+    for layout in budget.layouts():
+        container = FileDataDirectory(directory, workers=layout.workers, cpus=budget.total)
+        container.writers = [NullWriter()]
+        start = time.perf_counter()
+        report = container.process_files(force=True)
+        click.echo(f"{layout.describe():<70} {time.perf_counter() - start:8.1f}s  ({report.documents} documents)")
+    click.echo(f"auto: {budget.auto().describe()}")
+
+
+if __name__ == "__main__":
+    main()  # pylint: disable=no-value-for-parameter
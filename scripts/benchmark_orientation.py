@@ -0,0 +1,37 @@
+"""
+Orientation detection benchmark.
+
+Rotates every sample image by 0, 90, 180 and 270 degrees and compares thumbnail osd with full resolution osd.
+
+    python scripts/benchmark_orientation.py data/test/screenshots data/test/plats --max-side 2000
+"""
+
+import click
+
+from docuparse.orientation import OrientationDetector, benchmark, benchmark_images
+
+
+@click.command()
+@click.option("--max-side", default=2000, help="Longest thumbnail side in pixels.")
+@click.argument("paths", nargs=-1)
+def main(paths: tuple[str, ...], max_side: int):
+    """
+    Run the orientation benchmark over the images and pdfs in paths.
+    """
+    paths = paths or ("data/test/screenshots", "data/test/plats")
+    report = benchmark(benchmark_images(*paths), OrientationDetector(max_side=max_side))
+    for r in report["results"]:
+        click.echo(
+            f"{r["name"]:<90} expected={r["expected"]:>3} full={r["full"]["rotation"]:>3} "
+            f"({r["full_seconds"]:.2f}s) thumbnail={r["thumbnail"]["rotation"]:>3} ({r["thumbnail_seconds"]:.2f}s)"
+        )
+    summary = report["summary"]
+    click.echo(
+        f"samples={summary["samples"]} full_accuracy={summary["full_accuracy"]:.2%} "
+        f"thumbnail_accuracy={summary["thumbnail_accuracy"]:.2%} agreement={summary["agreement"]:.2%} "
+        f"full={summary["full_seconds"]:.1f}s thumbnail={summary["thumbnail_seconds"]:.1f}s"
+    )
+
+
+if __name__ == "__main__":
+    main()  # pylint: disable=no-value-for-parameter
@@ -0,0 +1,59 @@
+"""
+Watermark masking benchmark.
+
+Recognizes every sample image with and without its watermark overlay masked and compares the tesseract time and
+the number of words read.
+
+    python scripts/benchmark_watermarks.py data/test/plats
+"""
+
+import time
+
+import click
+import pytesseract
+
+from docuparse.orientation import benchmark_images
+from docuparse.watermarks import mask_overlay
+
+
+def recognize(image) -> tuple[float, int]:
+    """
+    Seconds tesseract takes on image and the words it reads.
+    """
+    start = time.perf_counter()
+    text = pytesseract.image_to_string(image)
+    return time.perf_counter() - start, len(text.split())
+
+
+@click.command()
+@click.argument("paths", nargs=-1)
+def main(paths: tuple[str, ...]):
+    """
+    Run the watermark benchmark over the images and pdfs in paths.
+    """
+    paths = paths or ("data/test/plats",)
+    totals = {"samples": 0, "detected": 0, "plain": 0.0, "masked": 0.0, "mask": 0.0, "words_dropped": 0}
+    for name, image in benchmark_images(*paths):
+        plain_seconds, plain_words = recognize(image)
+        masked, found = mask_overlay(image.copy())
+        masked_seconds, masked_words = recognize(masked) if found["detected"] else (plain_seconds, plain_words)
+        click.echo(
+            f"{name:<90} detected={found["detected"]!s:<5} coverage={found["coverage"]:.2%} "
+            f"plain={plain_seconds:.2f}s ({plain_words} words) masked={masked_seconds:.2f}s ({masked_words} words)"
+        )
+        totals["samples"] += 1
+        totals["detected"] += found["detected"]
+        totals["plain"] += plain_seconds
+        totals["masked"] += masked_seconds + found["mask_seconds"]
+        totals["mask"] += found["mask_seconds"]
+        totals["words_dropped"] += plain_words - masked_words
+    click.echo(
+        f"samples={totals["samples"]} detected={totals["detected"]} plain={totals["plain"]:.1f}s "
+        f"masked={totals["masked"]:.1f}s (masking {totals["mask"]:.2f}s) "
+        f"saved={totals["plain"] - totals["masked"]:.1f}s "
+        f"words_dropped={totals["words_dropped"]}"
+    )
+
+
+if __name__ == "__main__":
+    main()  # pylint: disable=no-value-for-parameter
@@ -47,6 +47,21 @@ class Config:  # pylint: disable=too-many-instance-attributes
     mongo_password: str = field(default_factory=lambda: os.getenv("MONGO_PASSWORD", ""))
     mongo_collection: str = field(default_factory=lambda: os.getenv("MONGO_COLLECTION", ""))
 
+    ocr_workers: int = field(default_factory=lambda: int(os.getenv("OCR_WORKERS", "1")))
+    ocr_timeout: float = field(default_factory=lambda: float(os.getenv("OCR_TIMEOUT", "0")))
+    document_timeout: float = field(default_factory=lambda: float(os.getenv("DOCUMENT_TIMEOUT", "0")))
+    memory_limit_mb: int = field(default_factory=lambda: int(os.getenv("MEMORY_LIMIT_MB", "0")))
+
+    mongo_pool_size: int = field(default_factory=lambda: int(os.getenv("MONGO_POOL_SIZE", "20")))
+    mongo_timeout_ms: int = field(default_factory=lambda: int(os.getenv("MONGO_TIMEOUT_MS", "10000")))
+    mongo_write_concern: str = field(default_factory=lambda: os.getenv("MONGO_WRITE_CONCERN", "1"))
+    compact_documents: bool = field(default_factory=lambda: os.getenv("COMPACT_DOCUMENTS", "1") != "0")
+    compress_text: bool = field(default_factory=lambda: os.getenv("COMPRESS_TEXT", "0") != "0")
+    raster_cache_dir: str = field(default_factory=lambda: os.getenv("RASTER_CACHE_DIR", ""))
+    raster_cache_mb: int = field(default_factory=lambda: int(os.getenv("RASTER_CACHE_MB", "2048")))
+    word_boxes: bool = field(default_factory=lambda: os.getenv("WORD_BOXES", "1") != "0")
+    remove_watermarks: bool = field(default_factory=lambda: os.getenv("REMOVE_WATERMARKS", "0") == "1")
+
     mongo_connection_string: str = field(init=False)
 
     def __post_init__(self):
@@ -55,7 +70,8 @@ class Config:  # pylint: disable=too-many-instance-attributes
                 f"mongodb://{self.mongo_user}:{self.mongo_password}@{self.mongo_server}:{self.mongo_port}/"
             )
         else:
-            self.mongo_uri = None
+            # no credentials: connect without authentication, to a local server unless one is configured
+            self.mongo_connection_string = f"mongodb://{self.mongo_server or 'localhost'}:{self.mongo_port or '27017'}/"
 
 
 # Create an instance of the Config class
@@ -0,0 +1,152 @@
+"""
+Compact storage schema for processed documents.
+
+A processed document keeps every image text three times: on the image, in its page's combined_text and in
+merged_text.  It also repeats the same image metadata (format, mode, info, script_language) on every image.  The
+compact schema stores merged_text once, plus the length of each combined_text segment so pages and image texts
+are sliced back out of it.  Repeated image metadata is interned in a per document table that images refer to by
+position.
+
+The text is kept uncompressed under "text" by default, where the mongo text index and queries see it.  Large texts
+are only zlib compressed, under "text_z", when encode is asked to, which takes them out of reach of mongo search.
+
+Compact documents carry their schema version under "_schema".  decode turns them back into the processed
+document and passes documents without one through unchanged, so readers see the same documents whichever way
+they were written.
+"""
+
+import zlib
+from typing import Any
+
+SCHEMA_VERSION = 1
+# size from which texts are compressed when compression is asked for
+COMPRESS_OVER = 2048
+
+# image fields whose values repeat across the images of a document
+INTERNED_FIELDS = ("format", "mode", "info", "script_language", "filename")
+
+# fields of a compact document that replace merged_text and pages_data
+COMPACT_FIELDS = ("_schema", "text", "text_z", "pages", "meta", "merged_text")
+
+
+def _merge(pages: list[dict[str, Any]]) -> str:
+    return "".join(" ".join(page.get("combined_text", [])) for page in pages)
+
+
+def _intern(image: dict[str, Any], table: list[dict[str, Any]]) -> dict[str, Any]:
+    meta = {k: image[k] for k in INTERNED_FIELDS if k in image}
+    if not meta:
+        return dict(image)
+    try:
+        position = table.index(meta)
+    except ValueError:
+        position = len(table)
+        table.append(meta)
+    compact = {k: v for k, v in image.items() if k not in INTERNED_FIELDS}
+    compact["_m"] = position
+    return compact
+
+
+def encode(document: dict[str, Any], compress_over: int | None = None) -> dict[str, Any]:
+    """
+    The compact form of a processed document.  Documents without pages_data, such as duplicate links, are
+    returned unchanged.
+
+    Args:
+        document: a processed document as returned by the processors.
+        compress_over: texts of at least this many characters are stored compressed.  None never compresses.
+    """
+    if "pages_data" not in document:
+        return document
+    pages_data = document["pages_data"]
+    text = _merge(pages_data)
+    table: list[dict[str, Any]] = []
+    pages = []
+    for page in pages_data:
+        segments = page.get("combined_text", [])
+        compact = {k: v for k, v in page.items() if k not in ("combined_text", "images")}
+        compact["spans"] = [len(s) for s in segments]
+        images = []
+        for number, image in enumerate(page.get("images", [])):
+            image = _intern(image, table)
+            # the image text is the segment at its position unless the processor said otherwise
+            if number < len(segments) and image.get("text") == segments[number]:
+                del image["text"]
+            elif "text" not in image:
+                image["text"] = None
+            images.append(image)
+        compact["images"] = images
+        pages.append(compact)
+
+    encoded = {k: v for k, v in document.items() if k not in ("merged_text", "pages_data")}
+    encoded["_schema"] = SCHEMA_VERSION
+    if compress_over is not None and len(text) >= compress_over:
+        encoded["text_z"] = zlib.compress(text.encode("utf8"))
+    else:
+        encoded["text"] = text
+    if document.get("merged_text", text) != text:
+        encoded["merged_text"] = document["merged_text"]
+    encoded["pages"] = pages
+    encoded["meta"] = table
+    return encoded
+
+
+def _decode_v1(document: dict[str, Any]) -> dict[str, Any]:
+    if "text_z" in document:
+        text = zlib.decompress(document["text_z"]).decode("utf8")
+    else:
+        text = document.get("text", "")
+    table = document.get("meta", [])
+    pages_data = []
+    offset = 0
+    for page in document.get("pages", []):
+        segments = []
+        for length in page.get("spans", []):
+            segments.append(text[offset : offset + length])
+            offset += length + 1
+        # segments of a page are joined by a space, pages by nothing
+        offset -= 1 if segments else 0
+        images = []
+        for number, compact in enumerate(page.get("images", [])):
+            image = {k: v for k, v in compact.items() if k != "_m"}
+            if "_m" in compact:
+                image.update(table[compact["_m"]])
+            if "text" not in compact:
+                image["text"] = segments[number]
+            elif compact["text"] is None:
+                del image["text"]
+            images.append(image)
+        restored = {k: v for k, v in page.items() if k not in ("spans", "images")}
+        pages_data.append({"images": images, "combined_text": segments, **restored})
+
+    decoded = {k: v for k, v in document.items() if k not in COMPACT_FIELDS}
+    decoded["merged_text"] = document.get("merged_text", text)
+    decoded["pages_data"] = pages_data
+    return decoded
+
+
+DECODERS = {1: _decode_v1}
+
+
+def decode(document: dict[str, Any]) -> dict[str, Any]:
+    """
+    The processed document of a compact document.  Other documents are returned unchanged.
+    """
+    version = document.get("_schema")
+    if version is None:
+        return document
+    if version not in DECODERS:
+        raise ValueError(f"unknown document schema {version} on {document.get('_id')}")
+    return DECODERS[version](document)
+
+
+def projection(fields: dict[str, Any] | None) -> dict[str, Any] | None:
+    """
+    A mongo projection that also fetches the compact fields a compact document needs to decode the requested
+    merged_text or pages_data fields.
+    """
+    if not fields or not any(v for v in fields.values() if v == 1):
+        return fields
+    if not any(k.split(".")[0] in ("merged_text", "pages_data") for k in fields):
+        return fields
+    return {**fields, **{k: 1 for k in COMPACT_FIELDS}}
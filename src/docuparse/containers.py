@@ -1,24 +1,56 @@
 """
-Container objects.  Right now this is only a directory.
+Container objects.  A container is a source of documents: a directory of files or a zip/tar archive.
+Documents are processed serially or on a pool of worker processes and written by the registered writers.
 """
 
+import datetime
+import hashlib
 import pathlib
+import tarfile
+import time
+import zipfile
+from concurrent.futures import FIRST_COMPLETED, Future, ProcessPoolExecutor, wait
 from dataclasses import dataclass, field
+from typing import Any, Iterable, Iterator
 
-from docuparse import get_logger
-from docuparse.ocr import OCREngine
+from docuparse import config, get_logger
+from docuparse.fingerprint import Fingerprint, FingerprintIndex, Match, fingerprint
+from docuparse.memory import MB, peak_rss
+from docuparse.ocr import CPUBudget, CPULayout, OCRPool
 from docuparse.processors import FileProcessor, ImageProcessor, PDFProcessor
-from docuparse.store import DataWriter, MongoDBDataWriter
+from docuparse.rastercache import RasterCache
+from docuparse.report import RunReport
+from docuparse.scheduling import (
+    HEADER_BYTES,
+    CostEstimate,
+    CostModel,
+    estimate,
+    estimate_member,
+    largest_first,
+    makespan,
+)
+from docuparse.store import DataWriter, MongoDBDataWriter, clients
 
 logger = get_logger()
 # from docuparse.error_handlers import handle_file_exceptions
 
-ocr = OCREngine()
+# Shared by pdf images and image files
+ocr = OCRPool(workers=config.ocr_workers, timeout=config.ocr_timeout, memory_limit=config.memory_limit_mb * MB)
+image_processor = ImageProcessor(ocr, document_timeout=config.document_timeout, word_boxes=config.word_boxes)
 DEFAULT_PROCESSORS: dict[str, FileProcessor | ImageProcessor] = {
-    ".pdf": PDFProcessor(ocr),  # Instantiate PDFProcessor
-    ".png": ImageProcessor(),  # Instantiate ImageProcessor
-    ".jpeg": ImageProcessor(),  # Instantiate ImageProcessor
-    ".jpg": ImageProcessor(),  # Instantiate ImageProcessor
+    ".pdf": PDFProcessor(
+        ocr,
+        document_timeout=config.document_timeout,
+        raster_cache=(
+            RasterCache(config.raster_cache_dir, config.raster_cache_mb * MB) if config.raster_cache_dir else None
+        ),
+        word_boxes=config.word_boxes,
+    ),
+    ".png": image_processor,
+    ".jpeg": image_processor,
+    ".jpg": image_processor,
+    ".tif": image_processor,
+    ".tiff": image_processor,
     # Add other file processors here
 }
 
@@ -26,31 +58,115 @@ DEFAULT_WRITERS = [
     MongoDBDataWriter(),
 ]
 
+ARCHIVE_SUFFIXES = (".zip", ".tar", ".tgz", ".tar.gz", ".tar.bz2", ".tar.xz")
 
-@dataclass()
-class FileDataDirectory:  # pylint: disable=too-few-public-methods
+# Processors of a worker process, set once by _init_worker so models and engines stay warm between documents.
+_worker_processors: dict[str, FileProcessor | ImageProcessor] = {}
+
+
+@dataclass(frozen=True)
+class ArchiveMember:
+    """
+    A zip member that a worker process reads itself.
     """
-    Represents a directory containing files to be processed.
 
-    Args:
-        directory (str): The path to the directory.
-        db_uri (str): The URI of the database.
+    archive: str
+    name: str
+
+    def read(self) -> bytes:
+        """
+        Read the member contents without extracting to disk.
+        """
+        with zipfile.ZipFile(self.archive) as archive:
+            return archive.read(self.name)
+
+
+def is_archive(path: str | pathlib.Path) -> bool:
+    """
+    True when path names a zip or tar archive.
+    """
+    return str(path).lower().endswith(ARCHIVE_SUFFIXES)
+
+
+def _init_worker(processors: dict[str, FileProcessor | ImageProcessor], layout: CPULayout) -> None:
+    layout.apply()
+    _worker_processors.clear()
+    _worker_processors.update(processors)
+
+
+def document_fields(doc_id: str, result: dict[str, Any], content_hash: str) -> dict[str, Any]:
+    """
+    Summary fields stored with every processed document, the fields the store indexes: page count, the
+    directory the document came from, the sha256 of its bytes, when it was processed and the mean ocr quality
+    score of its images, None without images.
+    """
+    scores = [
+        image["ocr_quality"]["quality_score"]
+        for page in result.get("pages_data", [])
+        for image in page.get("images", [])
+        if "quality_score" in image.get("ocr_quality", {})
+    ]
+    return {
+        "page_count": len(result.get("pages_data", [])),
+        "source_directory": str(pathlib.PurePosixPath(doc_id.replace("\\", "/")).parent),
+        "content_hash": content_hash,
+        "processed_at": datetime.datetime.now(datetime.timezone.utc),
+        "quality": round(sum(scores) / len(scores), 4) if scores else None,
+    }
+
+
+def _process_source(
+    doc_id: str,
+    source: pathlib.Path | ArchiveMember | bytes,
+    processors: dict[str, FileProcessor | ImageProcessor] | None = None,
+) -> tuple[str, dict[str, Any]]:
+    """
+    Process one document.  Runs in a worker process unless processors are given.
+    """
+    processors = processors if processors is not None else _worker_processors
+    processor = processors[pathlib.PurePosixPath(doc_id).suffix.lower()]
+    start = time.perf_counter()
+    if isinstance(source, pathlib.Path):
+        result = processor.process_file(file_path=source)
+        with open(source, "rb") as f:
+            content_hash = hashlib.file_digest(f, "sha256").hexdigest()
+    else:
+        data = source.read() if isinstance(source, ArchiveMember) else source
+        result = processor.process_bytes(data, doc_id)
+        content_hash = hashlib.sha256(data).hexdigest()
+    result["processing_seconds"] = round(time.perf_counter() - start, 3)
+    result.update(document_fields(doc_id, result, content_hash))
+    return doc_id, result
+
+
+@dataclass()
+class DataContainer:  # pylint: disable=too-few-public-methods
+    """
+    Base for document sources.  Subclasses provide _sources, the documents they hold.
 
     Attributes:
-        directory (Path): The path to the directory.
         processors (dict): A dictionary mapping file extensions to processor objects.
-
+        writers (list): Writers that receive the processed documents.
+        workers (int): Number of worker processes.  1 processes in the calling process, 0 picks the number from
+            the cpu budget.
+        cpus (int): Cpu budget shared by workers and tesseract threads.  0 uses every available cpu.
+        cost_model (CostModel): Estimates the seconds of work per document for scheduling.
+        memory_limit_mb (int): Megabytes of decoded images allowed in flight over the whole run, split evenly
+            between the worker processes.  0 for no bound.
+        fingerprints (FingerprintIndex): When set, documents that duplicate an indexed document are linked to it
+            instead of being processed.
     """
 
-    directory: str | pathlib.Path
-    processors: dict[str, FileProcessor | ImageProcessor] = field(default_factory=dict)
-    writers: list[DataWriter] = field(default_factory=list)
-    data: list[str] = field(default_factory=list)
+    processors: dict[str, FileProcessor | ImageProcessor] = field(default_factory=dict, kw_only=True)
+    writers: list[DataWriter] = field(default_factory=list, kw_only=True)
+    workers: int = field(default=1, kw_only=True)
+    cpus: int = field(default=0, kw_only=True)
+    cost_model: CostModel = field(default_factory=CostModel, kw_only=True)
+    memory_limit_mb: int = field(default_factory=lambda: config.memory_limit_mb, kw_only=True)
+    fingerprints: FingerprintIndex | None = field(default=None, kw_only=True)
+    _unindexed: dict[str, Fingerprint] = field(default_factory=dict, init=False, repr=False)
 
     def __post_init__(self):
-        if isinstance(self.directory, str):
-            self.directory = pathlib.Path(self.directory)
-
         for k, v in DEFAULT_PROCESSORS.items():
             self.register_processor(extension=k, processor=v)
 
@@ -73,52 +189,362 @@ class FileDataDirectory:  # pylint: disable=too-few-public-methods
         """
         self.writers.append(writer)
 
-    def _files(self, force: bool) -> list[tuple[pathlib.Path, FileProcessor, DataWriter]]:
+    def _names(self) -> list[str]:
         """
-        returns a list of strings of files to operate on.
+        Document ids held by the container.
         """
+        raise NotImplementedError
 
-        files_with_processor_and_writer = []
+    def _sources(
+        self, names: list[str], parallel: bool = False
+    ) -> Iterator[tuple[str, pathlib.Path | ArchiveMember | bytes]]:
+        """
+        Yield (document id, source) for names, in order.  parallel is set when the sources are sent to worker
+        processes, so sources that workers can read themselves are passed by reference.
+        """
+        raise NotImplementedError
 
-        if not self.directory.is_dir():  # type: ignore
-            raise ValueError(f"The path {self.directory} is not a valid directory.")
+    def _processor(self, name: str) -> FileProcessor | ImageProcessor | bool:
+        return self.processors.get(pathlib.PurePosixPath(name).suffix.lower(), False)
+
+    def _files(self, force: bool) -> list[tuple[str, FileProcessor, DataWriter, bool]]:
+        """
+        returns a list of (document id, processor, writer, exists) to operate on.
+        """
+
+        files_with_processor_and_writer = []
+        names = self._names()
 
         for writer in self.writers:
-            for file_path in self.directory.iterdir():  # type: ignore
+            for name in names:
                 files_with_processor_and_writer.append(
                     (
-                        file_path,
-                        self.processors.get(file_path.suffix.lower(), False),
+                        name,
+                        self._processor(name),
                         writer,
-                        writer.exists(str(file_path)),
+                        writer.exists(name),
                     )
                 )
 
         if force:  # return all that have a processor.
             return [i for i in files_with_processor_and_writer if i[1]]  # type: ignore
-        return [i for i in files_with_processor_and_writer if i[1] and not i[2]]  # type: ignore
+        return [i for i in files_with_processor_and_writer if i[1] and not i[3]]  # type: ignore
+
+    def set_time_budget(self, image_seconds: float | None = None, document_seconds: float | None = None) -> None:
+        """
+        Bound the seconds each image may spend in tesseract and each document may take.  0 removes a bound,
+        None leaves it unchanged.
+        """
+        for processor in self.processors.values():
+            if image_seconds is not None and hasattr(processor, "ocr_engine"):
+                processor.ocr_engine.timeout = image_seconds
+            if document_seconds is not None and hasattr(processor, "document_timeout"):
+                processor.document_timeout = document_seconds
+
+    def set_raster_cache(self, cache: RasterCache | None) -> None:
+        """
+        Keep decoded pdf images in cache, or stop caching them with None.
+        """
+        for processor in self.processors.values():
+            if hasattr(processor, "raster_cache"):
+                processor.raster_cache = cache
+
+    def _share_memory(self, workers: int) -> None:
+        """
+        Give each worker's ocr pools an equal share of the run memory limit.
+        """
+        for processor in self.processors.values():
+            if hasattr(processor, "ocr_engine"):
+                processor.ocr_engine.memory.limit = self.memory_limit_mb * MB // max(1, workers)
+
+    def layout(self, documents: int | None = None) -> CPULayout:
+        """
+        Split the cpu budget between worker processes, ocr threads and tesseract threads.
+        """
+        ocr_threads = max(
+            (getattr(getattr(p, "ocr_engine", None), "workers", 1) for p in self.processors.values()), default=1
+        )
+        budget = CPUBudget(self.cpus or None, ocr_threads=ocr_threads)
+        return budget.auto(documents) if self.workers < 1 else budget.layout(self.workers)
+
+    def _results(self, names: list[str], layout: CPULayout) -> Iterator[tuple[str, dict[str, Any]]]:
+        """
+        Process names and yield (document id, result) as documents finish.
+        """
+        if layout.workers <= 1:
+            with layout.limit():
+                for doc_id, source in self._sources(names):
+                    yield _process_source(doc_id, source, self.processors)
+            return
+
+        with ProcessPoolExecutor(
+            max_workers=layout.workers, initializer=_init_worker, initargs=(self.processors, layout)
+        ) as executor:
+            yield from _bounded(
+                (
+                    executor.submit(_process_source, doc_id, source)
+                    for doc_id, source in self._sources(names, parallel=True)
+                ),
+                limit=2 * layout.workers,
+            )
+
+    def warm_pool(self, layout: CPULayout) -> ProcessPoolExecutor:
+        """
+        A pool of layout.workers processes with the container processors loaded, for documents submitted with
+        submit.  The caller shuts it down.
+        """
+        self._share_memory(layout.workers)
+        return ProcessPoolExecutor(
+            max_workers=layout.workers, initializer=_init_worker, initargs=(self.processors, layout)
+        )
+
+    @staticmethod
+    def submit(executor: ProcessPoolExecutor, doc_id: str, source: pathlib.Path | bytes) -> Future:
+        """
+        Process one document on a pool from warm_pool.  The future's result is (document id, result).
+        """
+        return executor.submit(_process_source, doc_id, source)
 
-    def process_files(self, force: bool = False, dry_run: bool = False) -> None:
+    def process_document(self, doc_id: str, source: pathlib.Path | bytes) -> tuple[str, dict[str, Any]]:
         """
-        Process all files in the specified directory using the registered processors.
+        Process one document in this process.
+        """
+        return _process_source(doc_id, source, self.processors)
 
-        Raises:
-            ValueError: If the specified directory is not a valid directory.
+    def estimates(self, names: list[str]) -> list[CostEstimate]:
+        """
+        Cost estimates for names, read from document structure without rendering.
+        """
+        return [estimate(doc_id, source, self.cost_model) for doc_id, source in self._sources(names)]
+
+    def duplicates(self, names: list[str], dry_run: bool = False) -> list[Match]:
+        """
+        Fingerprint names in order and return those that duplicate an indexed document or an earlier name.
+        Unless dry_run, the fingerprints of the rest are kept for _index, which adds them once they are written, so
+        a document that fails to process is not left in the index as the original of later copies.
+        """
+        if self.fingerprints is None:
+            return []
+        matches = []
+        seen: dict[str, str] = {}
+        for doc_id, source in self._sources(names):
+            fp = fingerprint(doc_id, source)
+            match = self.fingerprints.match(fp)
+            if match is None and fp.sha256 in seen:
+                match = Match(doc_id, seen[fp.sha256], 1.0, True)
+            if match:
+                logger.info(f"{doc_id} duplicates {match.duplicate_of} ({match.similarity:.2f}), skipping ocr")
+                matches.append(match)
+                continue
+            seen[fp.sha256] = doc_id
+            if not dry_run:
+                self._unindexed[doc_id] = fp
+        return matches
+
+    def _index(self, doc_id: str) -> None:
+        """
+        Add the fingerprint duplicates took of doc_id to the index, now that doc_id is written.
+        """
+        fp = self._unindexed.pop(doc_id, None)
+        if fp is not None and self.fingerprints is not None:
+            self.fingerprints.add(fp)
+
+    def process_files(self, force: bool = False, dry_run: bool = False) -> RunReport:
+        """
+        Process all documents in the container using the registered processors.
+        Each document is processed once, largest estimated cost first, and written to every writer that needs it.
+        Duplicates of already processed documents are written as links to them.
         """
         files = self._files(force)
-        logger.info(f"Beginning docuparse run for {self.directory}.")
+        logger.info(f"Beginning docuparse run for {self}.")
+
+        targets: dict[str, list[DataWriter]] = {}
+        for name, _, writer, _ in files:
+            targets.setdefault(name, []).append(writer)
+
+        duplicates = self.duplicates(list(targets), dry_run)
+        links = {m.doc_id: targets.pop(m.doc_id) for m in duplicates}
+
+        plan = largest_first(self.estimates(list(targets)))
+        layout = self.layout(len(plan))
+        report = RunReport(
+            source=str(self),
+            workers=layout.workers,
+            layout=layout.describe(),
+            documents=len(plan),
+            estimated_cost=sum(e.cost for e in plan),
+            predicted_seconds=makespan(plan, layout.workers),
+            dry_run=dry_run,
+            largest=[(e.doc_id, e.cost) for e in plan[:3]],
+            memory_limit_mb=self.memory_limit_mb,
+            duplicates=[(m.doc_id, m.duplicate_of, m.similarity) for m in duplicates],
+        )
         if dry_run:
-            for i in files:
-                logger.info(f"would execute for {str(i[0])}")
-            return None
+            for e in plan:
+                logger.info(f"would execute for {e.doc_id} (estimated {e.cost:.1f}s)")
+            return report
+
+        self._share_memory(layout.workers)
+        start = time.perf_counter()
+        stored = set()
+        for doc_id, result in self._results([e.doc_id for e in plan], layout):
+            report.add_document(doc_id, result)
+            written = [writer.write_data({doc_id: result}, force=force) for writer in targets[doc_id]]
+            report.written += any(written)
+            if any(written):
+                stored.add(doc_id)
+                self._index(doc_id)
+        self._unindexed.clear()
+
+        # links to documents of this run are only written once the document itself is
+        for m in duplicates:
+            if m.duplicate_of in targets and m.duplicate_of not in stored:
+                logger.warning(f"Not linking {m.doc_id}, {m.duplicate_of} was not written.")
+                continue
+            written = [writer.write_data({m.doc_id: m.as_link()}, force=force) for writer in links[m.doc_id]]
+            report.written += any(written)
+        report.elapsed_seconds = time.perf_counter() - start
+        report.record_peak_memory(*peak_rss())
+        report.mongo_pools = clients.stats()
+
+        return report
+
+
+def _bounded(futures: Iterable[Future], limit: int) -> Iterator[Any]:
+    """
+    Submit lazily from futures keeping at most limit in flight, yielding results as they complete.
+    """
+    pending: set[Future] = set()
+    for future in futures:
+        pending.add(future)
+        if len(pending) >= limit:
+            done, pending = wait(pending, return_when=FIRST_COMPLETED)
+            for i in done:
+                yield i.result()
+    for i in wait(pending).done:
+        yield i.result()
+
+
+@dataclass()
+class FileDataDirectory(DataContainer):  # pylint: disable=too-few-public-methods
+    """
+    Represents a directory containing files to be processed.
+
+    Args:
+        directory (str): The path to the directory.
+        db_uri (str): The URI of the database.
+
+    Attributes:
+        directory (Path): The path to the directory.
+        processors (dict): A dictionary mapping file extensions to processor objects.
 
+    """
+
+    directory: str | pathlib.Path
+    data: list[str] = field(default_factory=list)
+
+    def __post_init__(self):
+        if isinstance(self.directory, str):
+            self.directory = pathlib.Path(self.directory)
+        super().__post_init__()
+
+    def __str__(self) -> str:
+        return str(self.directory)
+
+    def _names(self) -> list[str]:
         if not self.directory.is_dir():  # type: ignore
             raise ValueError(f"The path {self.directory} is not a valid directory.")
+        return [str(file_path) for file_path in self.directory.iterdir()]  # type: ignore
+
+    def _sources(
+        self, names: list[str], parallel: bool = False
+    ) -> Iterator[tuple[str, pathlib.Path | ArchiveMember | bytes]]:
+        for name in names:
+            yield name, pathlib.Path(name)
+
+
+@dataclass()
+class ArchiveDataSource(DataContainer):  # pylint: disable=too-few-public-methods
+    """
+    A zip or tar archive of documents, processed without extracting to disk.
+
+    Member paths are the document ids.  Zip members are read by the worker processes in parallel.
+    Tar members can only be read in order, so they are streamed by the parent and handed to the workers in
+    archive order rather than largest first.
+
+    Args:
+        archive (str): The path to the archive.
+    """
+
+    archive: str | pathlib.Path
+
+    def __post_init__(self):
+        if isinstance(self.archive, str):
+            self.archive = pathlib.Path(self.archive)
+        super().__post_init__()
+
+    def __str__(self) -> str:
+        return str(self.archive)
+
+    def _is_zip(self) -> bool:
+        return zipfile.is_zipfile(self.archive)
+
+    def _names(self) -> list[str]:
+        if not self.archive.is_file():  # type: ignore
+            raise ValueError(f"The path {self.archive} is not a valid archive.")
+        if self._is_zip():
+            with zipfile.ZipFile(self.archive) as archive:
+                return [i.filename for i in archive.infolist() if not i.is_dir()]
+        with tarfile.open(self.archive, "r:*") as archive:
+            return [i.name for i in archive.getmembers() if i.isfile()]
+
+    def estimates(self, names: list[str]) -> list[CostEstimate]:
+        """
+        Cost estimates for names from the member sizes in the archive headers and the first bytes of images.
+        """
+        return [estimate_member(doc_id, size, head, self.cost_model) for doc_id, size, head in self._heads(names)]
+
+    def _heads(self, names: list[str]) -> Iterator[tuple[str, int, bytes]]:
+        """
+        Yield (document id, size, first bytes) for names, the first bytes only for images.
+        """
+
+        def image(name: str) -> bool:
+            return pathlib.PurePosixPath(name).suffix.lower() != ".pdf"
+
+        if self._is_zip():
+            with zipfile.ZipFile(self.archive) as archive:
+                for name in names:
+                    info = archive.getinfo(name)
+                    if not image(name):
+                        yield name, info.file_size, b""
+                        continue
+                    with archive.open(info) as member:
+                        yield name, info.file_size, member.read(HEADER_BYTES)
+            return
+
+        wanted = set(names)
+        with tarfile.open(self.archive, "r|*") as archive:
+            for info in archive:
+                if info.name in wanted:
+                    reader = archive.extractfile(info) if image(info.name) else None
+                    yield info.name, info.size, reader.read(HEADER_BYTES) if reader else b""
 
-        for f in files:
-            writer: DataWriter = f[2]
-            file: pathlib.Path = f[0]
-            processor: FileProcessor = f[1]
-            writer.write_data({str(file): processor.process_file(file_path=file)}, force=force)
+    def _sources(
+        self, names: list[str], parallel: bool = False
+    ) -> Iterator[tuple[str, pathlib.Path | ArchiveMember | bytes]]:
+        wanted = set(names)
+        if self._is_zip():
+            if parallel:
+                for name in names:
+                    yield name, ArchiveMember(str(self.archive), name)
+                return
+            with zipfile.ZipFile(self.archive) as archive:
+                for name in names:
+                    yield name, archive.read(name)
+            return
 
-        return None
+        with tarfile.open(self.archive, "r|*") as archive:
+            for member in archive:
+                if member.name in wanted and (reader := archive.extractfile(member)):
+                    yield member.name, reader.read()
@@ -0,0 +1,150 @@
+"""
+Binary persistence of annotated spacy docs.
+
+Docs are appended to DocBin shards of a fixed number of pages.  Each shard has a json manifest listing the
+(document id, page, content hash, pipeline) of its docs in order, so the store index is built from the manifests
+without reading any doc.  A page whose text hash is unchanged and that was annotated by the same pipeline can be
+loaded instead of re-running the pipeline, and whole shards can be streamed back lazily for queries and
+retraining.
+"""
+
+import functools
+import hashlib
+import json
+import pathlib
+from dataclasses import dataclass
+from typing import Iterator
+
+from spacy.tokens import Doc, DocBin
+from spacy.vocab import Vocab
+
+from docuparse import get_logger
+
+logger = get_logger()
+
+SHARD_SIZE = 1000
+
+
+def text_hash(text: str) -> str:
+    """
+    Content hash of a page text.
+    """
+    return hashlib.sha256(text.encode("utf8")).hexdigest()
+
+
+@dataclass(frozen=True)
+class DocKey:
+    """
+    Where a stored doc lives.  position is the index of the doc within its shard, pipeline names the pipeline
+    that annotated it, "" for docs stored without one.
+    """
+
+    doc_id: str
+    page: int
+    sha256: str
+    shard: int
+    position: int
+    pipeline: str = ""
+
+
+class DocBinStore:
+    """
+    A directory of DocBin shards.
+
+    Args:
+        directory: where shards are read and written.  Created if missing.
+        shard_size: docs per shard.
+        cached_shards: decoded shards kept in memory for random access.
+    """
+
+    def __init__(self, directory: str | pathlib.Path, shard_size: int = SHARD_SIZE, cached_shards: int = 2):
+        self.directory = pathlib.Path(directory)
+        self.directory.mkdir(parents=True, exist_ok=True)
+        self.shard_size = shard_size
+        self.keys: dict[tuple[str, int], DocKey] = {}
+        self._shards = 0
+        self._pending = DocBin(store_user_data=False)
+        self._pending_keys: list[tuple[str, int, str, str]] = []
+        self._cached_docs = functools.lru_cache(maxsize=cached_shards)(self._read_docs)
+        for manifest in sorted(self.directory.glob("shard-*.json")):
+            shard = int(manifest.stem.split("-")[1])
+            # later shards hold the newer analysis of a page; manifests written before pipelines were recorded
+            # have three fields
+            for position, entry in enumerate(json.loads(manifest.read_text(encoding="utf8"))):
+                self.keys[(entry[0], entry[1])] = DocKey(*entry[:3], shard, position, *entry[3:])
+            self._shards = max(self._shards, shard + 1)
+
+    def _path(self, shard: int) -> pathlib.Path:
+        return self.directory / f"shard-{shard:05d}.spacy"
+
+    def _read_shard(self, shard: int) -> DocBin:
+        return DocBin().from_disk(self._path(shard))
+
+    def _read_docs(self, shard: int, vocab: Vocab) -> list[Doc]:
+        return list(self._read_shard(shard).get_docs(vocab))
+
+    def has(self, doc_id: str, page: int, sha256: str | None = None, pipeline: str | None = None) -> bool:
+        """
+        True when the page is stored, and when sha256 or pipeline are given, stored for the same text and by the
+        same pipeline.
+        """
+        key = self.keys.get((doc_id, page))
+        return (
+            key is not None
+            and (sha256 is None or key.sha256 == sha256)
+            and (pipeline is None or key.pipeline == pipeline)
+        )
+
+    def add(self, doc: Doc, doc_id: str, page: int = 0, sha256: str | None = None, pipeline: str = "") -> None:
+        """
+        Queue doc, annotated by pipeline, for the current shard, which is written once it holds shard_size docs.
+        """
+        self._pending.add(doc)
+        self._pending_keys.append((doc_id, page, sha256 or text_hash(doc.text), pipeline))
+        if len(self._pending_keys) >= self.shard_size:
+            self.flush()
+
+    def flush(self) -> None:
+        """
+        Write the queued docs as a new shard.
+        """
+        if not self._pending_keys:
+            return
+        shard = self._shards
+        self._pending.to_disk(self._path(shard))
+        manifest = self.directory / f"shard-{shard:05d}.json"
+        manifest.write_text(json.dumps(self._pending_keys), encoding="utf8")
+        for position, (doc_id, page, sha256, pipeline) in enumerate(self._pending_keys):
+            self.keys[(doc_id, page)] = DocKey(doc_id, page, sha256, shard, position, pipeline)
+        logger.info(f"wrote {len(self._pending_keys)} docs to {self._path(shard)}")
+        self._shards += 1
+        self._pending = DocBin(store_user_data=False)
+        self._pending_keys = []
+
+    def close(self) -> None:
+        """
+        Write any queued docs.
+        """
+        self.flush()
+
+    def load(self, doc_id: str, page: int, vocab: Vocab) -> Doc | None:
+        """
+        The stored doc of a page, or None.  The docs of recently used shards stay decoded for the next lookups.
+        """
+        key = self.keys.get((doc_id, page))
+        if key is None:
+            return None
+        return self._cached_docs(key.shard, vocab)[key.position]
+
+    def iter_docs(self, vocab: Vocab, shards: list[int] | None = None) -> Iterator[tuple[DocKey, Doc]]:
+        """
+        Stream (key, doc) for the current docs, one shard in memory at a time.  Docs replaced by a later shard are
+        skipped.
+        """
+        for shard in range(self._shards) if shards is None else shards:
+            manifest = json.loads((self.directory / f"shard-{shard:05d}.json").read_text(encoding="utf8"))
+            for position, doc in enumerate(self._read_shard(shard).get_docs(vocab)):
+                doc_id, page = manifest[position][:2]
+                key = self.keys.get((doc_id, page))
+                if key and key.shard == shard and key.position == position:
+                    yield key, doc
@@ -0,0 +1,172 @@
+"""
+Plat entity extraction.
+
+Pulls the fields a plat is looked up by out of page text: subdivision names from a gazetteer, lot and block
+numbers, sections, bearings, recording instrument numbers and surveyor or engineer registrations.
+
+Every regex family is compiled into one alternation of named groups, so a page is scanned once for all of them,
+and the gazetteer is compiled into a spacy PhraseMatcher that matches every name in one pass over the page tokens,
+however many names there are.  extract_one_by_one runs the same patterns separately and is kept as the baseline
+for benchmark.
+"""
+
+import re
+import time
+from dataclasses import asdict, dataclass
+from typing import Any, Iterable
+
+import spacy
+from spacy.matcher import PhraseMatcher
+
+from docuparse import HOA_PROP_NAME, get_logger
+from docuparse.search import page_texts
+
+logger = get_logger()
+
+SUBDIVISION = "subdivision"
+
+# Ocr reads the degree sign as *, o or a space and the minute and second marks as any quote.
+PATTERNS: dict[str, str] = {
+    "lot": r"\bLOTS?\s+\d+[A-Z]?(?:\s*(?:,|&|AND|-|THRU|THROUGH)\s*\d+[A-Z]?)*\b",
+    "block": r"\bBLOCK\s+(?:\d+|[A-Z]{1,2})\b",
+    "section": r"\bSECTION\s+(?:\d+|[IVX]+)\b",
+    "bearing": r"\b[NS]\s?\d{1,2}\s?[°*o ]\s?\d{1,2}\s?['’′]\s?(?:\d{1,2}(?:\.\d+)?\s?[\"”″])?\s?[EW]\b",
+    "instrument": r"\b(?:DOC(?:UMENT)?|INST(?:RUMENT)?)\.?\s*(?:NO\.?|NUMBER|#)\s*\d{6,12}\b|\(\d{9,12}\)",
+    "registration": (
+        r"\b(?:R\.?P\.?L\.?S\.?|REGISTERED\s+PROFESSIONAL\s+LAND\s+SURVEYOR|P\.?E\.?)\s*"
+        r"(?:NO\.?|NUMBER|#)?\s*\d{3,6}\b"
+    ),
+}
+
+# identifiers within a match, for the kinds whose value is not simply the last word
+VALUES: dict[str, re.Pattern] = {
+    "lot": re.compile(r"\d+[A-Z]?"),
+    "instrument": re.compile(r"\d{6,12}"),
+    "registration": re.compile(r"\d{3,6}"),
+}
+
+
+@dataclass(frozen=True)
+class Extraction:
+    """
+    One extracted field.  value is the normalized identifier, such as "12" for "LOT 12".
+    """
+
+    kind: str
+    text: str
+    value: str
+    page: int
+    start: int
+    end: int
+
+    def as_dict(self) -> dict[str, Any]:
+        """
+        The extraction as stored with the document.
+        """
+        return asdict(self)
+
+
+def normalize(kind: str, text: str) -> str:
+    """
+    Normalized value of a match: the upper cased match with ocr spacing squeezed for bearings, the identifiers of
+    lots, instruments and registrations, comma separated, and the last word of the other kinds.
+    """
+    text = text.upper()
+    if kind == "bearing":
+        return re.sub(r"\s+", "", text)
+    if kind in VALUES:
+        return ",".join(VALUES[kind].findall(text)) or text
+    return text.split()[-1] if text.split() else text
+
+
+class ExtractionEngine:
+    """
+    Single pass extraction of plat fields.
+
+    Args:
+        gazetteer: subdivision names to find, matched case insensitively on token boundaries.
+        patterns: regex family name -> pattern.  Matched case insensitively.
+    """
+
+    def __init__(self, gazetteer: Iterable[str] = (HOA_PROP_NAME,), patterns: dict[str, str] | None = None):
+        self.patterns = dict(PATTERNS if patterns is None else patterns)
+        self.names = sorted(set(gazetteer))
+        self.regex = re.compile("|".join(f"(?P<{kind}>{p})" for kind, p in self.patterns.items()), re.IGNORECASE)
+        self.nlp = spacy.blank("en")
+        self.matcher = PhraseMatcher(self.nlp.vocab, attr="LOWER")
+        self._canonical: dict[str, str] = {}
+        for name in self.names:
+            self._canonical[name.lower()] = name
+        self.matcher.add(SUBDIVISION, list(self.nlp.tokenizer.pipe(self.names)))
+        logger.info(f"compiled {len(self.patterns)} pattern families and {len(self.names)} gazetteer names")
+
+    @classmethod
+    def from_file(cls, path: str, **kwargs: Any) -> "ExtractionEngine":
+        """
+        Build an engine with a gazetteer of one name per line.
+        """
+        with open(path, encoding="utf8") as f:
+            return cls([line.strip() for line in f if line.strip()], **kwargs)
+
+    def extract(self, text: str, page: int = 0) -> list[Extraction]:
+        """
+        Every field in text, in order of position.
+        """
+        found = [
+            Extraction(m.lastgroup, m.group(), normalize(m.lastgroup, m.group()), page, m.start(), m.end())
+            for m in self.regex.finditer(text)
+            if m.lastgroup
+        ]
+        doc = self.nlp.make_doc(text)
+        for _, start, end in self.matcher(doc):
+            span = doc[start:end]
+            name = self._canonical.get(span.text.lower(), span.text)
+            found.append(Extraction(SUBDIVISION, span.text, name, page, span.start_char, span.end_char))
+        return sorted(found, key=lambda e: (e.start, e.kind))
+
+    def extract_document(self, document: dict[str, Any]) -> list[Extraction]:
+        """
+        Every field on every page of a processed document.
+        """
+        pages = page_texts(document) or [document.get("merged_text", "")]
+        return [e for number, text in enumerate(pages) for e in self.extract(text, number)]
+
+    def extract_one_by_one(self, text: str, page: int = 0) -> list[Extraction]:
+        """
+        The same extraction with each pattern and each name run separately.  The benchmark baseline.
+        """
+        found = []
+        for kind, pattern in self.patterns.items():
+            for m in re.finditer(pattern, text, re.IGNORECASE):
+                found.append(Extraction(kind, m.group(), normalize(kind, m.group()), page, m.start(), m.end()))
+        for name in self.names:
+            for m in re.finditer(rf"(?<!\w){re.escape(name)}(?!\w)", text, re.IGNORECASE):
+                found.append(Extraction(SUBDIVISION, m.group(), name, page, m.start(), m.end()))
+        return sorted(found, key=lambda e: (e.start, e.kind))
+
+
+def benchmark(engine: ExtractionEngine, pages: list[str], repeat: int = 1) -> dict[str, Any]:
+    """
+    Time single pass extraction against running the patterns one by one over pages, and how often they agree.
+    """
+    timings = {}
+    results = {}
+    for label, extract in (("single_pass", engine.extract), ("one_by_one", engine.extract_one_by_one)):
+        start = time.perf_counter()
+        for _ in range(repeat):
+            results[label] = [extract(text, number) for number, text in enumerate(pages)]
+        timings[label] = (time.perf_counter() - start) / repeat
+    agree = sum(
+        {(e.kind, e.start) for e in a} == {(e.kind, e.start) for e in b}
+        for a, b in zip(results["single_pass"], results["one_by_one"])
+    )
+    return {
+        "pages": len(pages),
+        "names": len(engine.names),
+        "families": len(engine.patterns),
+        "extractions": sum(len(r) for r in results["single_pass"]),
+        "single_pass_seconds": timings["single_pass"],
+        "one_by_one_seconds": timings["one_by_one"],
+        "speedup": timings["one_by_one"] / timings["single_pass"] if timings["single_pass"] else 0.0,
+        "agreement": agree / (len(pages) or 1),
+    }
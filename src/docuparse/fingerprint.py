@@ -0,0 +1,267 @@
+"""
+Document fingerprints for duplicate detection before ocr.
+
+A fingerprint holds a content hash of the file bytes, for exact copies, and a MinHash signature for near copies
+such as re-saved revisions.  The signature is taken over word shingles of the native text layer when a pdf has
+one, and otherwise over difference hashes of low resolution page rasters, so it is cheap to compute compared
+to recognizing the document.  Signatures are banded for locality sensitive hashing and the bands are stored
+with the fingerprint in a mongo collection, so candidate duplicates are found with an index lookup and the index
+persists across runs.
+"""
+
+import hashlib
+import io
+import pathlib
+import re
+from array import array
+from dataclasses import dataclass
+from typing import Any, Iterable, Iterator
+
+import pymupdf
+from PIL import Image, ImageSequence
+from pymongo.collection import Collection
+
+from docuparse import get_logger
+
+logger = get_logger()
+
+SIGNATURE_SIZE = 128
+BAND_ROWS = 8
+SHINGLE_WORDS = 5
+MIN_TEXT_WORDS = 50
+THUMBNAIL_SIDE = 128
+HASH_SIDE = 32
+_MASK = (1 << 64) - 1
+
+
+def _hash64(token: str) -> int:
+    return int.from_bytes(hashlib.blake2b(token.encode(), digest_size=8).digest(), "little")
+
+
+def minhash(tokens: Iterable[str], size: int = SIGNATURE_SIZE) -> tuple[int, ...]:
+    """
+    MinHash signature of a token set.
+
+    Uses one permutation hashing: each token is hashed once into one of size bins and the minimum per bin is kept,
+    so cost is linear in the number of tokens rather than tokens x size.  Empty bins borrow the value of the next
+    filled bin to keep signatures of small sets comparable.  Empty token sets give an empty signature.
+    """
+    signature = [_MASK] * size
+    filled = False
+    for token in tokens:
+        h = _hash64(token)
+        b = h % size
+        v = h // size
+        if v < signature[b]:
+            signature[b] = v
+            filled = True
+    if not filled:
+        return ()
+    for b in range(size):
+        if signature[b] == _MASK:
+            for offset in range(1, size):
+                donor = signature[(b + offset) % size]
+                if donor != _MASK:
+                    signature[b] = (donor + offset * 0x9E3779B97F4A7C15) & _MASK
+                    break
+    return tuple(signature)
+
+
+def similarity(a: tuple[int, ...], b: tuple[int, ...]) -> float:
+    """
+    Estimated jaccard similarity of the token sets behind two signatures.
+    """
+    if not a or len(a) != len(b):
+        return 0.0
+    return sum(x == y for x, y in zip(a, b)) / len(a)
+
+
+def bands(signature: tuple[int, ...], rows: int = BAND_ROWS) -> list[str]:
+    """
+    Locality sensitive hash keys, one per band of rows signature values.  Two documents with jaccard similarity s
+    share at least one band with probability 1 - (1 - s**rows)**(len(signature) / rows).
+    """
+    keys = []
+    for i in range(0, len(signature), rows):
+        digest = hashlib.blake2b(array("Q", signature[i : i + rows]).tobytes(), digest_size=8).hexdigest()
+        keys.append(f"{i // rows}:{digest}")
+    return keys
+
+
+def text_shingles(text: str, size: int = SHINGLE_WORDS) -> set[str]:
+    """
+    Overlapping runs of size words, lower cased.
+    """
+    words = re.findall(r"\w+", text.lower())
+    return {" ".join(words[i : i + size]) for i in range(max(1, len(words) - size + 1))} if words else set()
+
+
+def dhash_tokens(image: Image.Image, side: int = HASH_SIDE) -> set[str]:
+    """
+    Difference hash of image as tokens of 8 bits with their position, so a few changed pixels change a few tokens.
+    """
+    small = image.convert("L").resize((side + 1, side), Image.Resampling.BILINEAR)
+    pixels = small.tobytes()
+    tokens = set()
+    for row in range(side):
+        line = pixels[row * (side + 1) : (row + 1) * (side + 1)]
+        bits = 0
+        for col in range(side):
+            bits = bits << 1 | (line[col] < line[col + 1])
+        for chunk in range(side // 8):
+            tokens.add(f"{row}:{chunk}:{bits >> (8 * chunk) & 0xFF}")
+    return tokens
+
+
+def page_thumbnail(page: pymupdf.Page, side: int = THUMBNAIL_SIDE) -> Image.Image:
+    """
+    Grayscale render of page with its longest side at most side pixels.
+    """
+    scale = side / max(page.rect.width, page.rect.height, 1)
+    pix = page.get_pixmap(matrix=pymupdf.Matrix(scale, scale), colorspace=pymupdf.csGRAY, alpha=False)
+    return Image.frombytes("L", (pix.width, pix.height), pix.samples)
+
+
+@dataclass(frozen=True)
+class Fingerprint:
+    """
+    Content hash and MinHash signature of one document.  kind is "text", "raster" or "empty" and only
+    signatures of the same kind are compared.
+    """
+
+    doc_id: str
+    sha256: str
+    kind: str
+    signature: tuple[int, ...] = ()
+
+    def as_record(self, rows: int = BAND_ROWS) -> dict[str, Any]:
+        """
+        The document stored in the fingerprint collection.
+        """
+        return {
+            "_id": self.doc_id,
+            "sha256": self.sha256,
+            "kind": self.kind,
+            "signature": array("Q", self.signature).tobytes(),
+            "bands": bands(self.signature, rows),
+        }
+
+    @classmethod
+    def from_record(cls, record: dict[str, Any]) -> "Fingerprint":
+        """
+        Rebuild a fingerprint from as_record output.
+        """
+        signature = array("Q")
+        signature.frombytes(record["signature"])
+        return cls(record["_id"], record["sha256"], record["kind"], tuple(signature))
+
+
+def _pdf_tokens(data: bytes | pathlib.Path) -> tuple[str, set[str]]:
+    with pymupdf.open(data) if isinstance(data, pathlib.Path) else pymupdf.open(stream=data) as doc:
+        text = " ".join(page.get_text() for page in doc)
+        if len(text.split()) >= MIN_TEXT_WORDS:
+            return "text", text_shingles(text)
+        tokens: set[str] = set()
+        for page in doc:
+            tokens |= dhash_tokens(page_thumbnail(page))
+        return "raster", tokens
+
+
+def _image_tokens(data: bytes | pathlib.Path) -> tuple[str, set[str]]:
+    with Image.open(data if isinstance(data, pathlib.Path) else io.BytesIO(data)) as image:
+        tokens: set[str] = set()
+        for frame in ImageSequence.Iterator(image):
+            frame.draft("L", (THUMBNAIL_SIDE, THUMBNAIL_SIDE))
+            tokens |= dhash_tokens(frame)
+        return "raster", tokens
+
+
+def _sha256(source: bytes | pathlib.Path) -> str:
+    if isinstance(source, pathlib.Path):
+        with open(source, "rb") as f:
+            return hashlib.file_digest(f, "sha256").hexdigest()
+    return hashlib.sha256(source).hexdigest()
+
+
+def fingerprint(doc_id: str, source: Any) -> Fingerprint:
+    """
+    Fingerprint one document.  source is a path, bytes, or anything with a read() returning bytes.
+    Documents that cannot be opened get an empty signature and only match exact copies.
+    """
+    if hasattr(source, "read"):
+        source = source.read()
+    sha256 = _sha256(source)
+    suffix = pathlib.PurePosixPath(doc_id).suffix.lower()
+    try:
+        kind, tokens = _pdf_tokens(source) if suffix == ".pdf" else _image_tokens(source)
+    except (OSError, RuntimeError, ValueError) as e:
+        logger.warning(f"could not fingerprint {doc_id}: {e}")
+        return Fingerprint(doc_id, sha256, "empty")
+    signature = minhash(tokens)
+    return Fingerprint(doc_id, sha256, kind if signature else "empty", signature)
+
+
+@dataclass(frozen=True)
+class Match:
+    """
+    A document found to duplicate one already in the index.
+    """
+
+    doc_id: str
+    duplicate_of: str
+    similarity: float
+    exact: bool
+
+    def as_link(self) -> dict[str, Any]:
+        """
+        The record written in place of a processed document.
+        """
+        return {"duplicate_of": self.duplicate_of, "similarity": self.similarity, "exact": self.exact}
+
+
+class FingerprintIndex:
+    """
+    Persistent LSH index of processed documents, kept in a mongo collection.
+
+    Args:
+        collection: where fingerprints are stored.  Indexes on sha256 and bands are created if missing.
+        threshold: estimated jaccard similarity at or above which a document is a near duplicate.
+        rows: signature values per LSH band.
+    """
+
+    def __init__(self, collection: Collection, threshold: float = 0.85, rows: int = BAND_ROWS):
+        self.collection = collection
+        self.threshold = threshold
+        self.rows = rows
+        self.collection.create_index("sha256")
+        self.collection.create_index("bands")
+
+    def add(self, fp: Fingerprint) -> None:
+        """
+        Store fp, replacing any earlier fingerprint of the same document.
+        """
+        self.collection.replace_one({"_id": fp.doc_id}, fp.as_record(self.rows), upsert=True)
+
+    def candidates(self, fp: Fingerprint) -> Iterator[Fingerprint]:
+        """
+        Indexed documents sharing at least one band with fp.
+        """
+        if not fp.signature:
+            return
+        query = {"bands": {"$in": bands(fp.signature, self.rows)}, "kind": fp.kind, "_id": {"$ne": fp.doc_id}}
+        for record in self.collection.find(query):
+            yield Fingerprint.from_record(record)
+
+    def match(self, fp: Fingerprint) -> Match | None:
+        """
+        The indexed document fp duplicates, exact copies first, then the most similar near copy.
+        """
+        exact = self.collection.find_one({"sha256": fp.sha256, "_id": {"$ne": fp.doc_id}}, {"_id": 1})
+        if exact:
+            return Match(fp.doc_id, exact["_id"], 1.0, True)
+        best: Match | None = None
+        for candidate in self.candidates(fp):
+            score = similarity(fp.signature, candidate.signature)
+            if score >= self.threshold and (best is None or score > best.similarity):
+                best = Match(fp.doc_id, candidate.doc_id, score, False)
+        return best
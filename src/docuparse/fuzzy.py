@@ -0,0 +1,339 @@
+"""
+Ocr error tolerant search.
+
+Ocr text is full of damaged words ("JESCRIBED" for "DESCRIBED"), so exact terms miss them.  TrigramIndex keeps
+the vocabulary of the indexed pages with a trigram -> term postings list.  A query word is matched against the
+vocabulary instead of the text: a term within edit distance k of a word of n trigrams shares at least n - 3k of
+its trigrams, so only terms found in enough trigram postings are verified with a bounded edit distance.  Matching
+terms then map to the pages they occur on.
+
+Documents are added as they are written through TrigramIndexWriter.  The index is saved as a json snapshot, and
+the documents added since are appended to a segment file next to it, one json line per batch, so a batch costs
+its own size rather than a rewrite of the index.  Segments are replayed on load and merged into the snapshot on
+save.
+"""
+
+import bisect
+import json
+import pathlib
+from array import array
+from typing import Any, Iterable
+
+from docuparse import get_logger
+from docuparse.search import PageHit, SearchResult, page_texts, tokenize
+
+logger = get_logger()
+
+
+def trigrams(word: str) -> set[str]:
+    """
+    Trigrams of word padded with a boundary marker, so short words and word edges get trigrams too.
+    """
+    padded = f"${word}$"
+    return {padded[i : i + 3] for i in range(len(padded) - 2)}
+
+
+def edit_distance(a: str, b: str, limit: int) -> int:
+    """
+    Levenshtein distance between a and b, or limit + 1 once it is known to exceed limit.
+    """
+    if abs(len(a) - len(b)) > limit:
+        return limit + 1
+    previous = list(range(len(b) + 1))
+    for i, ca in enumerate(a, 1):
+        current = [i]
+        for j, cb in enumerate(b, 1):
+            current.append(min(previous[j] + 1, current[j - 1] + 1, previous[j - 1] + (ca != cb)))
+        if min(current) > limit:
+            return limit + 1
+        previous = current
+    return min(previous[-1], limit + 1)
+
+
+def _contains(postings: array, term_id: int) -> bool:
+    i = bisect.bisect_left(postings, term_id)
+    return i < len(postings) and postings[i] == term_id
+
+
+class TrigramIndex:
+    """
+    Trigram index over the words of page text.
+
+    Args:
+        path: json file the index is loaded from and saved to, with its segments in path.segments.  None keeps
+            the index in memory only.
+    """
+
+    def __init__(self, path: str | pathlib.Path | None = None):
+        self.path = pathlib.Path(path) if path else None
+        self.terms: list[str] = []
+        self.term_ids: dict[str, int] = {}
+        self.grams: dict[str, array] = {}
+        self.term_pages: list[set[int]] = []
+        self.pages: list[tuple[str, int]] = []
+        self.documents: dict[str, list[int]] = {}
+        self._page_terms: dict[int, set[int]] = {}
+        # documents added and removed since the last save or append, in order
+        self._added: dict[str, None] = {}
+        self._removed: set[str] = set()
+        if self.path and (self.path.exists() or self.segments_path.exists()):
+            self.load()
+
+    @property
+    def segments_path(self) -> pathlib.Path:
+        """
+        The segment file of the index.
+        """
+        if self.path is None:
+            raise ValueError("an in memory trigram index has no segments")
+        return self.path.with_suffix(self.path.suffix + ".segments")
+
+    def _term_id(self, term: str) -> int:
+        term_id = self.term_ids.get(term)
+        if term_id is None:
+            term_id = self.term_ids[term] = len(self.terms)
+            self.terms.append(term)
+            self.term_pages.append(set())
+            for gram in trigrams(term):
+                # ids only grow, so appending keeps every postings list sorted
+                self.grams.setdefault(gram, array("I")).append(term_id)
+        return term_id
+
+    def remove(self, doc_id: str) -> None:
+        """
+        Drop the pages of doc_id.  Terms stay in the vocabulary.
+        """
+        if doc_id in self.documents:
+            self._added.pop(doc_id, None)
+            self._removed.add(doc_id)
+        for page_id in self.documents.pop(doc_id, []):
+            self.pages[page_id] = ("", -1)
+            for term in self._page_terms.pop(page_id, ()):
+                self.term_pages[term].discard(page_id)
+
+    def add(self, doc_id: str, pages: Iterable[str]) -> None:
+        """
+        Index the text of each page of doc_id, replacing any earlier version of the document.
+        """
+        if doc_id in self.documents:
+            self.remove(doc_id)
+        page_ids = []
+        for number, text in enumerate(pages):
+            page_id = len(self.pages)
+            self.pages.append((doc_id, number))
+            term_ids = {self._term_id(word) for word in tokenize(text)}
+            for term_id in term_ids:
+                self.term_pages[term_id].add(page_id)
+            self._page_terms[page_id] = term_ids
+            page_ids.append(page_id)
+        self.documents[doc_id] = page_ids
+        self._removed.discard(doc_id)
+        self._added[doc_id] = None
+
+    def add_document(self, doc_id: str, document: dict[str, Any]) -> None:
+        """
+        Index a processed document.  Documents without pages are indexed from merged_text as a single page.
+        """
+        pages = page_texts(document) or [document.get("merged_text", "")]
+        self.add(doc_id, pages)
+
+    def candidates(self, word: str, max_distance: int) -> list[int]:
+        """
+        Ids of terms that can be within max_distance of word by the trigram count bound.
+
+        Postings are taken shortest first.  A term needing at least `needed` of the n lists must appear in one of
+        the n - needed + 1 shortest, so only those are unioned and the longer lists are probed by binary search.
+        """
+        lists = sorted((self.grams.get(g, array("I")) for g in trigrams(word)), key=len)
+        needed = len(lists) - 3 * max_distance
+        if needed <= 0:
+            return [
+                i
+                for i, term in enumerate(self.terms)
+                if abs(len(term) - len(word)) <= max_distance and self.term_pages[i]
+            ]
+        head, tail = lists[: len(lists) - needed + 1], lists[len(lists) - needed + 1 :]
+        counts: dict[int, int] = {}
+        for postings in head:
+            for term_id in postings:
+                counts[term_id] = counts.get(term_id, 0) + 1
+        found = []
+        for term_id, count in counts.items():
+            if abs(len(self.terms[term_id]) - len(word)) > max_distance:
+                continue
+            for postings in tail:
+                if count >= needed:
+                    break
+                count += _contains(postings, term_id)
+            if count >= needed:
+                found.append(term_id)
+        return found
+
+    def similar(self, word: str, max_distance: int = 2) -> list[tuple[str, int]]:
+        """
+        Indexed terms within max_distance edits of word, with their distances, closest first.
+        """
+        word = word.lower()
+        matches = []
+        for term_id in self.candidates(word, max_distance):
+            distance = edit_distance(word, self.terms[term_id], max_distance)
+            if distance <= max_distance and self.term_pages[term_id]:
+                matches.append((self.terms[term_id], distance))
+        return sorted(matches, key=lambda m: (m[1], m[0]))
+
+    def search(self, query: str, max_distance: int = 2, limit: int = 10) -> list[SearchResult]:
+        """
+        Pages containing an approximate match of every query word, grouped by document.  Pages score by how close
+        their matches are, 1 per exact word.
+        """
+        words = tokenize(query)
+        if not words:
+            return []
+        page_scores: dict[int, float] | None = None
+        page_terms: dict[int, list[str]] = {}
+        for word in words:
+            scores: dict[int, float] = {}
+            for term, distance in self.similar(word, max_distance):
+                closeness = 1 - distance / (len(word) + 1)
+                for page_id in self.term_pages[self.term_ids[term]]:
+                    if closeness > scores.get(page_id, 0.0):
+                        scores[page_id] = closeness
+                        page_terms.setdefault(page_id, []).append(term)
+            if page_scores is None:
+                page_scores = scores
+            else:
+                page_scores = {p: s + scores[p] for p, s in page_scores.items() if p in scores}
+            if not page_scores:
+                return []
+
+        results: dict[str, SearchResult] = {}
+        for page_id, score in (page_scores or {}).items():
+            doc_id, number = self.pages[page_id]
+            result = results.setdefault(doc_id, SearchResult(doc_id, 0.0))
+            result.score = max(result.score, score)
+            result.pages.append(PageHit(number, score, " ".join(dict.fromkeys(page_terms[page_id]))))
+        ranked = sorted(results.values(), key=lambda r: r.score, reverse=True)[:limit]
+        for result in ranked:
+            result.pages.sort(key=lambda h: h.score, reverse=True)
+        return ranked
+
+    @property
+    def unsaved(self) -> bool:
+        """
+        True when documents were added or removed since the last save or append.
+        """
+        return bool(self._added or self._removed)
+
+    def append(self) -> None:
+        """
+        Append the documents added and removed since the last save or append as one segment: the terms of each
+        page of the added documents and the ids of the removed ones.
+        """
+        if not self.unsaved:
+            return
+        segment = {
+            "removed": sorted(self._removed),
+            "documents": {
+                doc_id: [sorted(self.terms[t] for t in self._page_terms[p]) for p in self.documents[doc_id]]
+                for doc_id in self._added
+            },
+        }
+        with open(self.segments_path, "a", encoding="utf8") as f:
+            f.write(json.dumps(segment) + "\n")
+        self._added, self._removed = {}, set()
+
+    def save(self, path: str | pathlib.Path | None = None) -> None:
+        """
+        Write the index as a json snapshot, merging its segments.  Trigram postings are rebuilt from the
+        vocabulary on load.
+        """
+        path = pathlib.Path(path) if path else self.path
+        if path is None:
+            raise ValueError("no path to save the trigram index to")
+        state = {
+            "terms": self.terms,
+            "term_pages": [sorted(p) for p in self.term_pages],
+            "pages": self.pages,
+            "documents": self.documents,
+        }
+        tmp = path.with_suffix(path.suffix + ".tmp")
+        tmp.write_text(json.dumps(state), encoding="utf8")
+        tmp.replace(path)
+        if path == self.path:
+            self.segments_path.unlink(missing_ok=True)
+            self._added, self._removed = {}, set()
+
+    def load(self) -> None:
+        """
+        Read the index saved at path and replay its segments.  A segment cut short by an interrupted append is
+        ignored.
+        """
+        if self.path.exists():  # type: ignore[union-attr]
+            state = json.loads(self.path.read_text(encoding="utf8"))  # type: ignore[union-attr]
+            for term in state["terms"]:
+                self._term_id(term)
+            self.term_pages = [set(p) for p in state["term_pages"]]
+            self.pages = [(doc_id, number) for doc_id, number in state["pages"]]
+            self.documents = state["documents"]
+            for term_id, pages in enumerate(self.term_pages):
+                for page_id in pages:
+                    self._page_terms.setdefault(page_id, set()).add(term_id)
+        if self.segments_path.exists():
+            with open(self.segments_path, encoding="utf8") as f:
+                for line in f:
+                    if not line.endswith("\n"):
+                        logger.warning(f"ignoring the incomplete last segment of {self.segments_path}")
+                        break
+                    segment = json.loads(line)
+                    for doc_id in segment["removed"]:
+                        self.remove(doc_id)
+                    for doc_id, pages in segment["documents"].items():
+                        self.add(doc_id, [" ".join(terms) for terms in pages])
+        self._added, self._removed = {}, set()
+
+
+class TrigramIndexWriter:
+    """
+    DataWriter that keeps a TrigramIndex up to date as documents are written.  The documents are appended as a
+    segment every save_every documents, and the index is saved, merging the segments, on close.
+
+    Args:
+        path: json file of the index.
+        save_every: documents between appended segments.
+    """
+
+    def __init__(self, path: str | pathlib.Path, save_every: int = 100):
+        self.index = TrigramIndex(path)
+        self.save_every = save_every
+        self._unsaved = 0
+
+    def write_data(self, data: dict[str, dict[str, Any]], force: bool = False) -> bool:
+        """
+        Index each document in data, keyed by document id.  Indexed documents are only replaced with force.
+        """
+        written = False
+        for doc_id, document in data.items():
+            if doc_id in self.index.documents and not force:
+                logger.info(f"Not indexing {doc_id}. Already indexed. Use force=True to replace.")
+                continue
+            self.index.add_document(doc_id, document)
+            written = True
+            self._unsaved += 1
+        if self._unsaved >= self.save_every:
+            self.index.append()
+            self._unsaved = 0
+        return written
+
+    def exists(self, uri: str) -> bool:
+        """
+        True when uri is indexed.
+        """
+        return str(uri) in self.index.documents
+
+    def close(self) -> None:
+        """
+        Save the index, merging its segments.
+        """
+        if self.index.unsaved or self.index.segments_path.exists():
+            self.index.save()
+        self._unsaved = 0
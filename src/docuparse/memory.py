@@ -0,0 +1,98 @@
+"""
+Memory accounting for image decoding.
+
+Decoded image sizes are estimated from image headers before any pixels are decoded, and a MemoryBudget admits
+images only while the estimated in flight memory stays under a limit.
+"""
+
+import sys
+import threading
+from contextlib import contextmanager
+from typing import Iterator
+
+from docuparse import get_logger
+
+logger = get_logger()
+
+# Bytes per pixel alive at the worst point of recognizing one image, on top of the decoded pixmap: the RGB copy
+# handed to the ocr engine, its rotated copy, the two RGB copies of a transform step and the grayscale image
+# tesseract is given.
+PIPELINE_BYTES_PER_PIXEL = 3 + 3 + 3 + 3 + 1
+
+MB = 1024 * 1024
+
+
+def image_memory(width: int, height: int, components: int = 3, bits_per_component: int = 8) -> int:
+    """
+    Estimated peak bytes to decode and recognize a width x height image with the given components.
+    """
+    decoded = width * height * components * max(bits_per_component, 8) // 8
+    return decoded + width * height * PIPELINE_BYTES_PER_PIXEL
+
+
+class MemoryBudget:
+    """
+    Admission control for in flight image memory.
+
+    acquire blocks until the requested bytes fit under limit.  An image larger than the whole limit is admitted
+    once nothing else is in flight, so oversized images run alone instead of deadlocking.
+
+    Args:
+        limit: bytes that may be in flight at once.  0 admits everything.
+    """
+
+    def __init__(self, limit: int = 0):
+        self.limit = limit
+        self.in_flight = 0
+        self.peak = 0
+        self.waits = 0
+        self._condition = threading.Condition()
+
+    def acquire(self, nbytes: int) -> int:
+        """
+        Reserve nbytes, waiting for other images to finish when the budget is full.  Returns the reserved bytes.
+        """
+        with self._condition:
+            if self.limit and self.in_flight and self.in_flight + nbytes > self.limit:
+                self.waits += 1
+                logger.debug(f"waiting to admit {nbytes / MB:.0f}MB with {self.in_flight / MB:.0f}MB in flight")
+                self._condition.wait_for(lambda: not self.in_flight or self.in_flight + nbytes <= self.limit)
+            self.in_flight += nbytes
+            self.peak = max(self.peak, self.in_flight)
+        return nbytes
+
+    def release(self, nbytes: int) -> None:
+        """
+        Return nbytes to the budget.
+        """
+        with self._condition:
+            self.in_flight = max(0, self.in_flight - nbytes)
+            self._condition.notify_all()
+
+    @contextmanager
+    def reserve(self, nbytes: int) -> Iterator[int]:
+        """
+        acquire and release around a block.
+        """
+        self.acquire(nbytes)
+        try:
+            yield nbytes
+        finally:
+            self.release(nbytes)
+
+
+def peak_rss() -> tuple[int, int]:
+    """
+    Peak resident set size in bytes of this process and of the largest finished child process, such as a
+    worker or a tesseract run.  (0, 0) where the resource module is unavailable.
+    """
+    try:
+        import resource  # pylint: disable=import-outside-toplevel
+    except ImportError:
+        return 0, 0
+    # ru_maxrss is in kilobytes on linux and bytes on macos
+    scale = 1 if sys.platform == "darwin" else 1024
+    return (
+        resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * scale,
+        resource.getrusage(resource.RUSAGE_CHILDREN).ru_maxrss * scale,
+    )
@@ -2,8 +2,18 @@
 Contains all of the ocr logic
 """
 
+import functools
+import hashlib
+import os
 import pathlib
-from typing import Any
+import threading
+import time
+from array import array
+from collections import OrderedDict
+from concurrent.futures import Future, ThreadPoolExecutor
+from contextlib import contextmanager
+from dataclasses import dataclass
+from typing import Any, Iterator, Sequence
 
 import nltk
 import pytesseract
@@ -12,11 +22,71 @@ from PIL import Image, ImageOps
 from textstat import flesch_reading_ease  # pylint: disable=no-name-in-module
 
 from docuparse import config, get_logger
+from docuparse.memory import MemoryBudget
+from docuparse.orientation import OrientationDetector
+from docuparse.watermarks import mask_overlay
+from docuparse.wordboxes import WordBoxes
 
 logger = get_logger()
 
 nltk.download("words")
 
+QUALITY_ENGINES = ("tesseract", "dictionary")
+LOW_CONFIDENCE_THRESHOLD = 60
+
+
+@functools.cache
+def english_words() -> frozenset[str]:
+    """
+    The nltk word list as a set.  words.words() builds a fresh list on each call.
+    """
+    return frozenset(w.lower() for w in words.words())
+
+
+def confidence_quality(confidences: Sequence[int], low_threshold: int = LOW_CONFIDENCE_THRESHOLD) -> dict[str, float]:
+    """
+    Summarize tesseract per-word confidences (0-100).
+
+    Returns mean and percentile confidence, the ratio of words under low_threshold and a
+    normalized quality_score in [0, 1].
+    """
+    if not confidences:
+        return {
+            "mean_confidence": 0.0,
+            "p10_confidence": 0.0,
+            "median_confidence": 0.0,
+            "low_confidence_ratio": 1.0,
+            "word_count": 0,
+            "quality_score": 0.0,
+        }
+    ordered = sorted(confidences)
+    count = len(ordered)
+    mean = sum(ordered) / count
+    return {
+        "mean_confidence": round(mean, 2),
+        "p10_confidence": float(ordered[int(0.1 * (count - 1))]),
+        "median_confidence": float(ordered[int(0.5 * (count - 1))]),
+        "low_confidence_ratio": round(sum(1 for c in ordered if c < low_threshold) / count, 4),
+        "word_count": count,
+        "quality_score": round(mean / 100, 4),
+    }
+
+
+def words_from_data(data: dict[str, list]) -> tuple[str, array]:
+    """
+    Rebuild the text and a compact uint8 confidence array from pytesseract.image_to_data output.
+    Lines are joined with spaces to match the flattened text from image_to_string.
+    """
+    tokens: list[str] = []
+    confidences = array("B")
+    for text, conf in zip(data["text"], data["conf"]):
+        conf = int(float(conf))
+        if conf < 0 or not text.strip():
+            continue
+        tokens.append(text.strip())
+        confidences.append(min(conf, 100))
+    return " ".join(tokens), confidences
+
 
 class OCREngine:
     """
@@ -24,18 +94,42 @@ class OCREngine:
 
     The OCREngine class provides methods for performing OCR on images, calculating word confidence,
     calculating readability score, and evaluating the quality of OCR text based on English language assumptions.
+
+    quality_engine selects how ocr quality is scored:
+        tesseract:  per-word confidences from the same tesseract call that produced the text.
+        dictionary: ratio of tokens found in the nltk english word list.
     """
 
     def __init__(
         self,
         file_ref: str | pathlib.Path | Image.Image | None = None,
+        quality_engine: str = "tesseract",
+        orientation: OrientationDetector | None = None,
+        timeout: float = 0,
+        retry_scale: float = 0.5,
+        remove_watermarks: bool | None = None,
     ):
         """
         accept a file_ref that may or may not exist.
         If it exists, it can be a string, path, or Image data.
         If not None and string or pathlib.Path or Image.Image, load the image into the class.
+
+        timeout bounds each tesseract recognition in seconds, 0 for no bound.  A recognition that runs over is
+        killed and retried once on the image scaled by retry_scale, 0 to not retry, before the image is marked
+        as timed out.
+
+        remove_watermarks masks watermark and stamp overlays before orientation detection and recognition, and
+        records what was found under "watermark".  None takes the REMOVE_WATERMARKS setting.
         """
+        if quality_engine not in QUALITY_ENGINES:
+            raise ValueError(f"unknown quality engine {quality_engine}, expected one of {QUALITY_ENGINES}")
+        self.quality_engine = quality_engine
+        self.orientation = orientation or OrientationDetector()
+        self.timeout = timeout
+        self.retry_scale = retry_scale
+        self.remove_watermarks = config.remove_watermarks if remove_watermarks is None else remove_watermarks
         self.image: Image.Image
+        self.source_size: tuple[int, int] = (0, 0)
         self.image_data: dict[str, Any]
         self.image_data = {"file_path": str(file_ref)}
         if config.pytesseract_executable:
@@ -59,6 +153,12 @@ class OCREngine:
         """
         return getattr(self.image, "filename", "")
 
+    def end_document(self, document: str) -> None:
+        """
+        Called once all images of document have been processed.
+        """
+        self.orientation.forget(document)
+
     def is_english_word(self, word):
         """Check if a word is an English word."""
         # TODO: Spacy can do this much faster
@@ -66,7 +166,7 @@ class OCREngine:
         # doc = nlp("I love coffee")
         # print(doc.vocab.strings["coffee"])  # 3197928453018144401
         # print(doc.vocab.strings[3197928453018144401])  # 'coffee'
-        return word.lower() in words.words()
+        return word.lower() in english_words()
 
     def calculate_word_confidence(self, text, max_count: int = 0):
         """Calculate the percentage of valid English words in the text."""
@@ -88,50 +188,32 @@ class OCREngine:
         """
         Evaluate the quality of OCR text based on English language assumptions.
 
-        Returns a dictionary with word confidence, character confidence, and readability score.
+        Returns a dictionary with the confidence summary for the selected quality engine and the readability score.
         """
-        word_conf = self.calculate_word_confidence(text, max_count)
-        # char_conf = calculate_character_confidence(text)
         readability = self.readability_score(text)
 
-        quality = {
-            "word_confidence": word_conf,
-            #    'character_confidence': char_conf,
-            "readability_score": readability,
-        }
+        if self.quality_engine == "tesseract":
+            confidences = array("B", self.image_data.get("word_confidences", b""))
+            quality: dict[str, Any] = {"engine": "tesseract", **confidence_quality(confidences)}
+        else:
+            word_conf = self.calculate_word_confidence(text, max_count)
+            # char_conf = calculate_character_confidence(text)
+            quality = {"engine": "dictionary", "word_confidence": word_conf, "quality_score": word_conf}
+
+        quality["readability_score"] = readability
         self.image_data["ocr_quality"] = quality
 
         return quality
 
-    def set_image_data(self) -> dict[str, Any]:
+    def set_image_data(self, document: str = "") -> dict[str, Any]:
         """
         Collects various metadata about the image and the ocr
         results and returns it as a dict.
+        Orientation comes from the orientation detector, which reuses confident results within a document.
         """
-        data = {}
-        try:
-            osd = pytesseract.image_to_osd(self.image)
-        except pytesseract.TesseractError as e:
-            if "Too few characters" in str(e):
-                try:
-                    osd = pytesseract.image_to_osd(self.image, config="--psm 0 -c min_characters_to_try=5")
-                except pytesseract.TesseractError as ex:
-                    logger.error(f"Retry failed with error: {ex.__class__.__name__} - {str(ex)}")
-                    return {}
-            else:
-                logger.error(f"Unexpected TesseractError: {e.__class__.__name__} - {str(e)}")
-                osd = None
-
-        osd_dict: dict[str, Any] = {
-            i.split(": ")[0]: i.split(": ")[1] for i in osd.split("\n") if len(i.split(": ")) > 1
-        }  # pylint: disable=C0301
+        orientation = self.orientation.detect(self.image, document)
         data = {
-            # "page_num": osd_dict.get("Page number"),
-            "rotation": int(osd_dict.get("Rotate", "0")),
-            "rotation_to_zero": 360 - int(osd_dict.get("Rotate", "0")),
-            "rotation_confidence": float(osd_dict.get("Orientation confidence", "0.0")),
-            "script_language": osd_dict.get("Script"),
-            "script_confidence": float(osd_dict.get("OrientationScript confidence", "0.0")),
+            **orientation.as_dict(),
             "format": self.image.format,
             "mode": self.image.mode,
             "filename": self.get_image_filename(),
@@ -162,11 +244,56 @@ class OCREngine:
             self.image = self.image.rotate(angle=self.image_data["rotation_to_zero"], expand=True)
             self.image_data["rotated_for_ocr"] = True
 
-    def get_ocr_text(self):
+    def _recognize(self, image: Image.Image, timeout: float) -> None:
+        """
+        The tesseract quality engine uses image_to_data so the text, the word confidences and the word boxes
+        come from a single tesseract call.  Confidences are stored as compact uint8 bytes.  Boxes are scaled to
+        the engine image when image is a smaller copy of it.
+        """
+        if self.quality_engine != "tesseract":
+            self.image_data["text"] = pytesseract.image_to_string(image, timeout=timeout).replace("\n", " ")
+            return
+
+        data = pytesseract.image_to_data(image, output_type=pytesseract.Output.DICT, timeout=timeout)
+        text, confidences = words_from_data(data)
+        self.image_data["text"] = text
+        self.image_data["word_confidences"] = confidences.tobytes()
+        self.image_data["word_boxes"] = WordBoxes.from_tesseract(data).scaled(
+            self.image.width / image.width, self.image.height / image.height
+        )
+
+    def get_ocr_text(self, timeout: float | None = None):
         """
         Collect the ocr'ed check.
+        A recognition that runs over timeout is killed, retried once at lower resolution and otherwise
+        recorded with empty text and timed_out set.
         """
-        self.image_data["text"] = pytesseract.image_to_string(self.image).replace("\n", " ")
+        timeout = self.timeout if timeout is None else timeout
+        start = time.perf_counter()
+        try:
+            self._recognize(self.image, timeout)
+        except RuntimeError as e:
+            if "timeout" not in str(e).lower():
+                raise e
+            logger.warning(f"ocr of {self.image_data.get("filename") or "image"} ran over {timeout}s")
+            self._retry_smaller(timeout)
+        self.image_data["ocr_seconds"] = round(time.perf_counter() - start, 3)
+
+    def _retry_smaller(self, timeout: float) -> None:
+        self.image_data.update(
+            {"text": "", "word_confidences": b"", "word_boxes": WordBoxes.empty(), "timed_out": True}
+        )
+        width, height = self.image.size
+        if not self.retry_scale or min(width, height) * self.retry_scale < 1:
+            return
+        smaller = self.image.resize((int(width * self.retry_scale), int(height * self.retry_scale)))
+        try:
+            self._recognize(smaller, timeout)
+            self.image_data.update({"timed_out": False, "ocr_retry_scale": self.retry_scale})
+        except RuntimeError as e:
+            if "timeout" not in str(e).lower():
+                raise e
+            logger.warning(f"ocr retry at scale {self.retry_scale} ran over {timeout}s, marking timed out")
 
     def transform_image(self):
         """
@@ -195,38 +322,308 @@ class OCREngine:
         except OSError as e:
             logger.error(f"could not transform {self.image} due to {e}")
 
-    def load_and_preprocess_image(self, correct_rotation=True):
+    def load_and_preprocess_image(self, correct_rotation=True, document: str = ""):
         """
         Loads an image from the given path and optionally corrects its rotation.
 
         :param image_path: Path to the image file.
         :param correct_rotation: Whether to correct the rotation of the image.
+        :param document: The document the image belongs to, used for orientation reuse.
         :return: A PIL Image object.
 
         if pymupdf.pixmap Image.open(io.BytesIO(image.tobytes()))
         """
-        self.set_image_data()
+        watermark = None
+        if self.remove_watermarks:
+            self.image, watermark = mask_overlay(self.image)
+        self.set_image_data(document)
+        if watermark is not None:
+            self.image_data["watermark"] = watermark
+        self.source_size = self.image.size
         if correct_rotation:
             self.rotate_image()
 
         self.transform_image()
         # self.image_data["image"] = self.image
 
-    def perform_ocr(self, image: str | pathlib.Path | Image.Image | None = None, file_name: str = "") -> dict[str, Any]:
+    def perform_ocr(
+        self,
+        image: str | pathlib.Path | Image.Image | None = None,
+        file_name: str = "",
+        timeout: float | None = None,
+    ) -> dict[str, Any]:
         """
         Performs OCR on the given PIL Image object and returns the extracted text.
         If an image is provided, attempt to load it.
+        Word boxes are returned in the coordinates of the image as given, before any rotation for ocr.
 
         :param image: A PIL Image object.
+        :param timeout: Overrides the engine timeout for this image.
         :return: Extracted text as a string.
         """
 
         if image:
             self._load_file(image)
-        self.load_and_preprocess_image()  # Attempts to correct any potential issues.
-        self.get_ocr_text()
+        self.load_and_preprocess_image(document=file_name)  # Attempts to correct any potential issues.
+        self.get_ocr_text(timeout)
+        if self.image_data.get("rotated_for_ocr") and "word_boxes" in self.image_data:
+            self.image_data["word_boxes"] = self.image_data["word_boxes"].unrotated(
+                self.image_data["rotation_to_zero"], self.source_size
+            )
         self.ocr_quality(self.image_data["text"], 50)
         self.image_data["file_path"] = f"{file_name}_image_{self.image_data.get("page_num", 0)}"
+        if image:
+            # drop the rotated and transformed copies now rather than when this engine sees its next image
+            del self.image
 
         # logger.warning(f"{self.image_data}")
         return self.image_data  # ["text"]
+
+
+def image_key(image: Image.Image) -> str:
+    """
+    Content hash of the decoded pixels, used as the ocr cache key.
+    """
+    digest = hashlib.sha1(f"{image.mode}:{image.size}".encode(), usedforsecurity=False)
+    digest.update(image.tobytes())
+    return digest.hexdigest()
+
+
+class OCRPool:
+    """
+    Shared ocr pipeline for pdf images and standalone image files.
+
+    Hands images to a pool of OCREngine workers, one engine per thread, that share an orientation detector.
+    Results are cached by pixel content so repeated images are only recognized once.  Tesseract runs as a
+    subprocess, so threads are enough to keep several recognitions in flight.
+
+    Args:
+        workers: number of concurrent ocr engines.  1 runs inline in the calling thread.
+        cache_size: number of results to keep.  0 disables the cache.
+        engine: an existing engine to use instead of building one.  Only valid with a single worker.
+        timeout: seconds each image may spend in tesseract.  0 for no bound.
+        memory_limit: bytes of decoded images the processors may have in flight at once.  0 for no bound.
+        engine_options: keyword arguments for each OCREngine.
+    """
+
+    def __init__(
+        self,
+        workers: int = 1,
+        cache_size: int = 256,
+        engine: OCREngine | None = None,
+        timeout: float = 0,
+        memory_limit: int = 0,
+        **engine_options: Any,
+    ):
+        if engine and workers != 1:
+            raise ValueError("an existing engine can only back a single worker pool")
+        self.workers = max(1, workers)
+        self.cache_size = cache_size
+        self.engine_options = engine_options
+        self.orientation: OrientationDetector = engine.orientation if engine else OrientationDetector()
+        self.timeout = timeout
+        self.memory = MemoryBudget(memory_limit)
+        self._engine = engine
+        self._local = threading.local()
+        self._executor: ThreadPoolExecutor | None = None
+        self._cache: OrderedDict[str, dict[str, Any]] = OrderedDict()
+        self._lock = threading.Lock()
+
+    def __getstate__(self) -> dict[str, Any]:
+        return {
+            "workers": self.workers,
+            "cache_size": self.cache_size,
+            "timeout": self.timeout,
+            "memory_limit": self.memory.limit,
+            "engine_options": self.engine_options,
+        }
+
+    def __setstate__(self, state: dict[str, Any]) -> None:
+        self.__init__(  # type: ignore[misc]
+            state["workers"],
+            state["cache_size"],
+            timeout=state["timeout"],
+            memory_limit=state["memory_limit"],
+            **state["engine_options"],
+        )
+
+    @property
+    def timeout(self) -> float:
+        """
+        Seconds each image may spend in tesseract, osd and recognition each.  0 for no bound.
+        """
+        return self._timeout
+
+    @timeout.setter
+    def timeout(self, seconds: float) -> None:
+        self._timeout = seconds
+        self.orientation.timeout = seconds
+
+    def engine(self) -> OCREngine:
+        """
+        The engine for the current thread.
+        """
+        if self._engine:
+            return self._engine
+        if not hasattr(self._local, "engine"):
+            self._local.engine = OCREngine(orientation=self.orientation, **self.engine_options)
+        return self._local.engine
+
+    def perform_ocr(self, image: Image.Image, file_name: str = "", timeout: float | None = None) -> dict[str, Any]:
+        """
+        Ocr image in the calling thread, answering from the cache when the same pixels were seen before.
+        timeout overrides the pool timeout for this image.  Timed out results are not cached.
+        """
+        key = image_key(image) if self.cache_size else ""
+        if key:
+            with self._lock:
+                cached = self._cache.get(key)
+                if cached:
+                    self._cache.move_to_end(key)
+            if cached:
+                return {**cached, "file_path": f"{file_name}_image_{cached.get("page_num", 0)}", "cached": True}
+
+        result = self.engine().perform_ocr(image, file_name, self.timeout if timeout is None else timeout)
+
+        if key and not result.get("timed_out"):
+            with self._lock:
+                self._cache[key] = result
+                while len(self._cache) > self.cache_size:
+                    self._cache.popitem(last=False)
+        return result
+
+    def submit(self, image: Image.Image, file_name: str = "", timeout: float | None = None) -> Future:
+        """
+        Queue image for ocr and return a future of the image data.
+        """
+        if self.workers == 1:
+            future: Future = Future()
+            try:
+                future.set_result(self.perform_ocr(image, file_name, timeout))
+            except Exception as e:  # pylint: disable=broad-exception-caught
+                future.set_exception(e)
+            return future
+        if self._executor is None:
+            with self._lock:
+                if self._executor is None:
+                    self._executor = ThreadPoolExecutor(max_workers=self.workers, thread_name_prefix="ocr")
+        return self._executor.submit(self.perform_ocr, image, file_name, timeout)
+
+    def end_document(self, document: str) -> None:
+        """
+        Called once all images of document have been processed.
+        """
+        self.orientation.forget(document)
+
+    def close(self) -> None:
+        """
+        Stop the worker threads.
+        """
+        if self._executor:
+            self._executor.shutdown(wait=True)
+            self._executor = None
+
+
+@dataclass(frozen=True)
+class CPULayout:
+    """
+    How a cpu budget is split.
+
+    Attributes:
+        workers: worker processes.
+        ocr_threads: concurrent tesseract calls per worker, the OCRPool size.
+        tesseract_threads: OpenMP threads per tesseract process, passed as OMP_THREAD_LIMIT.
+    """
+
+    workers: int = 1
+    ocr_threads: int = 1
+    tesseract_threads: int = 1
+
+    @property
+    def cpus(self) -> int:
+        """
+        Threads the layout can run at once.
+        """
+        return self.workers * self.ocr_threads * self.tesseract_threads
+
+    def apply(self) -> None:
+        """
+        Limit the tesseract processes started from this process for good, as pool worker processes do.
+        pytesseract starts tesseract with os.environ and takes no environment of its own.
+        """
+        os.environ["OMP_THREAD_LIMIT"] = str(self.tesseract_threads)
+
+    @contextmanager
+    def limit(self) -> Iterator[None]:
+        """
+        Apply the layout while the block runs, then put back the limit this process had before.
+        """
+        previous = os.environ.get("OMP_THREAD_LIMIT")
+        self.apply()
+        try:
+            yield
+        finally:
+            if previous is None:
+                os.environ.pop("OMP_THREAD_LIMIT", None)
+            else:
+                os.environ["OMP_THREAD_LIMIT"] = previous
+
+    def describe(self) -> str:
+        """
+        One line description for the run report.
+        """
+        return (
+            f"{self.workers} worker(s) x {self.ocr_threads} ocr thread(s) x "
+            f"{self.tesseract_threads} tesseract thread(s) = {self.cpus} cpus"
+        )
+
+
+class CPUBudget:
+    """
+    Splits a total cpu budget between worker processes and tesseract OpenMP threads.
+
+    Each tesseract process starts one OpenMP thread per core unless limited, so several ocr workers
+    oversubscribe the machine and thrash.  Tesseract scales poorly with threads, so the budget prefers one
+    single threaded tesseract per cpu and only hands spare cpus to tesseract threads when there are fewer
+    documents than cpus.
+
+    Args:
+        total: cpus to use.  Defaults to the cpus available to this process.
+        ocr_threads: the OCRPool size in each worker.
+    """
+
+    def __init__(self, total: int | None = None, ocr_threads: int = 1):
+        self.total = max(1, total or available_cpus())
+        self.ocr_threads = max(1, ocr_threads)
+
+    def layout(self, workers: int) -> CPULayout:
+        """
+        The layout for a fixed number of workers, giving each tesseract process its share of the budget.
+        """
+        workers = max(1, workers)
+        return CPULayout(workers, self.ocr_threads, max(1, self.total // (workers * self.ocr_threads)))
+
+    def auto(self, documents: int | None = None) -> CPULayout:
+        """
+        Pick a layout for a run over documents.
+        """
+        workers = max(1, self.total // self.ocr_threads)
+        if documents:
+            workers = min(workers, documents)
+        return self.layout(workers)
+
+    def layouts(self) -> list[CPULayout]:
+        """
+        Every layout that uses the whole budget, for benchmarking.
+        """
+        concurrency = [i for i in range(1, self.total + 1) if self.total % i == 0 and i % self.ocr_threads == 0]
+        return [self.layout(i // self.ocr_threads) for i in concurrency] or [self.layout(1)]
+
+
+def available_cpus() -> int:
+    """
+    Cpus this process may run on.
+    """
+    if hasattr(os, "sched_getaffinity"):
+        return len(os.sched_getaffinity(0))
+    return os.cpu_count() or 1
@@ -0,0 +1,222 @@
+"""
+Orientation detection.
+
+Tesseract osd is run on a downsampled copy of the image.  Scanned plats in one pdf nearly always share an
+orientation, so a confident result is reused for the remaining images of the same document.
+"""
+
+import pathlib
+import threading
+import time
+from collections import OrderedDict
+from dataclasses import asdict, dataclass, replace
+from typing import Any, Iterable
+
+import pytesseract
+from PIL import Image
+
+from docuparse import get_logger
+
+logger = get_logger()
+
+OSD_RETRY_CONFIG = "--psm 0 -c min_characters_to_try=5"
+
+
+@dataclass(frozen=True)
+class Orientation:
+    """
+    Result of an osd run.
+    rotation is the clockwise rotation, in degrees, tesseract reports is needed to make the image upright.
+    """
+
+    rotation: int = 0
+    rotation_confidence: float = 0.0
+    script_language: str | None = None
+    script_confidence: float = 0.0
+    reused: bool = False
+
+    def as_dict(self) -> dict[str, Any]:
+        """
+        The keys OCREngine stores in image_data.
+        """
+        return {
+            "rotation": self.rotation,
+            "rotation_to_zero": 360 - self.rotation,
+            "rotation_confidence": self.rotation_confidence,
+            "script_language": self.script_language,
+            "script_confidence": self.script_confidence,
+            "orientation_reused": self.reused,
+        }
+
+
+def parse_osd(osd: str) -> Orientation:
+    """
+    Parse the text output of pytesseract.image_to_osd.
+    """
+    osd_dict: dict[str, str] = {i.split(": ")[0]: i.split(": ")[1] for i in osd.split("\n") if len(i.split(": ")) > 1}
+    return Orientation(
+        rotation=int(osd_dict.get("Rotate", "0")),
+        rotation_confidence=float(osd_dict.get("Orientation confidence", "0.0")),
+        script_language=osd_dict.get("Script"),
+        script_confidence=float(osd_dict.get("Script confidence", "0.0")),
+    )
+
+
+def thumbnail(image: Image.Image, max_side: int) -> Image.Image:
+    """
+    Return a copy of image whose longest side is at most max_side.  Images that are already small are returned as is.
+    """
+    if not max_side or max(image.size) <= max_side:
+        return image
+    small = image.copy()
+    small.thumbnail((max_side, max_side), Image.Resampling.BILINEAR)
+    return small
+
+
+class OrientationDetector:
+    """
+    Detects image orientation with tesseract osd.
+
+    Args:
+        max_side: longest side, in pixels, of the thumbnail osd runs on.  0 runs osd at full resolution.
+        reuse_confidence: results at or above this orientation confidence are reused for the rest of the document.
+        max_documents: how many document results to remember.
+        timeout: seconds each osd call may take before it is killed.  0 for no bound.
+    """
+
+    def __init__(
+        self, max_side: int = 2000, reuse_confidence: float = 3.0, max_documents: int = 256, timeout: float = 0
+    ):
+        self.max_side = max_side
+        self.timeout = timeout
+        self.reuse_confidence = reuse_confidence
+        self.max_documents = max_documents
+        self._documents: OrderedDict[str, Orientation] = OrderedDict()
+        self._lock = threading.Lock()
+
+    def osd(self, image: Image.Image) -> Orientation:
+        """
+        Run osd on image, retrying with a lower character threshold when tesseract finds too few characters.
+        Failures and timeouts return a zero rotation with zero confidence.
+        """
+        try:
+            return parse_osd(pytesseract.image_to_osd(image, timeout=self.timeout))
+        except pytesseract.TesseractError as e:
+            if "Too few characters" not in str(e):
+                logger.error(f"Unexpected TesseractError: {e.__class__.__name__} - {str(e)}")
+                return Orientation()
+        except RuntimeError as e:
+            logger.warning(f"osd ran over {self.timeout}s: {e}")
+            return Orientation()
+        try:
+            return parse_osd(pytesseract.image_to_osd(image, config=OSD_RETRY_CONFIG, timeout=self.timeout))
+        except pytesseract.TesseractError as ex:
+            logger.error(f"Retry failed with error: {ex.__class__.__name__} - {str(ex)}")
+            return Orientation()
+        except RuntimeError as ex:
+            logger.warning(f"osd retry ran over {self.timeout}s: {ex}")
+            return Orientation()
+
+    def detect(self, image: Image.Image, document: str = "") -> Orientation:
+        """
+        Detect the orientation of image.  When document is given and an earlier image of the same document
+        was detected with enough confidence, that result is returned without running osd.
+        """
+        if document:
+            with self._lock:
+                known = self._documents.get(document)
+            if known:
+                return replace(known, reused=True)
+
+        result = self.osd(thumbnail(image, self.max_side))
+
+        if document and result.rotation_confidence >= self.reuse_confidence:
+            with self._lock:
+                self._documents[document] = result
+                while len(self._documents) > self.max_documents:
+                    self._documents.popitem(last=False)
+        return result
+
+    def forget(self, document: str) -> None:
+        """
+        Drop the remembered result for document.
+        """
+        with self._lock:
+            self._documents.pop(document, None)
+
+
+def benchmark(
+    images: Iterable[tuple[str, Image.Image]],
+    detector: OrientationDetector | None = None,
+    rotations: tuple[int, ...] = (0, 90, 180, 270),
+) -> dict[str, Any]:
+    """
+    Accuracy and timing harness for orientation detection.
+
+    Each upright image is rotated counter clockwise by every angle in rotations, which makes the expected osd
+    rotation equal to that angle.  Thumbnail osd is compared against the expected rotation and against full
+    resolution osd.
+
+    Returns a dict with a per image list under "results" and the totals under "summary".
+    """
+    detector = detector or OrientationDetector()
+    full = OrientationDetector(max_side=0)
+    results = []
+    for name, image in images:
+        for angle in rotations:
+            rotated = image.rotate(angle, expand=True) if angle else image
+            start = time.perf_counter()
+            reference = full.detect(rotated)
+            full_seconds = time.perf_counter() - start
+            start = time.perf_counter()
+            fast = detector.detect(rotated)
+            fast_seconds = time.perf_counter() - start
+            results.append(
+                {
+                    "name": name,
+                    "expected": angle,
+                    "full": asdict(reference),
+                    "thumbnail": asdict(fast),
+                    "full_seconds": full_seconds,
+                    "thumbnail_seconds": fast_seconds,
+                }
+            )
+
+    count = len(results) or 1
+    summary = {
+        "samples": len(results),
+        "full_accuracy": sum(r["full"]["rotation"] == r["expected"] for r in results) / count,
+        "thumbnail_accuracy": sum(r["thumbnail"]["rotation"] == r["expected"] for r in results) / count,
+        "agreement": sum(r["full"]["rotation"] == r["thumbnail"]["rotation"] for r in results) / count,
+        "full_seconds": sum(r["full_seconds"] for r in results),
+        "thumbnail_seconds": sum(r["thumbnail_seconds"] for r in results),
+    }
+    return {"results": results, "summary": summary}
+
+
+def benchmark_images(*paths: str | pathlib.Path) -> Iterable[tuple[str, Image.Image]]:
+    """
+    Yield (name, image) for the image files under paths and for every image embedded in pdfs under paths.
+    """
+    import pymupdf  # pylint: disable=import-outside-toplevel
+
+    for path in paths:
+        path = pathlib.Path(path)
+        for file_path in sorted(path.iterdir() if path.is_dir() else [path]):
+            suffix = file_path.suffix.lower()
+            if suffix in (".png", ".jpg", ".jpeg", ".tif", ".tiff"):
+                with Image.open(file_path) as image:
+                    yield str(file_path), image.convert("RGB")
+            elif suffix == ".pdf":
+                with pymupdf.open(file_path) as doc:
+                    for page in doc:
+                        for image_info in page.get_images():
+                            pix = pymupdf.Pixmap(doc, image_info[0])
+                            if pix.colorspace is None:
+                                # stencil masks have one sample per pixel and no colorspace to convert from
+                                image = Image.frombytes("L", (pix.width, pix.height), pix.samples_mv)
+                            else:
+                                if pix.n - pix.alpha != 3:
+                                    pix = pymupdf.Pixmap(pymupdf.csRGB, pix)
+                                image = pix.pil_image()
+                            yield f"{file_path}:{page.number}:{image_info[0]}", image.convert("RGB")
@@ -3,6 +3,7 @@ This module contains classes and protocols for file processing and OCR (Optical
 
 Classes:
 - OCREngine: Provides functionality for performing OCR on images.
+- OCRPool: Shared ocr pipeline used by both the pdf and the image processors.
 - FileProcessor: Protocol for file processors.
 - OCRProcessor: Protocol for OCR processors.
 - PDFProcessor: File processor for PDF files.
@@ -15,18 +16,25 @@ Protocols:
 
 """
 
+import hashlib
 import io
 import pathlib
-from typing import Any, Dict, Protocol
+import time
+from collections import deque
+from concurrent.futures import Future
+from typing import Any, Dict, Iterator, Protocol
 
 import pymupdf
-import pytesseract
-from PIL import Image
+from PIL import Image, ImageSequence
 from pymupdf.mupdf import FzErrorArgument
 
-from docuparse import get_logger
+from docuparse import config, get_logger
 from docuparse.error_handlers import handle_file_exceptions
-from docuparse.ocr import OCREngine
+from docuparse.memory import image_memory
+from docuparse.ocr import OCREngine, OCRPool
+from docuparse.rastercache import RasterCache
+from docuparse.watermarks import hide_watermark_layers, remove_watermark_annotations
+from docuparse.wordboxes import WordBoxes
 
 logger = get_logger()
 
@@ -41,6 +49,10 @@ class FileProcessor(Protocol):  # pylint: disable=too-few-public-methods
         """Process the file and return the extracted data."""
         raise NotImplementedError
 
+    def process_bytes(self, data: bytes, name: str) -> Dict[str, Any]:
+        """Process the in memory file contents and return the extracted data."""
+        raise NotImplementedError
+
 
 class OCRProcessor(Protocol):  # pylint: disable=too-few-public-methods
     """
@@ -54,54 +66,257 @@ class OCRProcessor(Protocol):  # pylint: disable=too-few-public-methods
         raise NotImplementedError
 
 
+def _done(result: dict[str, Any]) -> Future:
+    future: Future = Future()
+    future.set_result(result)
+    return future
+
+
+class TimeBudget:
+    """
+    Wall clock budget for one document.  Once it is spent the remaining images are skipped and marked timed out.
+    """
+
+    def __init__(self, seconds: float = 0):
+        self.deadline = time.perf_counter() + seconds if seconds else 0.0
+        self.exceeded = False
+
+    def spent(self) -> bool:
+        """
+        True once the deadline has passed.
+        """
+        if self.deadline and time.perf_counter() >= self.deadline:
+            self.exceeded = True
+        return self.exceeded
+
+    def timeout(self, image_timeout: float) -> float:
+        """
+        Timeout for the next image: the per image timeout capped by what is left of the document budget.
+        """
+        if not self.deadline:
+            return image_timeout
+        remaining = max(self.deadline - time.perf_counter(), 0.001)
+        return min(image_timeout, remaining) if image_timeout else remaining
+
+    @staticmethod
+    def skipped() -> dict[str, Any]:
+        """
+        Image data for an image that was not recognized because the budget was spent.
+        """
+        return {"text": "", "timed_out": True, "skipped": True}
+
+
+COLORSPACE_COMPONENTS = {"DeviceGray": 1, "CalGray": 1, "DeviceCMYK": 4, "Separation": 1, "Indexed": 1}
+
+
+def pdf_image_memory(image_info: tuple) -> int:
+    """
+    Estimated bytes to decode and recognize an embedded image, from a page.get_images(full=True) entry.
+    """
+    _, smask, width, height, bpc, colorspace = image_info[:6]
+    components = COLORSPACE_COMPONENTS.get(colorspace, 3) + (1 if smask else 0)
+    return image_memory(width, height, components, bpc)
+
+
+def _image_entry(image_data: dict[str, Any]) -> dict[str, Any]:
+    # word boxes are kept once per page, in page coordinates, rather than on each image
+    return {k: v for k, v in image_data.items() if k != "word_boxes"}
+
+
+def merge_pages(pages: list[dict[str, Any]]) -> dict[str, Any]:
+    """
+    Build the processor output from a list of page dicts with images and combined_text.
+    """
+    comb = ""
+    for ct in [i["combined_text"] for i in pages]:
+        comb += " ".join(ct)
+    return {"merged_text": comb, "pages_data": pages}
+
+
 class PDFProcessor:  # pylint: disable=too-few-public-methods
     """
     File processor for pdf's.
     process_file for pages -> process_page for text | images -> process_images for text
+    With a raster_cache, decoded images are kept on disk and later runs over the same files read them back
+    instead of decoding them again.  With word_boxes, each page also keeps the boxes of its native and ocr words
+    under "words", in page points.  With remove_watermarks, watermark layers are switched off and watermark and
+    stamp annotations dropped before extraction; None takes the REMOVE_WATERMARKS setting.
     """
 
-    def __init__(self, ocr_engine: OCREngine):
+    def __init__(
+        self,
+        ocr_engine: OCRPool | OCREngine,
+        document_timeout: float = 0,
+        raster_cache: RasterCache | None = None,
+        word_boxes: bool = True,
+        remove_watermarks: bool | None = None,
+    ):  # pylint: disable=too-many-arguments
         self.text: dict[str, list[str]] = {}
-        self.ocr_engine = ocr_engine
+        self.ocr_engine = ocr_engine if isinstance(ocr_engine, OCRPool) else OCRPool(engine=ocr_engine)
+        self.document_timeout = document_timeout
+        self.raster_cache = raster_cache
+        self.word_boxes = word_boxes
+        self.remove_watermarks = config.remove_watermarks if remove_watermarks is None else remove_watermarks
 
-    def _process_image(self, image: pymupdf.Pixmap, file_name: str = "") -> dict[str, Any]:
+    @staticmethod
+    def _pil_image(image: pymupdf.Pixmap) -> Image.Image | None:
+        """
+        RGB copy of a pixmap, built straight from its samples rather than through a png encode and decode.
+        Stencil masks, such as JBIG2 masks, have no colorspace and one sample per pixel and are returned as L.
+        """
         try:
-            with Image.open(io.BytesIO(image.tobytes())) as pil_image:
-                if pil_image.mode != "RGB":
-                    pil_image = pil_image.convert("RGB")
-                # ocr_image = self.ocr_image(pil_image)
-                image_text = self.ocr_engine.perform_ocr(pil_image, file_name)
-                # image_text = re.sub(r"[^A-Za-z0-9]+", " ", ocr_image)
+            if image.colorspace is None:
+                return Image.frombytes("L", (image.width, image.height), image.samples_mv)
+            if image.alpha:
+                image = pymupdf.Pixmap(image, 0)
+            if image.colorspace is None or image.colorspace.n != 3:
+                image = pymupdf.Pixmap(pymupdf.csRGB, image)
+            return Image.frombytes("RGB", (image.width, image.height), image.samples_mv)
         except (OSError, RuntimeError, ValueError, FzErrorArgument) as e:
             if "unsupported colorspace for" in str(e):
                 logger.error(f"{e}")
-                return {"text": ""}
+                return None
             logger.error(e)
-            # raise e
-            return {"text": ""}
+            return None
 
-        return image_text
+    def _decode(self, doc: pymupdf.Document, xref: int, source_hash: str = "") -> Image.Image | None:
+        """
+        The RGB image at xref, from the raster cache when it holds it.
+        """
+        cache = self.raster_cache
+        if cache is None or not source_hash:
+            return self._pil_image(pymupdf.Pixmap(doc, xref))
+        key = cache.key(source_hash, xref)
+        pil_image = cache.get(key)
+        if pil_image is None:
+            pil_image = self._pil_image(pymupdf.Pixmap(doc, xref))
+            if pil_image is not None:
+                cache.put(key, pil_image)
+        return pil_image
+
+    def _process_image(
+        self, pil_image: Image.Image | None, file_name: str = "", timeout: float | None = None
+    ) -> Future:
+        if pil_image is None:
+            return _done({"text": ""})
+        return self.ocr_engine.submit(pil_image, file_name, timeout)
 
-    def _process_page(self, page: pymupdf.Page, doc: pymupdf.Document, file_name: str = "") -> dict[str, Any]:
+    def _submit_image(
+        self,
+        doc: pymupdf.Document,
+        image_info: tuple,
+        file_name: str,
+        timeout: float | None = None,
+        source_hash: str = "",
+    ) -> Future:
+        """
+        Decode and submit one embedded image once its estimated memory fits the pool memory budget.
+        The reservation is returned when recognition finishes.
+        """
+        memory = self.ocr_engine.memory
+        nbytes = memory.acquire(pdf_image_memory(image_info))
+        try:
+            future = self._process_image(self._decode(doc, image_info[0], source_hash), file_name, timeout)
+        except BaseException:
+            memory.release(nbytes)
+            raise
+        future.add_done_callback(lambda _: memory.release(nbytes))
+        return future
+
+    @staticmethod
+    def _image_result(future: Future) -> dict[str, Any]:
+        try:
+            return future.result()
+        except (OSError, RuntimeError, ValueError) as e:
+            logger.error(e)
+            return {"text": ""}
+
+    def _process_page(
+        self,
+        page: pymupdf.Page,
+        doc: pymupdf.Document,
+        file_name: str = "",
+        budget: TimeBudget | None = None,
+        source_hash: str = "",
+        hidden_layers: bool = False,
+    ) -> dict[str, Any]:  # pylint: disable=too-many-arguments
         """
         Given a page:
             text = []
             construct a list of page.get_text()
             for each image in page, ocr and append to text
+        Images are decoded here and recognized on the ocr pool.  Decoding waits while the images already in
+        flight would push the pool over its memory budget.  With hidden_layers, images only drawn in switched
+        off layers are skipped.
         """
-        image_text: list[dict] = []
-        for image in page.get_images():
+        budget = budget or TimeBudget()
+        pending: list[Future] = []
+        watermarks: dict[str, Any] = {}
+        if self.remove_watermarks and (annotations := remove_watermark_annotations(page)):
+            watermarks["annotations"] = annotations
+        images = page.get_images(full=True)
+        if hidden_layers:
+            drawn = {info["xref"] for info in page.get_image_info(xrefs=True)}
+            if hidden := [i for i in images if i[0] not in drawn]:
+                watermarks["hidden_images"] = len(hidden)
+                images = [i for i in images if i[0] in drawn]
+        for image in images:
+            if budget.spent():
+                pending.append(_done(budget.skipped()))
+                continue
             try:
-                image_text.append(self._process_image(pymupdf.Pixmap(doc, image[0]), file_name))
+                timeout = budget.timeout(self.ocr_engine.timeout)
+                pending.append(self._submit_image(doc, image, file_name, timeout, source_hash))
             except (OSError, RuntimeError, ValueError) as e:
                 logger.error(e)
                 raise e
+        image_text: list[dict] = [self._image_result(i) for i in pending]
         # page_dict = {page_number: {"images": image_text}}
         all_text = [i["text"] for i in image_text]
         all_text.append(page.get_text())
-        page_dict = {"images": image_text, "combined_text": all_text}
+        page_dict = {"images": [_image_entry(i) for i in image_text], "combined_text": all_text}
+        if self.word_boxes:
+            page_dict["words"] = self._page_words(page, images, image_text).to_dict()
+        if watermarks:
+            page_dict["watermarks"] = watermarks
         return page_dict
 
+    @staticmethod
+    def _page_words(page: pymupdf.Page, images: list[tuple], image_text: list[dict]) -> WordBoxes:
+        """
+        Native words of page followed by the ocr words of each image, mapped from image pixels onto the first
+        rect the image is drawn in.
+        """
+        parts = [WordBoxes.from_pymupdf(page.get_text("words"))]
+        for info, data in zip(images, image_text):
+            boxes = data.get("word_boxes")
+            if not boxes:
+                continue
+            rects = page.get_image_rects(info[0])
+            if rects:
+                parts.append(boxes.placed((info[2], info[3]), tuple(rects[0])))
+        return WordBoxes.concat(parts)
+
+    def _process_document(self, doc: pymupdf.Document, name: str, source_hash: str = "") -> dict[str, Any]:
+        text_dat = []
+        budget = TimeBudget(self.document_timeout)
+        hidden_layers = hide_watermark_layers(doc) if self.remove_watermarks else []
+        try:
+            for page in doc:
+                text_dat.append(
+                    self._process_page(page, doc, name, budget, source_hash, bool(hidden_layers))  # type: ignore
+                )
+                # text_dat.extend(page_text)
+        finally:
+            self.ocr_engine.end_document(name)
+        result = merge_pages(text_dat)
+        if hidden_layers:
+            result["watermark_layers"] = hidden_layers
+        if budget.exceeded:
+            logger.warning(f"{name} ran over its {self.document_timeout}s budget")
+            result["document_timed_out"] = True
+        return result
+
     def process_file(self, file_path: pathlib.Path | str) -> dict[str, Any]:
         """
         Process the PDF file and return the extracted text and images.
@@ -116,38 +331,100 @@ class PDFProcessor:  # pylint: disable=too-few-public-methods
         if isinstance(file_path, str):
             file_path = pathlib.Path(file_path)
 
-        text_dat = []
         try:
+            source_hash = ""
+            if self.raster_cache is not None:
+                with open(file_path, "rb") as f:
+                    source_hash = hashlib.file_digest(f, "sha256").hexdigest()
             with pymupdf.open(file_path) as doc:
-                for page in doc:
-                    text_dat.append(self._process_page(page, doc, str(file_path)))  # type: ignore
-                    # text_dat.extend(page_text)
+                return self._process_document(doc, str(file_path), source_hash)
         except (OSError, RuntimeError, ValueError) as e:
             handle_file_exceptions(e, str(file_path.resolve()))
 
-        # logger.info(f"{file_path} has {len(text_dat)} instances of extracted text.")
-        # text = {str(file_path.resolve()): text_dat}
-        # self.text = text
-        comb = ""
-        for ct in [i["combined_text"] for i in text_dat]:
-            comb += " ".join(ct)
-        results = {"merged_text": comb, "pages_data": text_dat}
-        return results
+    def process_bytes(self, data: bytes, name: str) -> dict[str, Any]:
+        """
+        Process a pdf held in memory, such as an archive member.  name identifies the document.
+        """
+        try:
+            source_hash = hashlib.sha256(data).hexdigest() if self.raster_cache is not None else ""
+            with pymupdf.open(stream=data, filetype="pdf") as doc:
+                return self._process_document(doc, name, source_hash)
+        except (OSError, RuntimeError, ValueError) as e:
+            handle_file_exceptions(e, name)
 
 
 class ImageProcessor:  # pylint: disable=too-few-public-methods
     """
     file processor for images.
-    Includes the ocr processor.
+    Images go through the same ocr pool as pdf images and produce the same output, one page per frame.
+    Multi-frame images such as tiff are streamed a frame at a time with at most one frame per ocr worker in flight.
+    With word_boxes, each page keeps the boxes of its ocr words under "words", in pixels.
     """
 
+    def __init__(
+        self, ocr_engine: OCRPool | OCREngine | None = None, document_timeout: float = 0, word_boxes: bool = True
+    ):
+        if ocr_engine is None:
+            ocr_engine = OCRPool()
+        self.ocr_engine = ocr_engine if isinstance(ocr_engine, OCRPool) else OCRPool(engine=ocr_engine)
+        self.document_timeout = document_timeout
+        self.word_boxes = word_boxes
+
+    @staticmethod
+    def frames(image: Image.Image) -> Iterator[Image.Image]:
+        """
+        Yield each frame of image as an independent RGB image.
+        """
+        for frame in ImageSequence.Iterator(image):
+            yield frame.convert("RGB")
+
+    @staticmethod
+    def frame_memory(frame: Image.Image) -> int:
+        """
+        Estimated bytes to decode and recognize frame, from its header.
+        """
+        return image_memory(frame.width, frame.height, len(frame.getbands()))
+
     def ocr_image(self, image: pathlib.Path | str | Image.Image) -> str:
         """
         run ocr on the image
         """
-        img = Image.open(image)
-        text = pytesseract.image_to_string(img)
-        return text
+        if isinstance(image, Image.Image):
+            return self.ocr_engine.perform_ocr(image.convert("RGB"))["text"]
+        with Image.open(image) as img:
+            return " ".join(self.ocr_engine.perform_ocr(frame)["text"] for frame in self.frames(img))
+
+    def _process_image_file(self, img: Image.Image, name: str) -> dict[str, Any]:
+        pages: list[dict[str, Any]] = []
+        pending: deque[Future] = deque()
+        budget = TimeBudget(self.document_timeout)
+        memory = self.ocr_engine.memory
+        try:
+            for frame in ImageSequence.Iterator(img):
+                if budget.spent():
+                    pending.append(_done(budget.skipped()))
+                else:
+                    nbytes = memory.acquire(self.frame_memory(frame))
+                    try:
+                        future = self.ocr_engine.submit(
+                            frame.convert("RGB"), name, budget.timeout(self.ocr_engine.timeout)
+                        )
+                    except BaseException:
+                        memory.release(nbytes)
+                        raise
+                    future.add_done_callback(lambda _, n=nbytes: memory.release(n))
+                    pending.append(future)
+                if len(pending) >= self.ocr_engine.workers:
+                    pages.append(self._page(pending.popleft()))
+            while pending:
+                pages.append(self._page(pending.popleft()))
+        finally:
+            self.ocr_engine.end_document(name)
+        result = merge_pages(pages)
+        if budget.exceeded:
+            logger.warning(f"{name} ran over its {self.document_timeout}s budget")
+            result["document_timed_out"] = True
+        return result
 
     def process_file(self, file_path: pathlib.Path | str) -> Dict[str, Any]:
         """
@@ -155,5 +432,26 @@ class ImageProcessor:  # pylint: disable=too-few-public-methods
         """
         if isinstance(file_path, str):
             file_path = pathlib.Path(file_path)
-        text = self.ocr_image(file_path)
-        return {"text": text}
+
+        try:
+            with Image.open(file_path) as img:
+                return self._process_image_file(img, str(file_path))
+        except (OSError, RuntimeError, ValueError) as e:
+            handle_file_exceptions(e, str(file_path.resolve()))
+
+    def process_bytes(self, data: bytes, name: str) -> Dict[str, Any]:
+        """
+        Process an image held in memory, such as an archive member.  name identifies the document.
+        """
+        try:
+            with Image.open(io.BytesIO(data)) as img:
+                return self._process_image_file(img, name)
+        except (OSError, RuntimeError, ValueError) as e:
+            handle_file_exceptions(e, name)
+
+    def _page(self, future: Future) -> dict[str, Any]:
+        image_data = future.result()
+        page = {"images": [_image_entry(image_data)], "combined_text": [image_data["text"]]}
+        if self.word_boxes:
+            page["words"] = (image_data.get("word_boxes") or WordBoxes.empty()).to_dict()
+        return page
@@ -0,0 +1,152 @@
+"""
+On disk cache of decoded pdf images.
+
+Recognizing an embedded image means opening the pdf, extracting its Pixmap and converting it to RGB before
+tesseract sees it.  When the same documents are run again with other ocr settings, that decoding is repeated
+for every image.  RasterCache keeps the decoded RGB pixels as .npy files keyed by the hash of the pdf, the image
+xref and the decode transform, so a re-run reads them back with a memory map and goes straight to recognition.
+Pages are shared with the page cache rather than copied into each worker.
+
+The cache is bounded by size.  A hit touches the file's modification time and eviction removes the least
+recently used files first.  Worker processes share a cache directory; each tracks what it wrote since it last
+scanned the directory, so the bound is enforced at every scan rather than exactly.
+"""
+
+import hashlib
+import os
+import pathlib
+from dataclasses import dataclass
+
+import numpy as np
+from PIL import Image
+
+from docuparse import get_logger
+
+logger = get_logger()
+
+# how images are normalized before they are cached.  Change it when the decoding changes so old entries miss.
+DECODE_TRANSFORM = "rgb8/1"
+# an eviction pass frees space down to this fraction of the bound, so it does not run on every write
+EVICT_TO = 0.9
+
+
+@dataclass
+class CacheStats:
+    """
+    What a cache has served since it was opened.
+    """
+
+    hits: int = 0
+    misses: int = 0
+    evicted: int = 0
+
+    def describe(self) -> str:
+        """
+        One line summary.
+        """
+        return f"raster cache hits: {self.hits}, misses: {self.misses}, evicted: {self.evicted}"
+
+
+class RasterCache:
+    """
+    Size bounded, least recently used cache of decoded images in a directory.
+
+    Args:
+        directory: where cached images are kept.  Created if missing.
+        max_bytes: bound on the size of the cached files.  0 for no bound.
+        transform: the decode settings, part of every key.
+    """
+
+    def __init__(self, directory: str | pathlib.Path, max_bytes: int = 0, transform: str = DECODE_TRANSFORM):
+        self.directory = pathlib.Path(directory)
+        self.directory.mkdir(parents=True, exist_ok=True)
+        self.max_bytes = max_bytes
+        self.transform = transform
+        self.stats = CacheStats()
+        self._bytes: int | None = None
+
+    def key(self, source_hash: str, xref: int) -> str:
+        """
+        Cache key of the image at xref in the pdf whose contents hash to source_hash.
+        """
+        return hashlib.sha256(f"{source_hash}:{xref}:{self.transform}".encode()).hexdigest()
+
+    def _path(self, key: str) -> pathlib.Path:
+        return self.directory / key[:2] / f"{key}.npy"
+
+    def get(self, key: str) -> Image.Image | None:
+        """
+        The cached image for key, backed by a read only memory map of the cache file, or None.
+        """
+        path = self._path(key)
+        try:
+            pixels = np.load(path, mmap_mode="r")
+            os.utime(path)
+        except (OSError, ValueError) as e:
+            if not isinstance(e, FileNotFoundError):
+                logger.warning(f"unreadable raster cache entry {path}: {e}")
+            self.stats.misses += 1
+            return None
+        self.stats.hits += 1
+        height, width = pixels.shape[:2]
+        return Image.frombuffer("RGB", (width, height), pixels, "raw", "RGB", 0, 1)
+
+    def put(self, key: str, image: Image.Image) -> None:
+        """
+        Cache an RGB image under key.  The file is written aside and renamed into place so readers never see
+        part of it.
+        """
+        path = self._path(key)
+        path.parent.mkdir(exist_ok=True)
+        partial = path.with_name(f"{path.name}.{os.getpid()}.tmp")
+        try:
+            with open(partial, "wb") as f:
+                np.save(f, np.asarray(image.convert("RGB")), allow_pickle=False)
+            os.replace(partial, path)
+        except OSError as e:
+            logger.warning(f"could not cache raster {key}: {e}")
+            partial.unlink(missing_ok=True)
+            return
+        if self.max_bytes:
+            if self._bytes is None:
+                self._bytes = self.size()
+            else:
+                self._bytes += path.stat().st_size
+            if self._bytes > self.max_bytes:
+                self.evict()
+
+    def _entries(self) -> list[tuple[float, int, pathlib.Path]]:
+        entries = []
+        for path in self.directory.glob("*/*.npy"):
+            try:
+                stat = path.stat()
+            except FileNotFoundError:  # evicted by another process
+                continue
+            entries.append((stat.st_mtime, stat.st_size, path))
+        return entries
+
+    def size(self) -> int:
+        """
+        Bytes of cached images.
+        """
+        return sum(size for _, size, _ in self._entries())
+
+    def evict(self) -> int:
+        """
+        Remove the least recently used images until the cache is below its bound.  Returns the bytes freed.
+        Images already mapped by a reader stay readable until it lets them go.
+        """
+        entries = sorted(self._entries())
+        total = sum(size for _, size, _ in entries)
+        target = int(self.max_bytes * EVICT_TO)
+        freed = 0
+        for _, size, path in entries:
+            if total - freed <= target:
+                break
+            path.unlink(missing_ok=True)
+            freed += size
+            self.stats.evicted += 1
+        self._bytes = total - freed
+        if freed:
+            logger.info(f"raster cache evicted {freed} bytes from {self.directory}")
+        return freed
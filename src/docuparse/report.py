@@ -0,0 +1,129 @@
+"""
+Run report.  Collects what a docuparse run planned and what it did.
+"""
+
+from dataclasses import asdict, dataclass, field
+from typing import Any
+
+from docuparse.memory import MB
+
+
+@dataclass
+class RunReport:  # pylint: disable=too-many-instance-attributes
+    """
+    Summary of one run over a container.
+
+    Attributes:
+        source (str): The directory or archive that was processed.
+        workers (int): Number of worker processes.
+        layout (str): How the cpu budget was split between workers and tesseract threads.
+        documents (int): Documents selected for processing.
+        written (int): Documents written by at least one writer.
+        estimated_cost (float): Sum of the estimated seconds of work over all documents.
+        predicted_seconds (float): Predicted wall clock seconds for the schedule.
+        elapsed_seconds (float): Measured wall clock seconds.
+        stragglers (list): Documents that ran over their document budget or had images killed for running over
+            the per image timeout.
+        memory_limit_mb (int): Decoded image memory allowed in flight over the run.  0 for no bound.
+        peak_rss_mb (float): Peak resident memory of the parent process.
+        peak_child_rss_mb (float): Peak resident memory of the largest worker or tesseract process.
+        duplicates (list): (document, document it duplicates, similarity) for documents linked instead of processed.
+        mongo_pools (dict): Connection pool use of each shared mongo client, keyed by host.
+        watermarks (dict): Images with a watermark overlay masked, pdf watermark layers switched off and watermark
+            or stamp annotations dropped.
+    """
+
+    source: str
+    workers: int = 1
+    layout: str = ""
+    documents: int = 0
+    written: int = 0
+    estimated_cost: float = 0.0
+    predicted_seconds: float = 0.0
+    elapsed_seconds: float = 0.0
+    dry_run: bool = False
+    largest: list[tuple[str, float]] = field(default_factory=list)
+    stragglers: list[dict[str, Any]] = field(default_factory=list)
+    memory_limit_mb: int = 0
+    peak_rss_mb: float = 0.0
+    peak_child_rss_mb: float = 0.0
+    duplicates: list[tuple[str, str, float]] = field(default_factory=list)
+    mongo_pools: dict[str, dict[str, int]] = field(default_factory=dict)
+    watermarks: dict[str, int] = field(default_factory=lambda: {"images": 0, "layers": 0, "annotations": 0})
+
+    def as_dict(self) -> dict[str, Any]:
+        """
+        The report as a plain dict.
+        """
+        return asdict(self)
+
+    def add_document(self, doc_id: str, result: dict[str, Any]) -> None:
+        """
+        Record a processed document, counting the watermarks taken out of it and noting it as a straggler when
+        any part of it timed out.
+        """
+        pages = result.get("pages_data", [])
+        images = [i for page in pages for i in page.get("images", [])]
+        self.watermarks["images"] += sum(1 for i in images if i.get("watermark", {}).get("detected"))
+        self.watermarks["layers"] += len(result.get("watermark_layers", []))
+        self.watermarks["annotations"] += sum(len(p.get("watermarks", {}).get("annotations", [])) for p in pages)
+        timed_out = sum(1 for i in images if i.get("timed_out"))
+        if timed_out or result.get("document_timed_out"):
+            self.stragglers.append(
+                {
+                    "doc_id": doc_id,
+                    "seconds": result.get("processing_seconds", 0.0),
+                    "timed_out_images": timed_out,
+                    "skipped_images": sum(1 for i in images if i.get("skipped")),
+                    "document_timed_out": bool(result.get("document_timed_out")),
+                }
+            )
+
+    def record_peak_memory(self, self_bytes: int, child_bytes: int) -> None:
+        """
+        Record peak resident memory, in bytes, of this process and of its largest child.
+        """
+        self.peak_rss_mb = round(self_bytes / MB, 1)
+        self.peak_child_rss_mb = round(child_bytes / MB, 1)
+
+    def summary(self) -> str:
+        """
+        Human readable summary.
+        """
+        lines = [
+            f"source: {self.source}",
+            f"documents: {self.documents} on {self.workers} worker(s)",
+            f"cpu layout: {self.layout}",
+            f"estimated cost: {self.estimated_cost:.1f}s of work, predicted run time {self.predicted_seconds:.1f}s",
+        ]
+        if self.duplicates:
+            lines.append(f"duplicates: {len(self.duplicates)} linked instead of processed")
+            for name, original, score in self.duplicates:
+                lines.append(f"  {name} -> {original} ({score:.2f})")
+        if self.largest:
+            lines.append("largest: " + ", ".join(f"{name} ({cost:.1f}s)" for name, cost in self.largest))
+        if not self.dry_run:
+            lines.append(f"written: {self.written} in {self.elapsed_seconds:.1f}s")
+            lines.append(
+                f"peak memory: {self.peak_rss_mb:.0f}MB, largest child {self.peak_child_rss_mb:.0f}MB"
+                + (f", image limit {self.memory_limit_mb}MB" if self.memory_limit_mb else "")
+            )
+        if any(self.watermarks.values()):
+            lines.append(
+                f"watermarks: {self.watermarks['images']} image overlay(s) masked, {self.watermarks['layers']} layer(s)"
+                f" switched off, {self.watermarks['annotations']} annotation(s) dropped"
+            )
+        for host, pool in self.mongo_pools.items():
+            lines.append(
+                f"mongo pool {host}: peak {pool['peak_checked_out']}/{pool['max_pool_size']} connections in use,"
+                f" {pool['checkouts']} checkouts, peak {pool['peak_waiting']} waiting, {pool['failed_checkouts']} failed"
+            )
+        if self.stragglers:
+            lines.append(f"stragglers: {len(self.stragglers)}")
+            for s in self.stragglers:
+                lines.append(
+                    f"  {s["doc_id"]}: {s["seconds"]:.1f}s, {s["timed_out_images"]} image(s) timed out"
+                    f" ({s["skipped_images"]} skipped)"
+                    + (", document budget exceeded" if s["document_timed_out"] else "")
+                )
+        return "\n".join(lines)
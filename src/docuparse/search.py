@@ -0,0 +1,423 @@
+"""
+Full text search over processed documents.
+
+Two backends share the same results: mongo text indexes, managed by MongoDBDataReader, for searching the live
+collection, and LocalIndex, an on disk inverted index over pages for offline use.  The local index keeps its
+postings in one flat file and its terms in a sorted lexicon, both memory mapped at search time, so only the
+lexicon pages bisected to and the postings of the query terms are paged in, and opening an index over millions of
+pages reads neither.  Pages are ranked with BM25 and
+results are grouped by document with the matching page numbers.
+"""
+
+import heapq
+import itertools
+import json
+import math
+import mmap
+import pathlib
+import re
+import shutil
+from array import array
+from dataclasses import dataclass, field
+from typing import Any, Iterable, Iterator
+
+from docuparse import get_logger
+
+logger = get_logger()
+
+TOKEN = re.compile(r"\w+")
+SEGMENT_POSTINGS = 5_000_000
+# lexicon entries buffered before they are written
+LEXICON_BUFFER = 65536
+
+
+def tokenize(text: str) -> list[str]:
+    """
+    Lower cased word tokens of text.
+    """
+    return TOKEN.findall(text.lower())
+
+
+def page_texts(document: dict[str, Any]) -> list[str]:
+    """
+    The text of each page of a processed document: native text and the ocr text of its images.
+    """
+    return [" ".join(page.get("combined_text", [])) for page in document.get("pages_data", [])]
+
+
+@dataclass
+class PageHit:
+    """
+    A page that matched a query.  page is zero based.
+    """
+
+    page: int
+    score: float
+    snippet: str = ""
+
+
+@dataclass
+class SearchResult:
+    """
+    A matching document with its score and matching pages, best page first.
+    """
+
+    doc_id: str
+    score: float
+    pages: list[PageHit] = field(default_factory=list)
+
+    def describe(self) -> str:
+        """
+        One line per document followed by one line per page hit.
+        """
+        lines = [f"{self.score:8.3f}  {self.doc_id}"]
+        for hit in self.pages:
+            lines.append(
+                f"          page {hit.page + 1} ({hit.score:.3f})" + (f": {hit.snippet}" if hit.snippet else "")
+            )
+        return "\n".join(lines)
+
+
+def snippet(text: str, terms: set[str], width: int = 60) -> str:
+    """
+    The text around the first occurrence of any of terms.
+    """
+    for match in TOKEN.finditer(text):
+        if match.group().lower() in terms:
+            start = max(0, match.start() - width // 2)
+            return " ".join(text[start : start + width].split())
+    return ""
+
+
+def page_hits(pages: list[str], query: str, limit: int = 5) -> list[PageHit]:
+    """
+    Score pages of one document by query term frequency.  Used for the page locations of mongo text results,
+    which are scored per document.
+    """
+    terms = set(tokenize(query))
+    hits = []
+    for number, text in enumerate(pages):
+        count = sum(1 for t in tokenize(text) if t in terms)
+        if count:
+            hits.append(PageHit(number, float(count), snippet(text, terms)))
+    return heapq.nlargest(limit, hits, key=lambda h: h.score)
+
+
+def _write_lexicon(directory: pathlib.Path, entries: Iterable[tuple[str, int, int]]) -> None:
+    """
+    Write (term, postings offset, pages) entries, in term order, as terms.bin, the utf8 terms one after another,
+    and lexicon.bin, a (term offset, postings offset, pages) uint64 triple per term.
+    """
+    with open(directory / "terms.bin", "wb") as terms, open(directory / "lexicon.bin", "wb") as table:
+        position = 0
+        buffer = array("Q")
+        for term, offset, pages in entries:
+            encoded = term.encode("utf8")
+            terms.write(encoded)
+            buffer.extend((position, offset, pages))
+            position += len(encoded)
+            if len(buffer) >= LEXICON_BUFFER * 3:
+                buffer.tofile(table)
+                buffer = array("Q")
+        buffer.tofile(table)
+
+
+class Lexicon:
+    """
+    The sorted term -> (postings offset, pages) table of an index or segment directory.  Its files are memory
+    mapped and terms are found by bisection, so opening it reads nothing.  A lexicon.json written by earlier
+    versions is converted on open.
+    """
+
+    def __init__(self, path: pathlib.Path):
+        legacy = path / "lexicon.json"
+        if legacy.exists() and not (path / "lexicon.bin").exists():
+            entries = json.loads(legacy.read_text(encoding="utf8"))
+            _write_lexicon(path, ((term, *entries[term]) for term in sorted(entries)))
+            legacy.unlink()
+        names = ("terms.bin", "lexicon.bin")
+        self._files = [open(path / name, "rb") for name in names]  # pylint: disable=consider-using-with
+        # empty files cannot be mapped
+        empty = not (path / "lexicon.bin").stat().st_size
+        self._maps = [] if empty else [mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) for f in self._files]
+        terms, table = self._maps or (b"", b"")
+        self._terms = memoryview(terms)
+        self._table = memoryview(table).cast("Q")
+        self._count = len(self._table) // 3
+
+    def __len__(self) -> int:
+        return self._count
+
+    def _term(self, i: int) -> bytes:
+        end = self._table[i * 3 + 3] if i + 1 < self._count else len(self._terms)
+        return bytes(self._terms[self._table[i * 3] : end])
+
+    def get(self, term: str, default: Any = None) -> Any:
+        """
+        (postings offset, pages) of term, or default.
+        """
+        key = term.encode("utf8")
+        low, high = 0, self._count
+        while low < high:
+            middle = (low + high) // 2
+            if self._term(middle) < key:
+                low = middle + 1
+            else:
+                high = middle
+        if low < self._count and self._term(low) == key:
+            return self._table[low * 3 + 1], self._table[low * 3 + 2]
+        return default
+
+    def __iter__(self) -> Iterator[tuple[str, int, int]]:
+        """
+        (term, postings offset, pages) in term order.
+        """
+        for i in range(self._count):
+            yield self._term(i).decode("utf8"), self._table[i * 3 + 1], self._table[i * 3 + 2]
+
+    def close(self) -> None:
+        """
+        Release the maps.
+        """
+        self._terms.release()
+        self._table.release()
+        for m in self._maps:
+            m.close()
+        for f in self._files:
+            f.close()
+
+
+def _write_segment(directory: pathlib.Path, postings: dict[str, array]) -> None:
+    """
+    Write term postings as a lexicon and one flat file of (page id, tf) pairs.
+    """
+    directory.mkdir(parents=True, exist_ok=True)
+
+    def entries() -> Iterator[tuple[str, int, int]]:
+        offset = 0
+        with open(directory / "postings.bin", "wb") as f:
+            for term in sorted(postings):
+                values = postings[term]
+                values.tofile(f)
+                yield term, offset, len(values) // 2
+                offset += len(values)
+
+    _write_lexicon(directory, entries())
+
+
+def _tagged(segment: int, lexicon: Lexicon) -> Iterator[tuple[str, int, int, int]]:
+    for term, offset, pages in lexicon:
+        yield term, segment, offset, pages
+
+
+class IndexBuilder:
+    """
+    Builds a LocalIndex.  Postings are accumulated in memory and flushed to sorted segments once
+    segment_postings entries are held, and the segments are merged when the index is finished, so memory stays
+    bounded however many pages are added.
+
+    Args:
+        path: directory of the index.  An existing index there is replaced.
+        segment_postings: postings held in memory before a segment is flushed.
+    """
+
+    def __init__(self, path: str | pathlib.Path, segment_postings: int = SEGMENT_POSTINGS):
+        self.path = pathlib.Path(path)
+        self.segment_postings = segment_postings
+        self.documents: list[str] = []
+        self.pages = array("I")  # (document number, page number, length) per page id
+        self._postings: dict[str, array] = {}
+        self._held = 0
+        self._segments: list[pathlib.Path] = []
+        if self.path.exists():
+            shutil.rmtree(self.path)
+        self.path.mkdir(parents=True)
+
+    def add(self, doc_id: str, pages: Iterable[str]) -> None:
+        """
+        Add a document given the text of each of its pages.
+        """
+        number = len(self.documents)
+        self.documents.append(doc_id)
+        for page_number, text in enumerate(pages):
+            page_id = len(self.pages) // 3
+            tokens = tokenize(text)
+            self.pages.extend((number, page_number, len(tokens)))
+            counts: dict[str, int] = {}
+            for token in tokens:
+                counts[token] = counts.get(token, 0) + 1
+            for token, tf in counts.items():
+                self._postings.setdefault(token, array("I")).extend((page_id, tf))
+            self._held += len(counts)
+            if self._held >= self.segment_postings:
+                self._flush()
+
+    def add_documents(self, documents: Iterable[dict[str, Any]]) -> None:
+        """
+        Add processed documents as stored by the writers, keyed by _id.
+        """
+        for document in documents:
+            self.add(str(document["_id"]), page_texts(document))
+
+    def _flush(self) -> None:
+        if not self._postings:
+            return
+        segment = self.path / f"segment-{len(self._segments)}"
+        _write_segment(segment, self._postings)
+        self._segments.append(segment)
+        self._postings = {}
+        self._held = 0
+
+    def finish(self) -> "LocalIndex":
+        """
+        Merge the segments into the final index and open it.
+        """
+        self._flush()
+        lexicons = [Lexicon(s) for s in self._segments]
+        files = [open(s / "postings.bin", "rb") for s in self._segments]  # pylint: disable=consider-using-with
+
+        def entries() -> Iterator[tuple[str, int, int]]:
+            offset = 0
+            with open(self.path / "postings.bin", "wb") as out:
+                # page ids grow from segment to segment, so concatenating in segment order keeps postings sorted
+                merged = heapq.merge(*(_tagged(i, lexicon) for i, lexicon in enumerate(lexicons)))
+                for term, group in itertools.groupby(merged, key=lambda entry: entry[0]):
+                    count = 0
+                    for _, segment, start, pages in group:
+                        files[segment].seek(start * 4)
+                        out.write(files[segment].read(pages * 8))
+                        count += pages
+                    yield term, offset, count
+                    offset += count * 2
+
+        try:
+            _write_lexicon(self.path, entries())
+        finally:
+            for lexicon in lexicons:
+                lexicon.close()
+            for f in files:
+                f.close()
+        with open(self.path / "pages.bin", "wb") as f:
+            self.pages.tofile(f)
+        total = sum(self.pages[2::3])
+        meta = {"documents": self.documents, "average_length": total / max(1, len(self.pages) // 3)}
+        (self.path / "meta.json").write_text(json.dumps(meta), encoding="utf8")
+        for segment in self._segments:
+            shutil.rmtree(segment)
+        logger.info(f"indexed {len(self.pages) // 3} pages of {len(self.documents)} documents in {self.path}")
+        return LocalIndex(self.path)
+
+
+class LocalIndex:
+    """
+    Read side of an index written by IndexBuilder.
+
+    Args:
+        path: directory of the index.
+        k1: BM25 term frequency saturation.
+        b: BM25 length normalization.
+    """
+
+    def __init__(self, path: str | pathlib.Path, k1: float = 1.2, b: float = 0.75):
+        self.path = pathlib.Path(path)
+        self.k1 = k1
+        self.b = b
+        meta = json.loads((self.path / "meta.json").read_text(encoding="utf8"))
+        self.documents: list[str] = meta["documents"]
+        self.average_length: float = meta["average_length"] or 1.0
+        self.lexicon = self.load_lexicon(self.path)
+        self.pages = array("I")
+        with open(self.path / "pages.bin", "rb") as f:
+            self.pages.frombytes(f.read())
+        self._file = open(self.path / "postings.bin", "rb")  # pylint: disable=consider-using-with
+        size = (self.path / "postings.bin").stat().st_size
+        self._map = mmap.mmap(self._file.fileno(), 0, access=mmap.ACCESS_READ) if size else None
+
+    @staticmethod
+    def load_lexicon(path: pathlib.Path) -> Lexicon:
+        """
+        The lexicon of an index or segment directory.
+        """
+        return Lexicon(path)
+
+    def close(self) -> None:
+        """
+        Release the postings and lexicon maps.
+        """
+        if self._map is not None:
+            self._map.close()
+            self._map = None
+        self._file.close()
+        self.lexicon.close()
+
+    def __enter__(self) -> "LocalIndex":
+        return self
+
+    def __exit__(self, *args: Any) -> None:
+        self.close()
+
+    @property
+    def page_count(self) -> int:
+        """
+        Number of indexed pages.
+        """
+        return len(self.pages) // 3
+
+    def postings(self, term: str) -> Iterator[tuple[int, int]]:
+        """
+        (page id, term frequency) for each page containing term.
+        """
+        entry = self.lexicon.get(term)
+        if not entry or self._map is None:
+            return
+        offset, pages = entry
+        values = memoryview(self._map)[offset * 4 : (offset + pages * 2) * 4].cast("I")
+        try:
+            for i in range(0, len(values), 2):
+                yield values[i], values[i + 1]
+        finally:
+            values.release()
+
+    def score_pages(self, query: str) -> dict[int, float]:
+        """
+        BM25 score of every page matching at least one query term.
+        """
+        scores: dict[int, float] = {}
+        n = self.page_count
+        for term in set(tokenize(query)):
+            df = self.lexicon.get(term, (0, 0))[1]
+            if not df:
+                continue
+            idf = math.log(1 + (n - df + 0.5) / (df + 0.5))
+            for page_id, tf in self.postings(term):
+                length = self.pages[page_id * 3 + 2]
+                norm = tf + self.k1 * (1 - self.b + self.b * length / self.average_length)
+                scores[page_id] = scores.get(page_id, 0.0) + idf * tf * (self.k1 + 1) / norm
+        return scores
+
+    def search(self, query: str, limit: int = 10, pages_per_document: int = 5) -> list[SearchResult]:
+        """
+        Documents matching query, ranked by their best page score, with their best matching pages.
+        """
+        results: dict[int, SearchResult] = {}
+        for page_id, score in self.score_pages(query).items():
+            document, page = self.pages[page_id * 3], self.pages[page_id * 3 + 1]
+            result = results.setdefault(document, SearchResult(self.documents[document], 0.0))
+            result.score = max(result.score, score)
+            result.pages.append(PageHit(page, score))
+        ranked = heapq.nlargest(limit, results.values(), key=lambda r: r.score)
+        for result in ranked:
+            result.pages = heapq.nlargest(pages_per_document, result.pages, key=lambda h: h.score)
+        return ranked
+
+
+def mongo_search(reader: Any, query: str, limit: int = 10, pages_per_document: int = 5) -> list[SearchResult]:
+    """
+    Documents matching query on the collection text index of a MongoDBDataReader, with page hit locations found
+    in the returned pages.
+    """
+    results = []
+    for document in reader.text_search(query, limit, {"pages_data.combined_text": 1}):
+        hits = page_hits(page_texts(document), query, pages_per_document)
+        results.append(SearchResult(str(document["_id"]), document["score"], hits))
+    return results
@@ -0,0 +1,352 @@
+"""
+Local ocr service.
+
+Calling main.py for one document pays for the imports, the nltk word list, the mongo client and the tesseract
+setup every time.  OCRService keeps them loaded: documents are processed on the warm worker pool of a container,
+or in the serving process with one worker.  Requests beyond the pool's concurrency wait in a bounded queue and
+are turned away with 503 once it is full.
+
+ServiceHTTPServer serves it over http on localhost, UnixServiceServer over a unix socket:
+
+    POST /process?name=plat.pdf[&store=1]   body: the pdf or image.  Returns the processed document as json.
+                                            Stored uploads without a name are keyed by their sha256.
+    GET  /health                            workers, documents in flight and queued.
+    GET  /metrics                           request counts and latency percentiles.
+
+Every processed response carries its queue, processing and total seconds in X-Queue-Seconds,
+X-Process-Seconds and X-Total-Seconds.
+"""
+
+import base64
+import contextlib
+import hashlib
+import json
+import pathlib
+import socketserver
+import threading
+import time
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+from dataclasses import dataclass, field
+from http import HTTPStatus
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Any
+from urllib.parse import parse_qs, urlparse
+
+from docuparse import get_logger
+from docuparse.containers import DataContainer
+from docuparse.ocr import english_words
+
+logger = get_logger()
+
+# leading bytes of the formats the default processors read, for uploads without a name
+SIGNATURES = {b"%PDF": ".pdf", b"\x89PNG": ".png", b"\xff\xd8\xff": ".jpg", b"II*\x00": ".tif", b"MM\x00*": ".tif"}
+# largest upload accepted
+MAX_UPLOAD_BYTES = 256 * 1024 * 1024
+# requests whose latencies the metrics are computed over
+LATENCY_WINDOW = 1000
+
+
+class ServiceBusy(Exception):
+    """
+    The queue is full, or a request waited in it longer than the queue timeout.
+    """
+
+
+def sniff_suffix(data: bytes) -> str:
+    """
+    File suffix of data from its leading bytes, or "" when it is not a known format.
+    """
+    for signature, suffix in SIGNATURES.items():
+        if data.startswith(signature):
+            return suffix
+    return ""
+
+
+def _json_default(value: Any) -> Any:
+    # word confidences and word boxes are packed bytes
+    if isinstance(value, (bytes, bytearray)):
+        return base64.b64encode(value).decode("ascii")
+    return str(value)
+
+
+@dataclass
+class Timing:
+    """
+    Seconds one request spent queued, processing and in total.
+    """
+
+    queue: float = 0.0
+    process: float = 0.0
+    total: float = 0.0
+
+    def headers(self) -> dict[str, str]:
+        """
+        The response headers reporting it.
+        """
+        return {
+            "X-Queue-Seconds": f"{self.queue:.3f}",
+            "X-Process-Seconds": f"{self.process:.3f}",
+            "X-Total-Seconds": f"{self.total:.3f}",
+        }
+
+
+@dataclass
+class ServiceStats:
+    """
+    Request counts since the service started and the timings of the latest requests.
+    """
+
+    processed: int = 0
+    rejected: int = 0
+    failed: int = 0
+    timings: deque[Timing] = field(default_factory=lambda: deque(maxlen=LATENCY_WINDOW))
+
+    def as_dict(self) -> dict[str, Any]:
+        """
+        Counts and the p50, p95 and max of each timing.
+        """
+        summary: dict[str, Any] = {"processed": self.processed, "rejected": self.rejected, "failed": self.failed}
+        timings = list(self.timings)
+        for name in ("queue", "process", "total"):
+            ordered = sorted(getattr(t, name) for t in timings)
+            if ordered:
+                summary[f"{name}_seconds"] = {
+                    "p50": round(ordered[len(ordered) // 2], 3),
+                    "p95": round(ordered[min(len(ordered) - 1, int(0.95 * len(ordered)))], 3),
+                    "max": round(ordered[-1], 3),
+                }
+        return summary
+
+
+class OCRService:
+    """
+    Processes uploaded documents with the processors of a container, keeping them loaded between requests.
+
+    Args:
+        container: supplies the processors, the worker layout and, for stored documents, the writers.
+        max_queue: requests allowed to wait for a worker before new ones are turned away.
+        queue_timeout: seconds a request may wait for a worker.  0 waits as long as it takes.
+    """
+
+    def __init__(self, container: DataContainer, max_queue: int = 16, queue_timeout: float = 60.0):
+        self.container = container
+        self.layout = container.layout()
+        self.concurrency = max(1, self.layout.workers)
+        self.max_queue = max_queue
+        self.queue_timeout = queue_timeout
+        self.stats = ServiceStats()
+        self.in_flight = 0
+        self.queued = 0
+        self._slots = threading.Condition()
+        self._stats_lock = threading.Lock()
+        self._executor: ProcessPoolExecutor | None = None
+        self._limit = contextlib.ExitStack()
+
+    def start(self) -> None:
+        """
+        Start the worker pool and load the word list in every worker.
+        """
+        if self.layout.workers > 1:
+            self._executor = self.container.warm_pool(self.layout)
+            for future in [self._executor.submit(english_words) for _ in range(self.layout.workers)]:
+                future.result()
+        else:
+            self._limit.enter_context(self.layout.limit())
+            english_words()
+        logger.info(f"ocr service ready with {self.layout.describe()}")
+
+    def close(self) -> None:
+        """
+        Shut the worker pool down once the documents in flight are done, and lift the tesseract thread limit.
+        """
+        if self._executor is not None:
+            self._executor.shutdown()
+            self._executor = None
+        self._limit.close()
+
+    def _acquire(self) -> float:
+        """
+        Wait for a free worker and return the seconds waited.
+        """
+        start = time.perf_counter()
+        with self._slots:
+            if self.in_flight >= self.concurrency and self.queued >= self.max_queue:
+                raise ServiceBusy(f"{self.queued} requests are already queued")
+            self.queued += 1
+            try:
+                deadline = start + self.queue_timeout if self.queue_timeout else None
+                while self.in_flight >= self.concurrency:
+                    remaining = None if deadline is None else deadline - time.perf_counter()
+                    if remaining is not None and remaining <= 0:
+                        raise ServiceBusy(f"no worker was free within {self.queue_timeout}s")
+                    self._slots.wait(remaining)
+            finally:
+                self.queued -= 1
+            self.in_flight += 1
+        return time.perf_counter() - start
+
+    def _release(self) -> None:
+        with self._slots:
+            self.in_flight -= 1
+            self._slots.notify()
+
+    def process(self, name: str, data: bytes, store: bool = False) -> tuple[dict[str, Any], Timing]:
+        """
+        Process the document data named name and return it with its timing.  With store, the document is also
+        written by the container writers, replacing what they hold under name.
+        """
+        start = time.perf_counter()
+        try:
+            timing = Timing(queue=self._acquire())
+        except ServiceBusy:
+            with self._stats_lock:
+                self.stats.rejected += 1
+            raise
+        try:
+            if self._executor is not None:
+                _, result = self.container.submit(self._executor, name, data).result()
+            else:
+                _, result = self.container.process_document(name, data)
+        except Exception:
+            with self._stats_lock:
+                self.stats.failed += 1
+            raise
+        finally:
+            self._release()
+        timing.process = time.perf_counter() - start - timing.queue
+        if store:
+            try:
+                for writer in self.container.writers:
+                    writer.write_data({name: result}, force=True)
+            except Exception:
+                with self._stats_lock:
+                    self.stats.failed += 1
+                raise
+        timing.total = time.perf_counter() - start
+        with self._stats_lock:
+            self.stats.processed += 1
+            self.stats.timings.append(timing)
+        return result, timing
+
+    def supports(self, name: str) -> bool:
+        """
+        True when a processor handles documents named name.
+        """
+        return pathlib.PurePosixPath(name).suffix.lower() in self.container.processors
+
+    def health(self) -> dict[str, Any]:
+        """
+        Workers and the documents in flight and queued.
+        """
+        return {"status": "ok", "workers": self.concurrency, "in_flight": self.in_flight, "queued": self.queued}
+
+
+class ServiceHandler(BaseHTTPRequestHandler):
+    """
+    Http front of the OCRService on self.server.service.
+    """
+
+    server_version = "docuparse"
+    protocol_version = "HTTP/1.1"
+
+    @property
+    def service(self) -> OCRService:
+        """
+        The service this handler's server fronts.
+        """
+        return self.server.service  # type: ignore[attr-defined]
+
+    def address_string(self) -> str:
+        # unix socket clients have no address
+        return self.client_address[0] if isinstance(self.client_address, tuple) else "unix"
+
+    def log_message(self, format: str, *args: Any) -> None:  # pylint: disable=redefined-builtin
+        logger.info(f"{self.address_string()} {format % args}")
+
+    def _reply(self, status: HTTPStatus, body: dict[str, Any], headers: dict[str, str] | None = None) -> None:
+        payload = json.dumps(body, default=_json_default).encode("utf8")
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(payload)))
+        for key, value in (headers or {}).items():
+            self.send_header(key, value)
+        self.end_headers()
+        self.wfile.write(payload)
+
+    def _error(self, status: HTTPStatus, message: str, headers: dict[str, str] | None = None) -> None:
+        self._reply(status, {"error": message}, headers)
+
+    def do_GET(self) -> None:  # pylint: disable=invalid-name
+        """
+        Health and metrics.
+        """
+        path = urlparse(self.path).path
+        if path == "/health":
+            self._reply(HTTPStatus.OK, self.service.health())
+        elif path == "/metrics":
+            self._reply(HTTPStatus.OK, self.service.stats.as_dict())
+        else:
+            self._error(HTTPStatus.NOT_FOUND, f"no such path {path}")
+
+    def do_POST(self) -> None:  # pylint: disable=invalid-name
+        """
+        Process the uploaded document.
+        """
+        url = urlparse(self.path)
+        if url.path != "/process":
+            self._error(HTTPStatus.NOT_FOUND, f"no such path {url.path}")
+            return
+        length = int(self.headers.get("Content-Length") or 0)
+        if length > MAX_UPLOAD_BYTES:
+            self.close_connection = True
+            self._error(HTTPStatus.REQUEST_ENTITY_TOO_LARGE, f"uploads are limited to {MAX_UPLOAD_BYTES} bytes")
+            return
+        data = self.rfile.read(length)
+        if not data:
+            self._error(HTTPStatus.BAD_REQUEST, "the request body should be a pdf or image")
+            return
+        query = parse_qs(url.query)
+        suffix = sniff_suffix(data)
+        store = query.get("store", ["0"])[0] not in ("0", "")
+        # stored uploads need an id of their own, or each would replace the last
+        default = f"{hashlib.sha256(data).hexdigest()}{suffix}" if store else f"upload{suffix}"
+        name = query.get("name", [default])[0]
+        if not self.service.supports(name):
+            self._error(HTTPStatus.UNSUPPORTED_MEDIA_TYPE, f"no processor for {name}")
+            return
+        try:
+            result, timing = self.service.process(name, data, store=store)
+        except ServiceBusy as e:
+            self._error(HTTPStatus.SERVICE_UNAVAILABLE, str(e), {"Retry-After": "1"})
+            return
+        except (OSError, RuntimeError, ValueError) as e:
+            self._error(HTTPStatus.UNPROCESSABLE_ENTITY, f"could not process {name}: {e}")
+            return
+        except Exception as e:  # pylint: disable=broad-exception-caught
+            logger.exception(f"failed processing {name}")
+            self._error(HTTPStatus.INTERNAL_SERVER_ERROR, f"internal error processing {name}: {e}")
+            return
+        self._reply(HTTPStatus.OK, result, timing.headers())
+
+
+class ServiceHTTPServer(ThreadingHTTPServer):
+    """
+    Serves an OCRService over tcp.
+    """
+
+    def __init__(self, address: tuple[str, int], service: OCRService):
+        self.service = service
+        super().__init__(address, ServiceHandler)
+
+
+class UnixServiceServer(socketserver.ThreadingMixIn, socketserver.UnixStreamServer):
+    """
+    Serves an OCRService over a unix socket.
+    """
+
+    daemon_threads = True
+
+    def __init__(self, path: str, service: OCRService):
+        self.service = service
+        super().__init__(path, ServiceHandler)
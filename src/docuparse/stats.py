@@ -0,0 +1,254 @@
+"""
+Corpus statistics.
+
+Summaries of the processed collection: pages per document, the ocr quality distribution, how often images were
+found rotated and the slowest documents.  mongo_stats computes them server side in one aggregation over the
+summary fields document_fields stores on every document, so only the aggregates cross the wire and no text is
+read.  local_stats computes the same summaries from a stream of documents, such as the documents of a JSONL
+directory.
+"""
+
+import heapq
+import time
+from dataclasses import asdict, dataclass, field
+from typing import Any, Iterable
+
+from pymongo.errors import OperationFailure
+
+from docuparse import get_logger
+
+logger = get_logger()
+
+# lower bound -> label of the page count and quality buckets; the last bound closes the last bucket
+PAGE_BUCKETS = {0: "0", 1: "1", 2: "2-4", 5: "5-9", 10: "10-19", 20: "20-49", 50: "50-99", 100: "100+"}
+PAGE_BOUNDARIES = [*PAGE_BUCKETS, 10**9]
+QUALITY_BUCKETS = {0.0: "0.0-0.2", 0.2: "0.2-0.4", 0.4: "0.4-0.6", 0.6: "0.6-0.8", 0.8: "0.8-1.0"}
+QUALITY_BOUNDARIES = [*QUALITY_BUCKETS, 1.01]
+UNKNOWN = "unknown"
+
+
+@dataclass
+class CorpusStats:
+    """
+    Summaries of the documents of a collection, duplicate links aside.
+        page_counts, quality: documents per bucket, "unknown" for documents without the field.
+        rotations: images per detected rotation, "unknown" for images without orientation detection.
+        slowest: _id, processing_seconds and page_count of the slowest documents, slowest first.
+        seconds: time taken to compute them.
+    """
+
+    documents: int = 0
+    duplicates: int = 0
+    pages: int = 0
+    min_pages: int | None = None
+    max_pages: int | None = None
+    mean_pages: float | None = None
+    mean_quality: float | None = None
+    processing_seconds: float = 0.0
+    page_counts: dict[str, int] = field(default_factory=lambda: dict.fromkeys(PAGE_BUCKETS.values(), 0))
+    quality: dict[str, int] = field(default_factory=lambda: dict.fromkeys(QUALITY_BUCKETS.values(), 0))
+    rotations: dict[str, int] = field(default_factory=dict)
+    slowest: list[dict[str, Any]] = field(default_factory=list)
+    seconds: float = 0.0
+
+    def as_dict(self) -> dict[str, Any]:
+        """
+        The statistics as plain json serializable values.
+        """
+        return asdict(self)
+
+    def describe(self) -> str:
+        """
+        Human readable summary.
+        """
+
+        def counts(values: dict[str, int]) -> str:
+            return "  ".join(f"{label}: {count}" for label, count in values.items()) or "none"
+
+        lines = [f"documents: {self.documents} ({self.duplicates} duplicate links)"]
+        if self.documents:
+            lines.append(f"pages: {self.pages}, {self.min_pages}-{self.max_pages} per document, mean {self.mean_pages}")
+        lines += [
+            f"pages per document: {counts(self.page_counts)}",
+            f"ocr quality: mean {self.mean_quality}  {counts(self.quality)}",
+            f"image rotations: {counts(self.rotations)}",
+            f"processing: {self.processing_seconds:.1f}s",
+        ]
+        if self.slowest:
+            lines.append("slowest:")
+            for document in self.slowest:
+                lines.append(
+                    f"  {document['processing_seconds']:8.1f}s  {document.get('page_count') or '?':>4} pages"
+                    f"  {document['_id']}"
+                )
+        lines.append(f"computed in {self.seconds:.2f}s")
+        return "\n".join(lines)
+
+
+def _bucket(value: float | None, buckets: dict[Any, str], boundaries: list[Any]) -> str:
+    if value is None or not boundaries[0] <= value < boundaries[-1]:
+        return UNKNOWN
+    return buckets[max(b for b in buckets if b <= value)]
+
+
+def _rotation(value: Any) -> str:
+    return UNKNOWN if value is None else str(int(value))
+
+
+def _rotation_order(item: tuple[str, int]) -> tuple[bool, int]:
+    return item[0] == UNKNOWN, 0 if item[0] == UNKNOWN else int(item[0])
+
+
+def _finish(result: CorpusStats, start: float) -> CorpusStats:
+    result.rotations = dict(sorted(result.rotations.items(), key=_rotation_order))
+    result.seconds = round(time.perf_counter() - start, 3)
+    return result
+
+
+def stats_pipeline(slowest: int = 10) -> list[dict[str, Any]]:
+    """
+    Aggregation pipeline computing the statistics of the documents it is given, as one result document with a
+    list per summary.  Compact documents keep their pages under "pages", others under "pages_data".
+    """
+    return [
+        {
+            "$project": {
+                "page_count": 1,
+                "quality": 1,
+                "processing_seconds": 1,
+                "pages.images.rotation": 1,
+                "pages_data.images.rotation": 1,
+            }
+        },
+        {
+            "$facet": {
+                "totals": [
+                    {
+                        "$group": {
+                            "_id": None,
+                            "documents": {"$sum": 1},
+                            "pages": {"$sum": "$page_count"},
+                            "min_pages": {"$min": "$page_count"},
+                            "max_pages": {"$max": "$page_count"},
+                            "mean_pages": {"$avg": "$page_count"},
+                            "mean_quality": {"$avg": "$quality"},
+                            "processing_seconds": {"$sum": "$processing_seconds"},
+                        }
+                    }
+                ],
+                # missing values are grouped as -1 so they fall in the default bucket
+                "page_counts": [
+                    {
+                        "$bucket": {
+                            "groupBy": {"$ifNull": ["$page_count", -1]},
+                            "boundaries": PAGE_BOUNDARIES,
+                            "default": UNKNOWN,
+                        }
+                    }
+                ],
+                "quality": [
+                    {
+                        "$bucket": {
+                            "groupBy": {"$ifNull": ["$quality", -1]},
+                            "boundaries": QUALITY_BOUNDARIES,
+                            "default": UNKNOWN,
+                        }
+                    }
+                ],
+                "rotations": [
+                    {
+                        "$project": {
+                            "pages": {"$concatArrays": [{"$ifNull": ["$pages", []]}, {"$ifNull": ["$pages_data", []]}]}
+                        }
+                    },
+                    {"$unwind": "$pages"},
+                    {"$unwind": "$pages.images"},
+                    {"$group": {"_id": "$pages.images.rotation", "count": {"$sum": 1}}},
+                ],
+                "slowest": [
+                    {"$match": {"processing_seconds": {"$type": "number"}}},
+                    {"$sort": {"processing_seconds": -1}},
+                    {"$limit": max(1, slowest)},
+                    {"$project": {"processing_seconds": 1, "page_count": 1}},
+                ],
+            }
+        },
+    ]
+
+
+def mongo_stats(reader: Any, query: dict[str, Any] | None = None, slowest: int = 10) -> CorpusStats:
+    """
+    Statistics of the documents matching query in the collection of a MongoDBDataReader, computed by the server.
+    """
+    start = time.perf_counter()
+    collection = reader.connection.collection
+    query = query or {}
+    pipeline = [{"$match": {**query, "duplicate_of": {"$exists": False}}}, *stats_pipeline(slowest)]
+    try:
+        facets = next(collection.aggregate(pipeline, allowDiskUse=True))
+        duplicates = collection.count_documents({**query, "duplicate_of": {"$exists": True}})
+    except OperationFailure as e:
+        logger.error(f"failed stats aggregation on mongo {reader.connection} with {e}")
+        raise e
+
+    result = CorpusStats(duplicates=duplicates)
+    totals = facets["totals"][0] if facets["totals"] else {}
+    result.documents = totals.get("documents", 0)
+    result.pages = totals.get("pages", 0)
+    result.min_pages = totals.get("min_pages")
+    result.max_pages = totals.get("max_pages")
+    result.mean_pages = None if totals.get("mean_pages") is None else round(totals["mean_pages"], 2)
+    result.mean_quality = None if totals.get("mean_quality") is None else round(totals["mean_quality"], 4)
+    result.processing_seconds = round(totals.get("processing_seconds", 0.0), 3)
+    for bucket in facets["page_counts"]:
+        result.page_counts[PAGE_BUCKETS.get(bucket["_id"], UNKNOWN)] = bucket["count"]
+    for bucket in facets["quality"]:
+        result.quality[QUALITY_BUCKETS.get(bucket["_id"], UNKNOWN)] = bucket["count"]
+    for bucket in facets["rotations"]:
+        result.rotations[_rotation(bucket["_id"])] = bucket["count"]
+    result.slowest = [
+        {"_id": d["_id"], "processing_seconds": d["processing_seconds"], "page_count": d.get("page_count")}
+        for d in facets["slowest"]
+    ]
+    return _finish(result, start)
+
+
+def local_stats(documents: Iterable[dict[str, Any]], slowest: int = 10) -> CorpusStats:
+    """
+    The statistics mongo_stats computes, from a stream of documents.
+    """
+    start = time.perf_counter()
+    result = CorpusStats()
+    page_counts, qualities, timed = [], [], []
+    for document in documents:
+        if "duplicate_of" in document:
+            result.duplicates += 1
+            continue
+        result.documents += 1
+        page_count, quality = document.get("page_count"), document.get("quality")
+        if page_count is not None:
+            page_counts.append(page_count)
+        if quality is not None:
+            qualities.append(quality)
+        label = _bucket(page_count, PAGE_BUCKETS, PAGE_BOUNDARIES)
+        result.page_counts[label] = result.page_counts.get(label, 0) + 1
+        label = _bucket(quality, QUALITY_BUCKETS, QUALITY_BOUNDARIES)
+        result.quality[label] = result.quality.get(label, 0) + 1
+        for page in document.get("pages", []) + document.get("pages_data", []):
+            for image in page.get("images", []):
+                label = _rotation(image.get("rotation"))
+                result.rotations[label] = result.rotations.get(label, 0) + 1
+        if isinstance(document.get("processing_seconds"), (int, float)):
+            result.processing_seconds += document["processing_seconds"]
+            timed.append(
+                {"_id": document["_id"], "processing_seconds": document["processing_seconds"], "page_count": page_count}
+            )
+    result.pages = sum(page_counts)
+    if page_counts:
+        result.min_pages, result.max_pages = min(page_counts), max(page_counts)
+        result.mean_pages = round(result.pages / len(page_counts), 2)
+    if qualities:
+        result.mean_quality = round(sum(qualities) / len(qualities), 4)
+    result.processing_seconds = round(result.processing_seconds, 3)
+    result.slowest = heapq.nlargest(max(1, slowest), timed, key=lambda d: d["processing_seconds"])
+    return _finish(result, start)
@@ -1,12 +1,23 @@
 """
 Storage protocols and concretes
+
+Mongo connections share one pooled client per connection string from the process wide `clients` registry, so
+readers and writers opened across a run reuse the same sockets.
 """
 
 # from io import TextIOWrapper
+import base64
+import gzip
+import json
+import os
+import threading
+import time
+import uuid
+from dataclasses import dataclass, field
 from pathlib import Path
-from typing import Any, Protocol
+from typing import Any, Iterator, Protocol
 
-from pymongo import MongoClient
+from pymongo import ASCENDING, DESCENDING, TEXT, IndexModel, MongoClient, UpdateOne, monitoring
 from pymongo.collection import Collection
 from pymongo.database import Database as mongoDB
 from pymongo.errors import (
@@ -17,21 +28,110 @@ from pymongo.errors import (
     ServerSelectionTimeoutError,
 )
 
-from docuparse import config, get_logger
+from docuparse import codec, config, get_logger
 
 logger = get_logger()
 
+TEXT_INDEX_NAME = "docuparse_text"
+# compact documents keep their text under "text", unless it was stored compressed
+TEXT_INDEX_FIELDS = ("merged_text", "text")
+
+
+@dataclass(frozen=True)
+class IndexSpec:
+    """
+    An index the store keeps on the document collection.
+    """
+
+    name: str
+    keys: tuple[tuple[str, Any], ...]
+    sparse: bool = False
+
+    def model(self, background: bool = False) -> IndexModel:
+        """
+        The pymongo model of the index.
+        """
+        return IndexModel(list(self.keys), name=self.name, sparse=self.sparse, background=background)
+
+
+# The fields documents are looked up by.  document_fields in containers sets most of them on every document; nlp
+# and extract mark the documents they have done with nlp_model and extracted_at.
+INDEXES = (
+    IndexSpec(TEXT_INDEX_NAME, tuple((f, TEXT) for f in TEXT_INDEX_FIELDS)),
+    IndexSpec("quality", (("quality", ASCENDING),)),
+    IndexSpec("page_count", (("page_count", ASCENDING),)),
+    IndexSpec("source_directory", (("source_directory", ASCENDING), ("processed_at", DESCENDING))),
+    IndexSpec("content_hash", (("content_hash", ASCENDING),)),
+    IndexSpec("processed_at", (("processed_at", DESCENDING),)),
+    IndexSpec("nlp_model", (("nlp_model", ASCENDING),)),
+    IndexSpec("extracted_at", (("extracted_at", ASCENDING),)),
+    IndexSpec("duplicate_of", (("duplicate_of", ASCENDING),), sparse=True),
+)
+
+
+@dataclass(frozen=True)
+class QueryShape:
+    """
+    The shape of a query docuparse runs, with placeholder values, for checking its plan.
+    """
+
+    name: str
+    filter: dict[str, Any]
+    sort: list[tuple[str, int]] = field(default_factory=list)
+    limit: int = 0
+
+
+COMMON_QUERIES = (
+    QueryShape("text search", {"$text": {"$search": "plat"}}),
+    QueryShape("documents of a directory", {"source_directory": "data/plats"}, [("processed_at", DESCENDING)]),
+    QueryShape("documents by content hash", {"content_hash": "0" * 64}),
+    QueryShape("low quality documents", {"quality": {"$lt": 0.5}}),
+    QueryShape("long documents", {"page_count": {"$gte": 10}}),
+    QueryShape("recently processed", {}, [("processed_at", DESCENDING)], 20),
+    QueryShape("documents without entities", {"nlp_model": {"$exists": False}}),
+    QueryShape("documents without extractions", {"extracted_at": {"$exists": False}}),
+    QueryShape("duplicates of a document", {"duplicate_of": "data/plats/plat.pdf"}),
+)
+
+
+def index_signature(keys: Any, weights: dict[str, Any] | None = None) -> list[tuple[str, Any]]:
+    """
+    Comparable form of an index's keys.  The server reports a text index as ("_fts", "text"), ("_ftsx", 1) with
+    the indexed fields under weights, so text fields are taken from weights when it gives them.
+    """
+    keys = [tuple(k) for k in keys]
+    if any(kind == TEXT for _, kind in keys):
+        fields = sorted(weights) if weights else sorted(f for f, kind in keys if kind == TEXT)
+        return [(f, TEXT) for f in fields]
+    return keys
+
+
+def plan_stages(plan: Any) -> list[str]:
+    """
+    Every stage in an explain output, depth first.
+    """
+    if isinstance(plan, dict):
+        stages = [plan["stage"]] if isinstance(plan.get("stage"), str) else []
+        for value in plan.values():
+            stages += plan_stages(value)
+        return stages
+    if isinstance(plan, list):
+        return [stage for value in plan for stage in plan_stages(value)]
+    return []
+
 
 class DataWriter(Protocol):
     """
     Data writer. A protocol for anything that writes data.
     """
 
-    def write_data(self, data: dict[str, Any] | list[Any], force: bool = False) -> None:
+    def write_data(self, data: dict[str, Any] | list[Any], force: bool = False) -> bool:
         """
         Write the provided data.
 
         :param data: The data to write.
+        :param force: Replace data already stored under the same key.
+        :return: True if anything was written, False if it was all skipped as already stored.
         """
 
     def close(self) -> None:
@@ -45,37 +145,249 @@ class DataWriter(Protocol):
         """
 
 
-class FileDataWriter:
+JSONL_SHARD_BYTES = 256 * 1024 * 1024
+JSONL_BUFFER_BYTES = 1024 * 1024
+
+
+def _jsonl_default(value: Any) -> Any:
+    # packed arrays, such as word boxes and ocr confidences, are tagged base64 as in mongo extended json
+    if isinstance(value, (bytes, bytearray)):
+        return {"$binary": base64.b64encode(value).decode("ascii")}
+    return str(value)
+
+
+def _jsonl_object(value: dict[str, Any]) -> Any:
+    if len(value) == 1 and isinstance(value.get("$binary"), str):
+        return base64.b64decode(value["$binary"])
+    return value
+
+
+class JSONLIndex:
     """
-    Write out a file.
+    document id -> (shard, offset, length) over the shards of a JSONL directory.
+
+    Each shard has an .idx sidecar of json lines [id, offset, length, sequence].  The newest sequence of an id
+    wins, so a forced rewrite appended to any shard replaces the earlier record.
     """
 
-    def __init__(self, file_path: str | Path):
-        self.file_path: Path = Path(file_path) if isinstance(file_path, str) else file_path
+    def __init__(self, directory: Path):
+        self.directory = directory
+        self.entries: dict[str, tuple[str, int, int, int]] = {}
+        self._read: dict[Path, int] = {}
+        self.refresh()
 
-    def write_data(self, data: dict[str, Any] | list[Any]) -> bool:
+    def refresh(self) -> None:
         """
-        Write file data
+        Read the sidecar lines added since the last refresh, including those of other writers.
         """
-        try:
-            with open(self.file_path, "w", encoding="utf8") as f:
-                f.write(str(data) + "\n")
-        except FileNotFoundError as e:
-            logger.error(f"unable to write to {str(self.file_path)} with error {e}")
-            raise e
-        return True
+        for sidecar in sorted(self.directory.glob("*.idx")):
+            with open(sidecar, "rb") as f:
+                f.seek(self._read.get(sidecar, 0))
+                data = f.read()
+            # a writer may be part way through a line, so stop at the last complete one
+            complete = data[: data.rfind(b"\n") + 1]
+            self._read[sidecar] = self._read.get(sidecar, 0) + len(complete)
+            shard = sidecar.name[: -len(".idx")]
+            for line in complete.splitlines():
+                doc_id, offset, length, sequence = json.loads(line)
+                self.add(doc_id, shard, offset, length, sequence)
+
+    def add(self, doc_id: str, shard: str, offset: int, length: int, sequence: int) -> None:
+        """
+        Record where doc_id is stored unless a newer record of it is known.
+        """
+        known = self.entries.get(doc_id)
+        if known is None or known[3] <= sequence:
+            self.entries[doc_id] = (shard, offset, length, sequence)
+
+    def read(self, doc_id: str) -> dict[str, Any] | None:
+        """
+        The stored document of doc_id, read with one seek, or None.
+        """
+        entry = self.entries.get(doc_id)
+        if entry is None:
+            return None
+        shard, offset, length, _ = entry
+        with open(self.directory / shard, "rb") as f:
+            f.seek(offset)
+            record = f.read(length)
+        if shard.endswith(".gz"):
+            record = gzip.decompress(record)
+        return json.loads(record, object_hook=_jsonl_object)
+
+
+class JSONLDataWriter:
+    """
+    Append only JSONL sink for offline runs.
+
+    Documents are appended as one json line each to shards of about shard_bytes, optionally gzip compressed with
+    each line its own gzip member so the shard stays a valid .jsonl.gz.  Writes are buffered and flushed every
+    buffer_bytes, with an fsync at most every fsync_seconds and on close.  Every writer appends only to its own
+    shards, named by a token unique to the writer, so several processes can write to one directory.  The .idx
+    sidecar of each shard makes exists and lookups dictionary hits.  Bytes values, such as packed word boxes, are
+    stored as {"$binary": base64} and read back as bytes.
+
+    Args:
+        directory: where shards are written.  Created if missing.
+        compress: gzip the shards.
+        shard_bytes: size at which a new shard is started.
+        buffer_bytes: bytes buffered before they are written.
+        fsync_seconds: least time between fsyncs.  0 syncs on every flush.
+    """
+
+    def __init__(
+        self,
+        directory: str | Path,
+        compress: bool = False,
+        shard_bytes: int = JSONL_SHARD_BYTES,
+        buffer_bytes: int = JSONL_BUFFER_BYTES,
+        fsync_seconds: float = 5.0,
+    ):
+        self.directory = Path(directory)
+        self.directory.mkdir(parents=True, exist_ok=True)
+        self.compress = compress
+        self.shard_bytes = shard_bytes
+        self.buffer_bytes = buffer_bytes
+        self.fsync_seconds = fsync_seconds
+        self.index = JSONLIndex(self.directory)
+        self._token = f"{os.getpid()}-{uuid.uuid4().hex[:8]}"
+        self._shard = -1
+        self._size = 0
+        self._buffer = bytearray()
+        self._pending: list[tuple[str, int, int, int]] = []
+        self._synced = time.monotonic()
+        self._sequence = 0
+        self._next_shard()
+
+    def _next_shard(self) -> None:
+        self._shard += 1
+        self._size = 0
+
+    @property
+    def shard(self) -> str:
+        """
+        File name of the shard being written.
+        """
+        return f"shard-{self._token}-{self._shard:05d}.jsonl" + (".gz" if self.compress else "")
+
+    def write_data(self, data: dict[str, dict[str, Any]], force: bool = False) -> bool:
+        """
+        Append each document in data, keyed by document id.  Stored documents are only replaced with force.
+        """
+        written = False
+        for doc_id, document in data.items():
+            doc_id = str(doc_id)
+            if doc_id in self.index.entries and not force:
+                logger.info(f"Not writing {doc_id}. Already stored. Use force=True to replace.")
+                continue
+            record = (json.dumps({**document, "_id": doc_id}, default=_jsonl_default) + "\n").encode("utf8")
+            if self.compress:
+                record = gzip.compress(record, mtime=0)
+            if self._size and self._size + len(record) > self.shard_bytes:
+                self.flush()
+                self._next_shard()
+            offset = self._size
+            self._buffer += record
+            self._size += len(record)
+            # clock order across writers, strictly increasing within this one
+            sequence = self._sequence = max(time.time_ns(), self._sequence + 1)
+            self._pending.append((doc_id, offset, len(record), sequence))
+            self.index.add(doc_id, self.shard, offset, len(record), sequence)
+            written = True
+        if len(self._buffer) >= self.buffer_bytes:
+            self.flush()
+        return written
+
+    def flush(self, sync: bool = False) -> None:
+        """
+        Write buffered records, then their sidecar entries, so the index never points past the data.  Files are
+        synced when sync is set or fsync_seconds have passed since the last sync.
+        """
+        if not self._pending:
+            return
+        sync = sync or time.monotonic() - self._synced >= self.fsync_seconds
+        with open(self.directory / self.shard, "ab") as f:
+            f.write(self._buffer)
+            if sync:
+                f.flush()
+                os.fsync(f.fileno())
+        lines = "".join(json.dumps(entry) + "\n" for entry in self._pending)
+        with open(self.directory / f"{self.shard}.idx", "a", encoding="utf8") as f:
+            f.write(lines)
+            if sync:
+                f.flush()
+                os.fsync(f.fileno())
+        if sync:
+            self._synced = time.monotonic()
+        self._buffer = bytearray()
+        self._pending = []
+
+    def exists(self, uri: str) -> bool:
+        """
+        True when a document with id uri is stored.
+        """
+        return str(uri) in self.index.entries
+
+    def read(self, doc_id: str) -> dict[str, Any] | None:
+        """
+        The stored document of doc_id, or None.
+        """
+        self.flush()
+        return self.index.read(str(doc_id))
+
+    def close(self) -> None:
+        """
+        Write and sync anything buffered.
+        """
+        self.flush(sync=True)
+
+
+class JSONLDataReader:
+    """
+    Reads the documents of a directory written by JSONLDataWriter.
+
+    Args:
+        directory: the JSONL directory.
+    """
+
+    def __init__(self, directory: str | Path):
+        self.index = JSONLIndex(Path(directory))
+        self.count = 0
+
+    def get(self, doc_id: str) -> dict[str, Any] | None:
+        """
+        The stored document of doc_id, or None.  Refresh first to see documents written since opening.
+        """
+        return self.index.read(str(doc_id))
+
+    def iter_data(self, query: dict[str, Any] | None = None) -> Iterator[dict[str, Any]]:
+        """
+        Stream the current version of every document whose top level fields equal those of query.
+        """
+        for doc_id in list(self.index.entries):
+            document = self.index.read(doc_id)
+            if document is not None and all(document.get(k) == v for k, v in (query or {}).items()):
+                yield document
+
+    def read_data(self, query: dict[str, Any] | None = None) -> list[dict[str, Any]]:
+        """
+        The current version of every document matching query.
+        """
+        results = list(self.iter_data(query))
+        self.count = len(results)
+        return results
 
-    def close(self):
+    def refresh(self) -> None:
         """
-        File closer
+        Pick up documents written since the reader was opened.
         """
+        self.index.refresh()
 
-    def exists(self, uri: str | None | Path = "") -> bool:
+    def length(self) -> int:
         """
-        Check if a file exists.
+        Returns the length of the latest read operation.
         """
-        p: Path = self.file_path if not uri else Path(uri)
-        return p.exists()
+        return self.count
 
 
 class DataConnector(Protocol):
@@ -112,6 +424,199 @@ class DataReader(Protocol):
 # Concretes
 
 
+class PoolMetrics(monitoring.ConnectionPoolListener):
+    """
+    Connection pool listener counting connection use of one client.
+
+    Attributes:
+        open (int): Connections currently open.
+        checked_out (int): Connections currently in use by an operation.
+        peak_checked_out (int): Most connections in use at once.
+        checkouts (int): Operations that got a connection.
+        waiting (int): Operations currently waiting for a connection.
+        peak_waiting (int): Most operations waiting at once.
+        failed_checkouts (int): Operations that gave up waiting for a connection or failed to connect.
+        created (int): Connections opened over the life of the pool.
+    """
+
+    def __init__(self) -> None:
+        self.lock = threading.Lock()
+        self.open = 0
+        self.checked_out = 0
+        self.peak_checked_out = 0
+        self.checkouts = 0
+        self.waiting = 0
+        self.peak_waiting = 0
+        self.failed_checkouts = 0
+        self.created = 0
+
+    def as_dict(self) -> dict[str, int]:
+        """
+        The counters as a plain dict.
+        """
+        with self.lock:
+            return {k: v for k, v in vars(self).items() if k != "lock"}
+
+    def pool_created(self, event: Any) -> None:
+        pass
+
+    def pool_ready(self, event: Any) -> None:
+        pass
+
+    def pool_cleared(self, event: Any) -> None:
+        pass
+
+    def pool_closed(self, event: Any) -> None:
+        pass
+
+    def connection_created(self, event: Any) -> None:
+        with self.lock:
+            self.open += 1
+            self.created += 1
+
+    def connection_ready(self, event: Any) -> None:
+        pass
+
+    def connection_closed(self, event: Any) -> None:
+        with self.lock:
+            self.open -= 1
+
+    def connection_check_out_started(self, event: Any) -> None:
+        with self.lock:
+            self.waiting += 1
+            self.peak_waiting = max(self.peak_waiting, self.waiting)
+
+    def connection_check_out_failed(self, event: Any) -> None:
+        with self.lock:
+            self.waiting -= 1
+            self.failed_checkouts += 1
+
+    def connection_checked_out(self, event: Any) -> None:
+        with self.lock:
+            self.waiting -= 1
+            self.checkouts += 1
+            self.checked_out += 1
+            self.peak_checked_out = max(self.peak_checked_out, self.checked_out)
+
+    def connection_checked_in(self, event: Any) -> None:
+        with self.lock:
+            self.checked_out -= 1
+
+
+def _write_concern(w: str) -> int | str:
+    return int(w) if w.isdigit() else w
+
+
+class MongoClientRegistry:
+    """
+    One pooled MongoClient per connection string for the whole process.
+
+    Clients are created on first use and counted by their users, and closed once the last user releases them.
+    pymongo clients are not fork safe, so a forked worker process does not use the clients of its parent: the
+    registry notices the new process id, forgets the inherited clients and makes new ones on demand.
+
+    Args:
+        pool_size: most connections per client.
+        timeout_ms: server selection, connect and pool wait timeout.
+        write_concern: w of the default write concern, a number of nodes or "majority".
+    """
+
+    def __init__(
+        self,
+        pool_size: int = config.mongo_pool_size,
+        timeout_ms: int = config.mongo_timeout_ms,
+        write_concern: str = config.mongo_write_concern,
+    ):
+        self.pool_size = pool_size
+        self.timeout_ms = timeout_ms
+        self.write_concern = write_concern
+        self._lock = threading.Lock()
+        self._clients: dict[str, MongoClient] = {}
+        self._users: dict[str, int] = {}
+        self._metrics: dict[str, PoolMetrics] = {}
+        self._pid = os.getpid()
+
+    def _after_fork(self) -> None:
+        """
+        In a forked child, drop the clients inherited from the parent without closing them, which would close the
+        parent's sockets.
+        """
+        if self._pid != os.getpid():
+            self._lock = threading.Lock()
+            self._clients, self._users, self._metrics = {}, {}, {}
+            self._pid = os.getpid()
+
+    def acquire(self, connection_string: str) -> MongoClient:
+        """
+        The shared client of connection_string, created on first use.  Pair with release.
+        """
+        self._after_fork()
+        with self._lock:
+            client = self._clients.get(connection_string)
+            if client is None:
+                metrics = PoolMetrics()
+                client = MongoClient(
+                    connection_string,
+                    maxPoolSize=self.pool_size,
+                    serverSelectionTimeoutMS=self.timeout_ms,
+                    connectTimeoutMS=self.timeout_ms,
+                    waitQueueTimeoutMS=self.timeout_ms,
+                    w=_write_concern(self.write_concern),
+                    event_listeners=[metrics],
+                )
+                self._clients[connection_string] = client
+                self._metrics[connection_string] = metrics
+                self._users[connection_string] = 0
+            self._users[connection_string] += 1
+            return client
+
+    def release(self, connection_string: str) -> None:
+        """
+        Give up one use of the client of connection_string, closing it when it was the last.
+        """
+        self._after_fork()
+        with self._lock:
+            if connection_string not in self._users:
+                return
+            self._users[connection_string] -= 1
+            if self._users[connection_string] > 0:
+                return
+            client = self._clients.pop(connection_string)
+            del self._users[connection_string]
+            metrics = self._metrics.pop(connection_string)
+        logger.debug(f"closing mongo client after {metrics.checkouts} checkouts")
+        client.close()
+
+    def close_all(self) -> None:
+        """
+        Close every client, whoever is using it.
+        """
+        self._after_fork()
+        with self._lock:
+            clients = list(self._clients.values())
+            self._clients, self._users, self._metrics = {}, {}, {}
+        for client in clients:
+            client.close()
+
+    def stats(self) -> dict[str, dict[str, int]]:
+        """
+        Pool use of each open client, keyed by host so credentials are not reported.
+        """
+        self._after_fork()
+        with self._lock:
+            return {
+                connection_string.rsplit("@", 1)[-1]: {
+                    "users": self._users[connection_string],
+                    "max_pool_size": self.pool_size,
+                    **metrics.as_dict(),
+                }
+                for connection_string, metrics in self._metrics.items()
+            }
+
+
+clients = MongoClientRegistry()
+
+
 class MongoDBConnection:
     """
     Creates the mongo connection.
@@ -125,40 +630,115 @@ class MongoDBConnection:
         connection_string: str = config.mongo_connection_string,
         database_name: str = config.mongo_database,
         collection_name: str = config.mongo_collection,
+        registry: MongoClientRegistry = clients,
     ):
         self.connection_string: str = connection_string
         self.collection_name: str = collection_name
         self.database_name: str = database_name
-        self.client: MongoClient
+        self.registry = registry
+        self.client: MongoClient | None = None
         self.db: mongoDB[Any]
         self.connect()
 
     def connect(self) -> None:
-        """Connect to the MongoDB server."""
+        """Connect to the MongoDB server, through the shared client of the connection string."""
+        if self.client is not None:
+            return
         try:
-            self.client = MongoClient(self.connection_string)
+            self.client = self.registry.acquire(self.connection_string)
             self.db = self.client[self.database_name]
             self.collection: Collection[Any] = self.db[self.collection_name]
         except (ConfigurationError, ConnectionFailure, InvalidURI, ServerSelectionTimeoutError) as e:
-            logger.error(f"failed to connect to {self.connection_string}")
+            logger.error(f"failed to connect to {self.connection_string.rsplit('@', 1)[-1]}")
             raise e
 
     def close(self) -> None:
-        """Close the connection to the MongoDB server."""
+        """Release the shared client.  It is closed once no connection uses it."""
         if self.client:
-            self.client.close()
+            self.registry.release(self.connection_string)
             self.client = None
             self.db = None
 
+    def ensure_indexes(self, indexes: tuple[IndexSpec, ...] = INDEXES, background: bool = False) -> list[str]:
+        """
+        Create the indexes that are missing or whose keys changed, and return their names.  A collection has at
+        most one text index, so another text index is dropped before a text index is created.
+        """
+        collection = self.collection
+        existing = {
+            name: index_signature(info["key"], info.get("weights"))
+            for name, info in collection.index_information().items()
+        }
+        wanted = [spec for spec in indexes if existing.get(spec.name) != index_signature(spec.keys)]
+        for spec in wanted:
+            is_text = any(kind == TEXT for _, kind in spec.keys)
+            for name, keys in existing.items():
+                if name == spec.name or (is_text and any(kind == TEXT for _, kind in keys)):
+                    logger.info(f"dropping index {name} to replace it with {spec.name}")
+                    collection.drop_index(name)
+        if not wanted:
+            return []
+        created = collection.create_indexes([spec.model(background) for spec in wanted])
+        logger.info(f"created indexes {created} on {self.collection_name}")
+        return created
+
+    def index_builds(self) -> list[dict[str, Any]]:
+        """
+        Index builds in progress on the collection, with their progress where the server reports it.
+        """
+        namespace = f"{self.database_name}.{self.collection_name}"
+        operations = self.client.admin.aggregate(  # type: ignore[union-attr]
+            [
+                {"$currentOp": {"allUsers": True}},
+                {"$match": {"ns": namespace, "command.createIndexes": {"$exists": True}}},
+            ]
+        )
+        return [
+            {
+                "indexes": [i.get("name") for i in op["command"].get("indexes", [])],
+                "message": op.get("msg", ""),
+                "done": op.get("progress", {}).get("done", 0),
+                "total": op.get("progress", {}).get("total", 0),
+            }
+            for op in operations
+        ]
+
+    def query_plans(self, queries: tuple[QueryShape, ...] = COMMON_QUERIES) -> dict[str, list[str]]:
+        """
+        The stages of the winning plan of each query, by query name.  A COLLSCAN stage means the query reads the
+        whole collection.
+        """
+        plans = {}
+        for query in queries:
+            cursor = self.collection.find(query.filter)
+            if query.sort:
+                cursor = cursor.sort(query.sort)
+            if query.limit:
+                cursor = cursor.limit(query.limit)
+            explained = cursor.explain()
+            plans[query.name] = plan_stages(explained.get("queryPlanner", {}).get("winningPlan", {}))
+        return plans
+
+    def collection_scans(self, queries: tuple[QueryShape, ...] = COMMON_QUERIES) -> list[str]:
+        """
+        Names of the queries that scan the whole collection.
+        """
+        return [name for name, stages in self.query_plans(queries).items() if "COLLSCAN" in stages]
+
 
 class MongoDBDataReader:
     """
     A class for reading data from MongoDB collections.
+    Documents stored in the compact schema are decoded back to processed documents unless decode is False.
     """
 
-    def __init__(self, connection: MongoDBConnection = MongoDBConnection()):
-        self.connection: MongoDBConnection = connection
-        self.count: int
+    def __init__(self, connection: MongoDBConnection | None = None, decode: bool = True):
+        self.connection: MongoDBConnection = connection or MongoDBConnection()
+        self.decode = decode
+        self.count = 0
+
+    def _decoded(self, document: dict[str, Any]) -> dict[str, Any]:
+        return codec.decode(document) if self.decode else document
 
     def read_data(self, query: dict[str, Any] | None = None) -> list[dict[str, Any]]:
         """
@@ -176,13 +756,59 @@ class MongoDBDataReader:
             raise ConnectionFailure("Not connected to any database. Call connect() first.")
 
         try:
-            results = list(self.connection.collection.find(query))
+            results = [self._decoded(d) for d in self.connection.collection.find(query)]
             self.count = len(results)
             return results
         except OperationFailure as e:
             logger.error(f"failed read operation on mongo {self.connection} with {e}")
             raise e
 
+    def iter_data(
+        self, query: dict[str, Any] | None = None, projection: dict[str, Any] | None = None, batch_size: int = 100
+    ) -> Iterator[dict[str, Any]]:
+        """
+        Stream documents matching query without holding the whole result in memory.
+        """
+        try:
+            if self.decode:
+                projection = codec.projection(projection)
+            for document in self.connection.collection.find(query or {}, projection, batch_size=batch_size):
+                yield self._decoded(document)
+        except OperationFailure as e:
+            logger.error(f"failed read operation on mongo {self.connection} with {e}")
+            raise e
+
+    def create_text_index(self, fields: tuple[str, ...] = TEXT_INDEX_FIELDS) -> str:
+        """
+        Create the collection text index over fields if it does not exist.  A collection has at most one text
+        index, so an existing one over other fields, including an older docuparse index, is dropped first.
+        """
+        self.connection.ensure_indexes((IndexSpec(TEXT_INDEX_NAME, tuple((f, TEXT) for f in fields)),))
+        return TEXT_INDEX_NAME
+
+    def text_search(
+        self, query: str, limit: int = 10, projection: dict[str, Any] | None = None
+    ) -> list[dict[str, Any]]:
+        """
+        Documents matching query on the text index, best first, each with its text score under "score".
+        """
+        fields = {
+            "score": {"$meta": "textScore"},
+            **((codec.projection(projection) if self.decode else projection) or {}),
+        }
+        cursor = (
+            self.connection.collection.find({"$text": {"$search": query}}, fields)
+            .sort([("score", {"$meta": "textScore"})])
+            .limit(limit)
+        )
+        try:
+            results = [self._decoded(d) for d in cursor]
+        except OperationFailure as e:
+            logger.error(f"text search failed on mongo {self.connection} with {e}.  Is the text index built?")
+            raise e
+        self.count = len(results)
+        return results
+
     def length(self) -> int:
         """
         Returns the length of the latest read operation.
@@ -200,10 +826,19 @@ class MongoDBDataReader:
 class MongoDBDataWriter:
     """
     A class for writing data to a MongoDB collection.
+    Processed documents are stored in the compact schema of docuparse.codec when compact is set.  With
+    compress_text, their large texts are also stored compressed, which mongo text search cannot see.
     """
 
-    def __init__(self, connection: MongoDBConnection = MongoDBConnection()):
-        self.connection = connection
+    def __init__(
+        self,
+        connection: MongoDBConnection | None = None,
+        compact: bool = config.compact_documents,
+        compress_text: bool = config.compress_text,
+    ):
+        self.connection = connection or MongoDBConnection()
+        self.compact = compact
+        self.compress_text = compress_text
 
     def write_data(self, data: dict[str, dict[str, Any]], force: bool = False) -> bool:
         """
@@ -218,7 +853,8 @@ class MongoDBDataWriter:
             raise ValueError
 
         key = list(data.keys())[0]
-        value: dict = data[key]
+        compress_over = codec.COMPRESS_OVER if self.compress_text else None
+        value: dict = codec.encode(data[key], compress_over) if self.compact else data[key]
         value["_id"] = key
 
         try:
@@ -237,6 +873,22 @@ class MongoDBDataWriter:
             logger.error(f"Failed write operation on MongoDB: {e}")
             raise e
 
+    def bulk_update(self, updates: dict[str, dict[str, Any]]) -> int:
+        """
+        Set fields on many existing documents in one unordered bulk write.
+            updates: document id -> fields to set.
+        Returns the number of documents matched, including those whose fields were already set to the same values.
+        """
+        if not updates:
+            return 0
+        operations = [UpdateOne({"_id": key}, {"$set": fields}) for key, fields in updates.items()]
+        try:
+            result = self.connection.collection.bulk_write(operations, ordered=False)
+        except OperationFailure as e:
+            logger.error(f"Failed bulk update on MongoDB: {e}")
+            raise e
+        return result.matched_count
+
     def exists(self, uri: str) -> bool:
         """
         Check if a document with the given URI exists in the collection.
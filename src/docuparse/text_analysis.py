@@ -1,9 +1,19 @@
-from typing import Any
+import functools
+import itertools
+import pathlib
+from typing import Any, Iterable, Iterator
 
 import spacy
 
 # from spacy import displacy
-from spacy.tokens import DocBin
+from spacy.language import Language
+from spacy.tokens import Doc, DocBin
+
+from docuparse import get_logger
+from docuparse.docbins import DocBinStore, text_hash
+from docuparse.search import page_texts
+
+logger = get_logger()
 
 # 📝 THINGS TO TRY
 # Compare two different tokens and try to find the
@@ -176,7 +186,9 @@ TEST_TEXT: dict[str, Any] = {
     "filename": "",
     "info": {"dpi": (96.012, 96.012)},
     "rotated_for_ocr": True,
-    "text": 'TEXAS: OF TRAVIS:  DN STATEMENT:  .KOUT DEVELOPMENT GRO )80: ACRES OF LAND SITU, THE MCKINNEY &: WILLIAM PORTION OF A. 1,013.55 - PARTNERS, L.P. IN DOCU COUNTY, TEXAS, DO, HEREB ILE ORDINANCES OF THE + JESCRIBED PLAT TO BE KI ". AND DO” HEREBY ‘DEDIC \\ND OTHER OPEN SPACES N FOR PERPETUAL MAINTE IN HEREON, ‘SUBJECT “JO RELEASED. . AS  HINCKLEY, PRESIDENT GROUP, INC. , PARTNER LOOKOUT DEVELOP! . HINCKLEY, OPERATING MAN IDE LAND AND -CATTLE -CO., PARTNER KEY—-DEER HOLDING E BOULEVARD, SUITE 200. TEXAS. 77005. -  - TEXAS::  OF TRAVIS:  ME, THE: UNDERSIGNED AL , KNOWN TO ME TO BE 7 =NT. AND ACKNOWLEDGED RATION” THEREIN. EXPRESSE  IDER MY HAND AND SEAL  vin CU  TEXAS: ; OF. TRAVIS: coisa’  > L.. McLAUGHLIN,. AM: AUT . THE PROFESSION -OF LAI SLICABLE ORDINANCES OF T ALL EXISTING EASEMENT JENCE TITLE COMPANY, GF YR NOTED HEREON.  ". McLAUGHLIN oO ED PROFESSIONAL LAND ’S TEXAS  TEXAS: © - - OF TRAVIS: = —  | D..KIGER, AM:-AUTHORIZ FESSION OF ENGINEERING, LE ORDINANCES OF THE | JE EDWARDS AQUIFER REC 1E. LIMITS OF A 100 YEAR ENT AGENCY (FEMA) PER ATED SEPT. 26, 2008, AN  D. KIGER,, P.E. ~ . TEXAS. NO. 89353. 1220.  “TEXAS 78646-1220  ',  # pylint: disable=C0301
+    "text": (
+        'TEXAS: OF TRAVIS:  DN STATEMENT:  .KOUT DEVELOPMENT GRO )80: ACRES OF LAND SITU, THE MCKINNEY &: WILLIAM PORTION OF A. 1,013.55 - PARTNERS, L.P. IN DOCU COUNTY, TEXAS, DO, HEREB ILE ORDINANCES OF THE + JESCRIBED PLAT TO BE KI ". AND DO” HEREBY ‘DEDIC \\ND OTHER OPEN SPACES N FOR PERPETUAL MAINTE IN HEREON, ‘SUBJECT “JO RELEASED. . AS  HINCKLEY, PRESIDENT GROUP, INC. , PARTNER LOOKOUT DEVELOP! . HINCKLEY, OPERATING MAN IDE LAND AND -CATTLE -CO., PARTNER KEY—-DEER HOLDING E BOULEVARD, SUITE 200. TEXAS. 77005. -  - TEXAS::  OF TRAVIS:  ME, THE: UNDERSIGNED AL , KNOWN TO ME TO BE 7 =NT. AND ACKNOWLEDGED RATION” THEREIN. EXPRESSE  IDER MY HAND AND SEAL  vin CU  TEXAS: ; OF. TRAVIS: coisa’  > L.. McLAUGHLIN,. AM: AUT . THE PROFESSION -OF LAI SLICABLE ORDINANCES OF T ALL EXISTING EASEMENT JENCE TITLE COMPANY, GF YR NOTED HEREON.  ". McLAUGHLIN oO ED PROFESSIONAL LAND ’S TEXAS  TEXAS: © - - OF TRAVIS: = —  | D..KIGER, AM:-AUTHORIZ FESSION OF ENGINEERING, LE ORDINANCES OF THE | JE EDWARDS AQUIFER REC 1E. LIMITS OF A 100 YEAR ENT AGENCY (FEMA) PER ATED SEPT. 26, 2008, AN  D. KIGER,, P.E. ~ . TEXAS. NO. 89353. 1220.  “TEXAS 78646-1220  '
+    ),  # pylint: disable=C0301
     "ocr_quality": {"word_confidence": 0.72, "readability_score": 78.35},
     "file_path": "data\\plats\\GRAND MESA\\Recorded Plat GM9 (201800051).pdf_image_0",
 }
@@ -234,6 +246,166 @@ def prep_train_data():
     db.to_disk("./train.spacy")
 
 
+def pipeline_components(model: str) -> list[str]:
+    """
+    Component names of an installed or on disk pipeline, read from its config without loading it.  Empty when the
+    config cannot be found.
+    """
+    path = pathlib.Path(model)
+    try:
+        if not path.exists():
+            path = next(spacy.util.get_package_path(model).glob("*/config.cfg")).parent
+        return list(spacy.util.load_config(path / "config.cfg")["nlp"]["pipeline"])
+    except (ImportError, OSError, StopIteration, KeyError) as e:
+        logger.warning(f"could not read the components of {model}: {e}")
+        return []
+
+
+@functools.lru_cache(maxsize=None)
+def load_pipeline(model: str, components: tuple[str, ...] = ("ner",)) -> Language:
+    """
+    Load model once per process with only components in the pipeline.
+    The other components are excluded, so the parser and tagger weights are never read.  Those of a pipeline
+    whose config cannot be found are loaded and dropped.  Components that ner listens to, such as a shared
+    tok2vec, must be listed.
+    """
+    exclude = [name for name in pipeline_components(model) if name not in components]
+    nlp = spacy.load(model, enable=list(components), exclude=exclude)
+    for name in list(nlp.disabled):
+        nlp.remove_pipe(name)
+    logger.info(f"loaded {model} with {nlp.pipe_names}")
+    return nlp
+
+
+def doc_entities(doc: Doc, page: int = 0) -> list[dict[str, Any]]:
+    """
+    The named entities of doc as plain dicts.
+    """
+    return [
+        {"text": e.text, "label": e.label_, "page": page, "start": e.start_char, "end": e.end_char} for e in doc.ents
+    ]
+
+
+class NLPEnricher:
+    """
+    Named entity enrichment of processed documents.
+
+    Page texts are streamed through nlp.pipe in batches, optionally on several processes, and the entities of
+    each document are written back in bulk under "entities".  With a DocBinStore the annotated docs are kept, and
+    pages whose text is unchanged and that were annotated by the same pipeline are loaded from it instead of being
+    run through the pipeline again.
+
+    Args:
+        model: spacy pipeline to load, once per process.
+        components: pipeline components to keep.
+        batch_size: texts per nlp.pipe batch.
+        n_process: processes for nlp.pipe.  Each loads the pipeline once.
+        nlp: an already loaded pipeline to use instead of model.
+        docbins: where annotated docs are stored and reused.
+    """
+
+    def __init__(
+        self,
+        model: str = "en_core_web_lg",
+        components: tuple[str, ...] = ("ner",),
+        batch_size: int = 64,
+        n_process: int = 1,
+        nlp: Language | None = None,
+        docbins: DocBinStore | None = None,
+    ):  # pylint: disable=too-many-arguments
+        self.model = model
+        self.components = components
+        self.batch_size = batch_size
+        self.n_process = n_process
+        self._nlp = nlp
+        self.docbins = docbins
+
+    @property
+    def nlp(self) -> Language:
+        """
+        The pipeline, loaded on first use.
+        """
+        if self._nlp is None:
+            self._nlp = load_pipeline(self.model, self.components)
+        return self._nlp
+
+    @property
+    def pipeline(self) -> str:
+        """
+        Name, version and components of the pipeline, recorded with stored docs.
+        """
+        meta = self.nlp.meta
+        return f"{meta.get("lang")}_{meta.get("name")}-{meta.get("version")}:{",".join(self.nlp.pipe_names)}"
+
+    def _pages(self, documents: Iterable[dict[str, Any]]) -> Iterator[tuple[str, tuple[str, int]]]:
+        max_length = self.nlp.max_length
+        for document in documents:
+            pages = page_texts(document) or [document.get("merged_text", "")]
+            for number, text in enumerate(pages):
+                if len(text) > max_length:
+                    logger.warning(f"truncating page {number} of {document["_id"]} to {max_length} characters")
+                yield text[:max_length], (str(document["_id"]), number)
+
+    def _docs(
+        self, pages: Iterable[tuple[str, tuple[str, int]]], force: bool = False
+    ) -> Iterator[tuple[Doc, tuple[str, int]]]:
+        """
+        Annotated docs of pages, in order, reusing and storing docs when there is a DocBinStore.  With force every
+        page is annotated again and replaces its stored doc.
+        """
+        if self.docbins is None:
+            yield from self.nlp.pipe(pages, as_tuples=True, batch_size=self.batch_size, n_process=self.n_process)
+            return
+        docbins, pipeline = self.docbins, self.pipeline
+        chunk_size = self.batch_size * max(1, self.n_process) * 4
+        pages = iter(pages)
+        while chunk := list(itertools.islice(pages, chunk_size)):
+            hashes = [text_hash(text) for text, _ in chunk]
+            todo = [
+                (text, i) for i, (text, key) in enumerate(chunk) if force or not docbins.has(*key, hashes[i], pipeline)
+            ]
+            annotated = self.nlp.pipe(todo, as_tuples=True, batch_size=self.batch_size, n_process=self.n_process)
+            fresh = {i: doc for doc, i in annotated}
+            for i, (_, key) in enumerate(chunk):
+                doc = fresh.get(i)
+                if doc is None:
+                    doc = docbins.load(*key, self.nlp.vocab)
+                else:
+                    docbins.add(doc, *key, hashes[i], pipeline)
+                yield doc, key
+        docbins.flush()
+
+    def enrich(
+        self, documents: Iterable[dict[str, Any]], force: bool = False
+    ) -> Iterator[tuple[str, list[dict[str, Any]]]]:
+        """
+        Yield (document id, entities) for documents as stored by the writers, in order.  force annotates pages
+        again even when a DocBinStore holds them.
+        """
+        docs = self._docs(self._pages(documents), force)
+        for doc_id, pages in itertools.groupby(docs, key=lambda d: d[1][0]):
+            yield doc_id, [e for doc, (_, number) in pages for e in doc_entities(doc, number)]
+
+    def enrich_collection(self, reader: Any, writer: Any, force: bool = False, bulk_size: int = 500) -> int:
+        """
+        Enrich the documents of a MongoDBDataReader and write the entities back with a MongoDBDataWriter.
+        Documents that already have entities are skipped unless force.  Returns the number of documents updated.
+        """
+        # nlp_model is set with entities and, unlike the entities array, is indexed
+        query = {} if force else {"nlp_model": {"$exists": False}}
+        documents = reader.iter_data(query, {"pages_data.combined_text": 1, "merged_text": 1})
+        updated = 0
+        pending: dict[str, dict[str, Any]] = {}
+        for doc_id, entities in self.enrich(documents, force):
+            pending[doc_id] = {"entities": entities, "nlp_model": self.model}
+            if len(pending) >= bulk_size:
+                updated += writer.bulk_update(pending)
+                pending = {}
+        updated += writer.bulk_update(pending)
+        logger.info(f"added entities to {updated} documents")
+        return updated
+
+
 def main():
     spacy_gen()
     prep_train_data()
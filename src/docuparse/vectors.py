@@ -0,0 +1,316 @@
+"""
+Vector similarity search over documents and pages.
+
+Page vectors are the spacy document vectors of the page text, the mean of its word vectors, computed in bulk with
+the tokenizer only.  They are stored L2 normalized, one float32 row per page, in a single contiguous file that is
+memory mapped for search, so cosine similarity is a matrix vector product over chunks of rows.
+
+Brute force search reads every row.  IVFIndex clusters the rows with k-means and only scores the rows of the
+clusters nearest the query, which keeps queries fast once the collection is too large to scan.
+"""
+
+import heapq
+import json
+import pathlib
+from dataclasses import dataclass
+from typing import Any, Iterable, Iterator
+
+import numpy as np
+from spacy.language import Language
+
+from docuparse import get_logger
+from docuparse.search import page_texts
+
+logger = get_logger()
+
+CHUNK_ROWS = 65536
+
+
+def embed_texts(nlp: Language, texts: Iterable[str], batch_size: int = 256) -> Iterator[np.ndarray]:
+    """
+    The vector of each text.  Only the tokenizer runs, since vectors come from the vocab.
+    """
+    for doc in nlp.tokenizer.pipe(texts, batch_size=batch_size):
+        yield doc.vector
+
+
+def normalize(vectors: np.ndarray) -> np.ndarray:
+    """
+    Rows scaled to unit length.  Zero rows, such as pages without known words, stay zero.
+    """
+    norms = np.linalg.norm(vectors, axis=-1, keepdims=True)
+    return np.divide(vectors, norms, out=np.zeros_like(vectors), where=norms > 0)
+
+
+@dataclass
+class Neighbor:
+    """
+    A page close to the query, with its cosine similarity.
+    """
+
+    doc_id: str
+    page: int
+    score: float
+
+
+def top_k(scores: np.ndarray, k: int) -> np.ndarray:
+    """
+    Indexes of the k highest scores, highest first, without sorting all of them.
+    """
+    k = min(k, len(scores))
+    if k <= 0:
+        return np.empty(0, dtype=np.int64)
+    best = np.argpartition(-scores, k - 1)[:k]
+    return best[np.argsort(-scores[best])]
+
+
+class VectorStore:
+    """
+    Page vectors in a directory: vectors.f32 holds the rows and keys.jsonl the (document id, page) of each row,
+    one per line.  Rows are appended before their keys, so a store left by an interrupted add is cut back on open
+    to the rows that have keys.
+
+    Args:
+        directory: where the store lives.  Created if missing.
+        dim: vector width.  Read from an existing store when not given.
+    """
+
+    def __init__(self, directory: str | pathlib.Path, dim: int | None = None):
+        self.directory = pathlib.Path(directory)
+        self.directory.mkdir(parents=True, exist_ok=True)
+        meta = self.directory / "meta.json"
+        stored = json.loads(meta.read_text(encoding="utf8")) if meta.exists() else {}
+        self.dim: int = dim or stored.get("dim", 0)
+        if stored and dim and dim != stored["dim"]:
+            raise ValueError(f"{self.directory} holds {stored['dim']} wide vectors, not {dim}")
+        self.keys = self._read_keys()
+        self._rows: dict[str, list[int]] = {}
+        for row, (doc_id, _) in enumerate(self.keys):
+            self._rows.setdefault(doc_id, []).append(row)
+        self._matrix: np.ndarray | None = None
+
+    @property
+    def path(self) -> pathlib.Path:
+        """
+        The vector file.
+        """
+        return self.directory / "vectors.f32"
+
+    @property
+    def keys_path(self) -> pathlib.Path:
+        """
+        The key file.
+        """
+        return self.directory / "keys.jsonl"
+
+    def _read_keys(self) -> list[tuple[str, int]]:
+        """
+        Keys of the complete rows.  A torn last key line and rows without keys are truncated away.
+        """
+        legacy = self.directory / "keys.json"
+        if legacy.exists() and not self.keys_path.exists():
+            keys = [(d, p) for d, p in json.loads(legacy.read_text(encoding="utf8"))]
+            self.keys_path.write_text("".join(json.dumps(k) + "\n" for k in keys), encoding="utf8")
+            legacy.unlink()
+        keys: list[tuple[str, int]] = []
+        ends = [0]
+        if self.keys_path.exists():
+            with open(self.keys_path, "rb") as f:
+                for line in f:
+                    if not line.endswith(b"\n"):
+                        break
+                    doc_id, page = json.loads(line)
+                    keys.append((doc_id, page))
+                    ends.append(ends[-1] + len(line))
+        row_bytes = self.dim * 4
+        rows = self.path.stat().st_size // row_bytes if row_bytes and self.path.exists() else 0
+        if len(keys) > rows:
+            keys = keys[:rows]
+        if self.keys_path.exists() and self.keys_path.stat().st_size != ends[len(keys)]:
+            logger.warning(f"truncating {self.keys_path} to {len(keys)} complete keys")
+            with open(self.keys_path, "r+b") as f:
+                f.truncate(ends[len(keys)])
+        if self.path.exists() and self.path.stat().st_size != len(keys) * row_bytes:
+            logger.warning(f"truncating {self.path} to {len(keys)} rows with keys")
+            with open(self.path, "r+b") as f:
+                f.truncate(len(keys) * row_bytes)
+        return keys
+
+    def __len__(self) -> int:
+        return len(self.keys)
+
+    def add(self, keys: list[tuple[str, int]], vectors: np.ndarray) -> None:
+        """
+        Append rows for keys.  Vectors are normalized before they are written.
+        """
+        vectors = normalize(np.asarray(vectors, dtype=np.float32).reshape(len(keys), -1))
+        if not self.dim:
+            self.dim = vectors.shape[1]
+            (self.directory / "meta.json").write_text(json.dumps({"dim": self.dim}), encoding="utf8")
+        if vectors.shape[1] != self.dim:
+            raise ValueError(f"expected {self.dim} wide vectors, got {vectors.shape[1]}")
+        with open(self.path, "ab") as f:
+            vectors.tofile(f)
+        with open(self.keys_path, "a", encoding="utf8") as f:
+            f.write("".join(json.dumps([doc_id, page]) + "\n" for doc_id, page in keys))
+        for row, (doc_id, page) in enumerate(keys, start=len(self.keys)):
+            self._rows.setdefault(doc_id, []).append(row)
+        self.keys.extend(keys)
+        self._matrix = None
+
+    def add_documents(
+        self, nlp: Language, documents: Iterable[dict[str, Any]], batch_size: int = 256, flush_rows: int = 10000
+    ) -> int:
+        """
+        Embed and append every page of processed documents, writing every flush_rows pages.  Returns pages added.
+        """
+        keys: list[tuple[str, int]] = []
+        texts: list[str] = []
+        added = 0
+        for document in documents:
+            for number, text in enumerate(page_texts(document) or [document.get("merged_text", "")]):
+                keys.append((str(document["_id"]), number))
+                texts.append(text)
+            if len(keys) >= flush_rows:
+                self.add(keys, np.stack(list(embed_texts(nlp, texts, batch_size))))
+                added += len(keys)
+                keys, texts = [], []
+        if keys:
+            self.add(keys, np.stack(list(embed_texts(nlp, texts, batch_size))))
+            added += len(keys)
+        return added
+
+    @property
+    def matrix(self) -> np.ndarray:
+        """
+        The rows, memory mapped read only.
+        """
+        if self._matrix is None:
+            if not self.keys:
+                return np.empty((0, self.dim), dtype=np.float32)
+            self._matrix = np.memmap(self.path, dtype=np.float32, mode="r", shape=(len(self.keys), self.dim))
+        return self._matrix
+
+    def rows(self, doc_id: str) -> list[int]:
+        """
+        Rows of the pages of doc_id.
+        """
+        return self._rows.get(doc_id, [])
+
+    def document_vector(self, doc_id: str) -> np.ndarray:
+        """
+        Normalized mean of the page vectors of doc_id.
+        """
+        rows = self.rows(doc_id)
+        if not rows:
+            raise KeyError(doc_id)
+        return normalize(np.asarray(self.matrix[rows]).mean(axis=0))
+
+    def search(self, query: np.ndarray, k: int = 10, chunk_rows: int = CHUNK_ROWS) -> list[Neighbor]:
+        """
+        The k pages most similar to query by brute force, scanning chunk_rows rows at a time.
+        """
+        query = normalize(np.asarray(query, dtype=np.float32))
+        best: list[tuple[float, int]] = []
+        matrix = self.matrix
+        for start in range(0, len(matrix), chunk_rows):
+            scores = matrix[start : start + chunk_rows] @ query
+            for i in top_k(scores, k):
+                best.append((float(scores[i]), start + int(i)))
+            best = heapq.nlargest(k, best)
+        return [Neighbor(*self.keys[row], score) for score, row in best]
+
+    def scores(self, query: np.ndarray, rows: np.ndarray) -> np.ndarray:
+        """
+        Cosine similarity of query with the given rows.
+        """
+        return np.asarray(self.matrix[rows]) @ normalize(np.asarray(query, dtype=np.float32))
+
+
+def similar_documents(store: VectorStore, doc_id: str, k: int = 10, index: "IVFIndex | None" = None) -> list[Neighbor]:
+    """
+    Documents most similar to doc_id, each with its best matching page, excluding doc_id itself.
+    """
+    query = store.document_vector(doc_id)
+    pages = len(store.rows(doc_id))
+    # ask for enough pages that k other documents survive dropping doc_id's own pages and repeated documents
+    neighbors = index.search(query, (k + pages) * 4) if index else store.search(query, (k + pages) * 4)
+    best: dict[str, Neighbor] = {}
+    for n in neighbors:
+        if n.doc_id != doc_id and n.doc_id not in best:
+            best[n.doc_id] = n
+    return list(best.values())[:k]
+
+
+class IVFIndex:
+    """
+    Inverted file index over a VectorStore for approximate search.
+
+    Rows are assigned to the nearest of nlist k-means centroids.  A query scores the rows of its nprobe nearest
+    centroids only.  Saved as ivf.npz next to the vectors.
+
+    Args:
+        store: the vectors to index.
+        nprobe: clusters scored per query.  More is slower and closer to brute force.
+    """
+
+    def __init__(self, store: VectorStore, nprobe: int = 8):
+        self.store = store
+        self.nprobe = nprobe
+        self.centroids = np.empty((0, store.dim), dtype=np.float32)
+        self.offsets = np.zeros(1, dtype=np.int64)
+        self.members = np.empty(0, dtype=np.int64)
+        self.indexed = 0
+        path = store.directory / "ivf.npz"
+        if path.exists():
+            with np.load(path) as saved:
+                self.centroids, self.offsets, self.members = saved["centroids"], saved["offsets"], saved["members"]
+                self.indexed = int(saved["indexed"])
+
+    def build(self, nlist: int | None = None, iterations: int = 10, sample: int = 100_000, seed: int = 0) -> None:
+        """
+        Train centroids with k-means on a sample of rows and assign every row.  nlist defaults to about the
+        square root of the number of rows.
+        """
+        matrix = self.store.matrix
+        n = len(matrix)
+        nlist = max(1, min(nlist or int(np.sqrt(n)), n))
+        rng = np.random.default_rng(seed)
+        train = np.asarray(matrix[np.sort(rng.choice(n, size=min(sample, n), replace=False))])
+        centroids = train[rng.choice(len(train), size=nlist, replace=False)].copy()
+        for _ in range(iterations):
+            labels = np.argmax(train @ centroids.T, axis=1)
+            for c in range(nlist):
+                members = train[labels == c]
+                if len(members):
+                    centroids[c] = members.mean(axis=0)
+            centroids = normalize(centroids)
+        labels = np.concatenate(
+            [np.argmax(matrix[s : s + CHUNK_ROWS] @ centroids.T, axis=1) for s in range(0, n, CHUNK_ROWS)]
+        )
+        self.centroids = centroids
+        self.members = np.argsort(labels, kind="stable")
+        self.offsets = np.concatenate([[0], np.cumsum(np.bincount(labels, minlength=nlist))])
+        self.indexed = n
+        np.savez(
+            self.store.directory / "ivf.npz",
+            centroids=self.centroids,
+            offsets=self.offsets,
+            members=self.members,
+            indexed=self.indexed,
+        )
+        logger.info(f"indexed {n} vectors in {nlist} clusters")
+
+    def search(self, query: np.ndarray, k: int = 10) -> list[Neighbor]:
+        """
+        Approximately the k pages most similar to query.  Rows added after the last build are scored exhaustively.
+        """
+        query = normalize(np.asarray(query, dtype=np.float32))
+        probes = top_k(self.centroids @ query, self.nprobe) if len(self.centroids) else []
+        rows = [self.members[self.offsets[c] : self.offsets[c + 1]] for c in probes]
+        rows.append(np.arange(self.indexed, len(self.store), dtype=np.int64))
+        candidates = np.sort(np.concatenate(rows))
+        if not len(candidates):
+            return []
+        scores = self.store.scores(query, candidates)
+        return [Neighbor(*self.store.keys[candidates[i]], float(scores[i])) for i in top_k(scores, k)]
@@ -0,0 +1,252 @@
+"""
+Continuous ingestion of a drop folder.
+
+Watcher polls a directory with os.scandir, which only stats the directory entries and is cheap enough to run
+every second on folders of many thousands of files.  A file is handed on once its size and modification time
+have not changed for the settle time, so files still being copied are not read half written.  Files that are new,
+or that changed since they were processed, go to a worker pool that stays up between files, with processors,
+models and mongo clients already loaded, so a dropped file is written seconds after it settles.
+"""
+
+import contextlib
+import os
+import pathlib
+import threading
+import time
+from concurrent.futures import Future, ProcessPoolExecutor
+from dataclasses import dataclass, field
+from typing import Any, Callable
+
+from docuparse import get_logger
+from docuparse.containers import FileDataDirectory
+
+logger = get_logger()
+
+# names of files still being written by common copy tools and browsers
+PARTIAL_SUFFIXES = (".part", ".partial", ".tmp", ".crdownload", ".download")
+# settle times a pdf without an end of file marker is waited on before it is processed anyway
+INCOMPLETE_SETTLES = 10
+
+
+@dataclass(frozen=True)
+class FileState:
+    """
+    What a poll sees of a file.
+    """
+
+    size: int
+    mtime_ns: int
+
+
+def pdf_complete(path: pathlib.Path) -> bool:
+    """
+    True unless path is a pdf whose end of file marker has not been written yet.
+    """
+    if path.suffix.lower() != ".pdf":
+        return True
+    try:
+        with open(path, "rb") as f:
+            f.seek(max(0, path.stat().st_size - 1024))
+            return b"%%EOF" in f.read()
+    except OSError:
+        return False
+
+
+@dataclass
+class WatchStats:
+    """
+    What a watcher has done.  Latency is the seconds from a file being first seen to being written.
+    """
+
+    written: int = 0
+    failed: int = 0
+    latencies: list[float] = field(default_factory=list)
+
+    def record(self, latency: float) -> None:
+        """
+        Count a written document.
+        """
+        self.written += 1
+        self.latencies.append(latency)
+
+    def describe(self) -> str:
+        """
+        One line summary.
+        """
+        if not self.latencies:
+            return f"written: {self.written}, failed: {self.failed}"
+        ordered = sorted(self.latencies)
+        return (
+            f"written: {self.written}, failed: {self.failed}, seconds to written: median"
+            f" {ordered[len(ordered) // 2]:.1f}, max {ordered[-1]:.1f}"
+        )
+
+
+class Watcher:
+    """
+    Feeds new and changed files of a directory container to its writers as they settle.
+
+    Args:
+        container: the directory to watch, with its processors and writers.
+        settle: seconds a file's size and modification time must stay unchanged before it is read.
+        interval: seconds between polls.
+        clock: monotonic time source.
+    """
+
+    def __init__(
+        self,
+        container: FileDataDirectory,
+        settle: float = 2.0,
+        interval: float = 1.0,
+        clock: Callable[[], float] = time.monotonic,
+    ):
+        self.container = container
+        self.directory = pathlib.Path(container.directory)
+        self.settle = settle
+        self.interval = interval
+        self.clock = clock
+        self.stats = WatchStats()
+        self.layout = container.layout()
+        self._seen: dict[str, tuple[FileState, float, float]] = {}  # path -> (state, first seen, unchanged since)
+        self._done: dict[str, FileState] = {}
+        self._queue: list[tuple[str, FileState, float]] = []
+        self._running: dict[Future, tuple[str, FileState, float]] = {}
+        self._executor: ProcessPoolExecutor | None = None
+        self._incomplete: dict[str, float] = {}
+        self._limit = contextlib.ExitStack()
+
+    def scan(self) -> dict[str, FileState]:
+        """
+        State of every file in the directory that a processor handles.
+        """
+        states = {}
+        with os.scandir(self.directory) as entries:
+            for entry in entries:
+                name = entry.name
+                if name.startswith(".") or name.lower().endswith(PARTIAL_SUFFIXES) or not entry.is_file():
+                    continue
+                if pathlib.PurePath(name).suffix.lower() not in self.container.processors:
+                    continue
+                stat = entry.stat()
+                states[str(self.directory / name)] = FileState(stat.st_size, stat.st_mtime_ns)
+        return states
+
+    def settled(self, states: dict[str, FileState], now: float) -> list[tuple[str, FileState, float]]:
+        """
+        Files whose state has held for the settle time and differs from when they were last processed, with the
+        time each was first seen.  Files that went away are forgotten.
+        """
+        ready = []
+        for path in list(self._seen):
+            if path not in states:
+                del self._seen[path]
+        for path, state in states.items():
+            previous = self._seen.get(path)
+            if previous is None:
+                self._seen[path] = (state, now, now)
+                previous = self._seen[path]
+            elif previous[0] != state:
+                self._seen[path] = (state, previous[1], now)
+                continue
+            _, first_seen, unchanged_since = previous
+            if now - unchanged_since >= self.settle and self._done.get(path) != state:
+                self._done[path] = state
+                ready.append((path, state, first_seen))
+        return ready
+
+    def _write(self, path: str, result: dict[str, Any], first_seen: float) -> None:
+        # a settled file is new or changed since it was stored, so it replaces what the writers hold
+        written = [writer.write_data({path: result}, force=True) for writer in self.container.writers]
+        if any(written):
+            latency = self.clock() - first_seen
+            self.stats.record(latency)
+            logger.info(f"wrote {path} {latency:.1f}s after it appeared")
+
+    def poll(self) -> None:
+        """
+        One pass: scan, hand on settled files, write finished documents.
+        """
+        now = self.clock()
+        for path, state, first_seen in self.settled(self.scan(), now):
+            if not pdf_complete(pathlib.Path(path)):
+                waited = now - self._incomplete.setdefault(path, now)
+                if waited < INCOMPLETE_SETTLES * self.settle:
+                    # settled but truncated, likely a copy that stalled, so look again on the next poll
+                    del self._done[path]
+                    continue
+                logger.warning(f"{path} has no end of file marker after {waited:.0f}s, processing it anyway")
+            self._incomplete.pop(path, None)
+            self._queue.append((path, state, first_seen))
+        self._collect()
+        self._dispatch()
+
+    def _dispatch(self) -> None:
+        while self._queue and len(self._running) < 2 * max(1, self.layout.workers):
+            path, state, first_seen = self._queue.pop(0)
+            if self._executor is None:
+                self._process_here(path, first_seen)
+                continue
+            future = self.container.submit(self._executor, path, pathlib.Path(path))
+            self._running[future] = (path, state, first_seen)
+
+    def _process_here(self, path: str, first_seen: float) -> None:
+        try:
+            _, result = self.container.process_document(path, pathlib.Path(path))
+        except Exception as e:  # pylint: disable=broad-exception-caught
+            self.stats.failed += 1
+            logger.error(f"failed to process {path}: {e}")
+            return
+        self._write(path, result, first_seen)
+
+    def _collect(self) -> None:
+        for future in [f for f in self._running if f.done()]:
+            path, _, first_seen = self._running.pop(future)
+            try:
+                _, result = future.result()
+            except Exception as e:  # pylint: disable=broad-exception-caught
+                self.stats.failed += 1
+                logger.error(f"failed to process {path}: {e}")
+                continue
+            self._write(path, result, first_seen)
+
+    def start(self) -> None:
+        """
+        Start the worker pool and take the files already in the directory as seen, processing those that no
+        writer has stored yet.
+        """
+        if self.layout.workers > 1:
+            self._executor = self.container.warm_pool(self.layout)
+        else:
+            self._limit.enter_context(self.layout.limit())
+        now = self.clock()
+        for path, state in self.scan().items():
+            self._seen[path] = (state, now, now)
+            if all(w.exists(path) for w in self.container.writers):
+                self._done[path] = state
+        logger.info(f"watching {self.directory} with {self.layout.describe()}")
+
+    def stop(self) -> None:
+        """
+        Finish the documents in flight and shut the pool down.  Files still settling are left for the next run.
+        """
+        while self._running:
+            time.sleep(min(self.interval, 0.1))
+            self._collect()
+        if self._executor is not None:
+            self._executor.shutdown()
+            self._executor = None
+        self._limit.close()
+
+    def run(self, stop: threading.Event | None = None) -> WatchStats:
+        """
+        Poll until stop is set.
+        """
+        stop = stop or threading.Event()
+        self.start()
+        try:
+            while not stop.is_set():
+                self.poll()
+                stop.wait(self.interval)
+        finally:
+            self.stop()
+        return self.stats
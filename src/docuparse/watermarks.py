@@ -0,0 +1,182 @@
+"""
+Watermark and stamp removal before ocr.
+
+Scanned plats carry large diagonal "COPY" or "RECORDED" watermarks and recording stamps, printed light grey or in
+a translucent colour over the drawing.  Tesseract reads them as runs of garbage tokens and spends much of its time
+on them.  mask_overlay finds such overlays by tone: pixels that are neither paper nor ink, or are strongly
+coloured.  Candidates are looked for on a reduced copy of the image and confirmed cell by cell at full resolution,
+and only a large connected region of cells that are overlay toned throughout, spreading across the image as an
+overlay does, is painted paper white in place.  Pixels bordering ink are kept, so the anti-aliased edges of dark
+text survive.  Thin strokes of faded or coloured ink never fill a cell, so they are left alone.
+
+Pdfs may also carry watermarks as objects of their own: Watermark and Stamp annotations, and optional content
+layers named like a watermark.  hide_watermark_layers and remove_watermark_annotations take those out of the
+opened document before text is extracted and images are recognized.  Nothing is saved back to the file.
+"""
+
+import re
+import time
+from typing import Any
+
+import numpy as np
+import pymupdf
+from PIL import Image
+
+# grey level (0-255) at or under which a pixel is ink
+INK_LEVEL = 110
+# levels under the paper level, taken from the image, at which a pixel stops being paper
+PAPER_MARGIN = 20
+# channel spread at which a pixel counts as coloured, such as a red or blue stamp
+COLOUR_SPREAD = 60
+# longest side of the reduced copy overlays are looked for on, and the side of its cells
+DETECT_SIDE = 512
+CELL = 16
+# share of a cell that must be overlay tone at full resolution for the cell to be overlay.  Ink strokes, faded
+# or coloured, only fill a small part of a cell; a translucent overlay fills all of it around the text.
+MIN_CELL_SHARE = 0.5
+# share of the cells the largest connected overlay region must cover, and share of cell rows and columns it must
+# reach, to be masked
+MIN_COVERAGE = 0.05
+MIN_SPREAD = 0.3
+# share of the image that must be ink, so faint scans are not wiped
+MIN_INK = 0.001
+
+# names of optional content layers that hold watermarks
+WATERMARK_LAYER = re.compile(r"watermark|stamp|copy|draft|recorded|void|sample|confidential", re.IGNORECASE)
+WATERMARK_ANNOTATIONS = (pymupdf.PDF_ANNOT_WATERMARK, pymupdf.PDF_ANNOT_STAMP)
+
+
+def _near(mask: np.ndarray) -> np.ndarray:
+    """
+    mask grown by one pixel in every direction.
+    """
+    grown = mask.copy()
+    grown[1:, :] |= mask[:-1, :]
+    grown[:-1, :] |= mask[1:, :]
+    grown[:, 1:] |= grown[:, :-1].copy()
+    grown[:, :-1] |= grown[:, 1:].copy()
+    return grown
+
+
+def _tones(image: Image.Image, paper: int) -> tuple[np.ndarray, np.ndarray]:
+    """
+    uint8 grey levels of an L or RGB image and the mask of its overlay toned pixels: neither paper nor ink, or
+    coloured.
+    """
+    grey = np.asarray(image.convert("L") if image.mode == "RGB" else image)
+    tone = (grey > INK_LEVEL) & (grey < paper - PAPER_MARGIN)
+    if image.mode == "RGB":
+        red, green, blue = (pixels := np.asarray(image))[..., 0], pixels[..., 1], pixels[..., 2]
+        spread = np.maximum(np.maximum(red, green), blue) - np.minimum(np.minimum(red, green), blue)
+        tone |= (spread >= COLOUR_SPREAD) & (grey > INK_LEVEL)
+    return grey, tone
+
+
+def _regions(cells: np.ndarray) -> list[list[tuple[int, int]]]:
+    """
+    The 8-connected regions of a boolean cell grid, largest first.
+    """
+    seen = np.zeros_like(cells)
+    regions = []
+    for start in zip(*np.nonzero(cells)):
+        if seen[start]:
+            continue
+        seen[start] = True
+        region, stack = [], [start]
+        while stack:
+            row, col = stack.pop()
+            region.append((int(row), int(col)))
+            for r in range(max(row - 1, 0), min(row + 2, cells.shape[0])):
+                for c in range(max(col - 1, 0), min(col + 2, cells.shape[1])):
+                    if cells[r, c] and not seen[r, c]:
+                        seen[r, c] = True
+                        stack.append((r, c))
+        regions.append(region)
+    return sorted(regions, key=len, reverse=True)
+
+
+def mask_overlay(image: Image.Image) -> tuple[Image.Image, dict[str, Any]]:
+    """
+    image with a detected watermark or stamp overlay painted paper white, and what was found:
+        detected: whether an overlay was masked.
+        coverage: share of the image the overlay region covers.
+        mask_seconds: time spent.
+    L and RGB images are masked in place; other modes are masked on an RGB copy.  Images without an overlay are
+    returned as they are.
+
+    Overlays are looked for on a reduced copy and confirmed cell by cell at full resolution, so only a large
+    region that is overlay toned throughout is masked, never scattered mid tone strokes.
+    """
+    start = time.perf_counter()
+    found: dict[str, Any] = {"detected": False, "coverage": 0.0, "mask_seconds": 0.0}
+    if image.mode == "1" or min(image.size) < 2:
+        return image, found
+    source = image if image.mode in ("L", "RGB") else image.convert("RGB")
+    width, height = source.size
+    factor = max(1, -(-max(width, height) // DETECT_SIDE))
+    small = source.reduce(factor) if factor > 1 else source
+    small_grey = np.asarray(small.convert("L") if small.mode == "RGB" else small)
+    paper = int(np.percentile(small_grey, 90))
+    _, small_tone = _tones(small, paper)
+    rows, cols = -(-small_tone.shape[0] // CELL), -(-small_tone.shape[1] // CELL)
+    side = CELL * factor
+
+    # candidate cells from the reduced copy, confirmed at full resolution
+    cells = np.zeros((rows, cols), bool)
+    for row in range(rows):
+        for col in range(cols):
+            if small_tone[row * CELL : (row + 1) * CELL, col * CELL : (col + 1) * CELL].mean() >= MIN_CELL_SHARE / 2:
+                box = (col * side, row * side, min((col + 1) * side, width), min((row + 1) * side, height))
+                cells[row, col] = _tones(source.crop(box), paper)[1].mean() >= MIN_CELL_SHARE
+    regions = _regions(cells)
+    region = regions[0] if regions else []
+    coverage = len(region) / cells.size
+    found["coverage"] = round(coverage, 4)
+    if (
+        coverage < MIN_COVERAGE
+        or len({r for r, _ in region}) / rows < MIN_SPREAD
+        or len({c for _, c in region}) / cols < MIN_SPREAD
+        or sum((source if source.mode == "L" else source.convert("L")).histogram()[: INK_LEVEL + 1])
+        < MIN_INK * width * height
+    ):
+        found["mask_seconds"] = round(time.perf_counter() - start, 3)
+        return image, found
+
+    white = 255 if source.mode == "L" else (255, 255, 255)
+    for row, col in region:
+        # one pixel of margin so ink just across the cell edge still protects its anti-aliased border
+        x0, y0 = max(col * side - 1, 0), max(row * side - 1, 0)
+        box = (x0, y0, min((col + 1) * side + 1, width), min((row + 1) * side + 1, height))
+        grey, tone = _tones(source.crop(box), paper)
+        overlay = tone & ~_near(grey <= INK_LEVEL)
+        inner = overlay[row * side - y0 :, col * side - x0 :][:side, :side]
+        mask = Image.fromarray(np.where(inner, 255, 0).astype(np.uint8), "L")
+        source.paste(white, (col * side, row * side, col * side + mask.width, row * side + mask.height), mask)
+    found["detected"] = True
+    found["mask_seconds"] = round(time.perf_counter() - start, 3)
+    return source, found
+
+
+def hide_watermark_layers(doc: pymupdf.Document) -> list[str]:
+    """
+    Switch off the optional content layers of doc named like watermarks, so their text and images are not
+    extracted.  Returns the names of the layers switched off.
+    """
+    hidden = []
+    for layer in doc.layer_ui_configs():
+        if layer.get("on") and WATERMARK_LAYER.search(layer.get("text", "")):
+            doc.set_layer_ui_config(layer["number"], 2)  # 2: off
+            hidden.append(layer["text"])
+    return hidden
+
+
+def remove_watermark_annotations(page: pymupdf.Page) -> list[dict[str, str]]:
+    """
+    Delete the Watermark and Stamp annotations of page and return their type and contents, which often carry the
+    recording details a stamp shows.
+    """
+    removed = []
+    for annot in list(page.annots(types=WATERMARK_ANNOTATIONS)):
+        removed.append({"type": annot.type[1], "content": annot.info.get("content", "")})
+        page.delete_annot(annot)
+    return removed
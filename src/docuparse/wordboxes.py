@@ -0,0 +1,299 @@
+"""
+Word level layout of pages.
+
+WordBoxes holds the words of a page as columns: the words in one space separated string, and their bounding
+boxes, confidences and line numbers as numpy arrays, stored in documents as raw bytes.  Ocr words come from
+tesseract's image_to_data and native pdf words from page.get_text("words").  Boxes are (x0, y0, x1, y1) with the
+origin at the top left, in points on pdf pages and in pixels on image files.
+
+GridIndex buckets the words of every page of a document into square cells, so a region query only tests the words
+of the cells it overlaps and a nearest word query widens ring by ring from the cell of its point.
+"""
+
+import math
+import re
+from dataclasses import dataclass
+from typing import Any, Iterable, Sequence
+
+import numpy as np
+
+# confidence given to words of the pdf text layer
+NATIVE_CONFIDENCE = 100
+
+
+@dataclass
+class WordBoxes:
+    """
+    Words of a page with one box, confidence and line number each.
+    """
+
+    words: list[str]
+    boxes: np.ndarray  # float32 (n, 4)
+    confidences: np.ndarray  # uint8 (n,), 0-100
+    lines: np.ndarray  # uint32 (n,), line number within the page
+
+    @classmethod
+    def empty(cls) -> "WordBoxes":
+        """
+        A page without words.
+        """
+        return cls([], np.zeros((0, 4), np.float32), np.zeros(0, np.uint8), np.zeros(0, np.uint32))
+
+    @classmethod
+    def from_tesseract(cls, data: dict[str, list]) -> "WordBoxes":
+        """
+        The recognized words of pytesseract.image_to_data output, numbered by tesseract's block, paragraph and
+        line.
+        """
+        words, boxes, confidences, lines = [], [], [], []
+        line_ids: dict[tuple, int] = {}
+        for i, text in enumerate(data["text"]):
+            conf = int(float(data["conf"][i]))
+            if conf < 0 or not text.strip():
+                continue
+            left, top = data["left"][i], data["top"][i]
+            words.append(text.strip())
+            boxes.append((left, top, left + data["width"][i], top + data["height"][i]))
+            confidences.append(min(conf, 100))
+            key = (data["block_num"][i], data["par_num"][i], data["line_num"][i])
+            lines.append(line_ids.setdefault(key, len(line_ids)))
+        return cls._columns(words, boxes, confidences, lines)
+
+    @classmethod
+    def from_pymupdf(cls, words: Iterable[Sequence]) -> "WordBoxes":
+        """
+        The words of page.get_text("words"), tuples of (x0, y0, x1, y1, word, block_no, line_no, word_no).
+        """
+        texts, boxes, lines = [], [], []
+        line_ids: dict[tuple, int] = {}
+        for x0, y0, x1, y1, word, block, line, *_ in words:
+            texts.append(word)
+            boxes.append((x0, y0, x1, y1))
+            lines.append(line_ids.setdefault((block, line), len(line_ids)))
+        return cls._columns(texts, boxes, [NATIVE_CONFIDENCE] * len(texts), lines)
+
+    @classmethod
+    def _columns(cls, words: list[str], boxes: list, confidences: list[int], lines: list[int]) -> "WordBoxes":
+        if not words:
+            return cls.empty()
+        return cls(
+            words,
+            np.asarray(boxes, np.float32).reshape(-1, 4),
+            np.asarray(confidences, np.uint8),
+            np.asarray(lines, np.uint32),
+        )
+
+    @classmethod
+    def concat(cls, parts: Sequence["WordBoxes"]) -> "WordBoxes":
+        """
+        The words of all parts, with the line numbers of each part following those of the part before.
+        """
+        parts = [p for p in parts if len(p)]
+        if not parts:
+            return cls.empty()
+        lines, offset = [], 0
+        for part in parts:
+            lines.append(part.lines + offset)
+            offset += int(part.lines.max()) + 1
+        return cls(
+            [w for p in parts for w in p.words],
+            np.concatenate([p.boxes for p in parts]),
+            np.concatenate([p.confidences for p in parts]),
+            np.concatenate(lines).astype(np.uint32),
+        )
+
+    def __len__(self) -> int:
+        return len(self.words)
+
+    def _with_boxes(self, boxes: np.ndarray) -> "WordBoxes":
+        return WordBoxes(self.words, boxes.astype(np.float32), self.confidences, self.lines)
+
+    def scaled(self, sx: float, sy: float, dx: float = 0.0, dy: float = 0.0) -> "WordBoxes":
+        """
+        Boxes scaled by (sx, sy) and then moved by (dx, dy).
+        """
+        return self._with_boxes(self.boxes * np.float32([sx, sy, sx, sy]) + np.float32([dx, dy, dx, dy]))
+
+    def placed(self, size: tuple[int, int], rect: Sequence[float]) -> "WordBoxes":
+        """
+        Boxes of an image of size (width, height) pixels mapped onto the rect (x0, y0, x1, y1) it is drawn in.
+        """
+        width, height = size
+        x0, y0, x1, y1 = rect
+        return self.scaled((x1 - x0) / width, (y1 - y0) / height, x0, y0)
+
+    def unrotated(self, angle: int, size: tuple[int, int]) -> "WordBoxes":
+        """
+        Boxes found on image.rotate(angle, expand=True) mapped back onto the image of size (width, height).
+        Only quarter turns are undone.
+        """
+        width, height = size
+        u0, v0, u1, v1 = self.boxes.T
+        if angle % 360 == 90:
+            x0, y0, x1, y1 = width - v1, u0, width - v0, u1
+        elif angle % 360 == 180:
+            x0, y0, x1, y1 = width - u1, height - v1, width - u0, height - v0
+        elif angle % 360 == 270:
+            x0, y0, x1, y1 = v0, height - u1, v1, height - u0
+        else:
+            return self
+        return self._with_boxes(np.stack([x0, y0, x1, y1], axis=1))
+
+    def line_texts(self) -> list[str]:
+        """
+        The text of each line, words in reading order.
+        """
+        texts: dict[int, list[str]] = {}
+        for word, line in zip(self.words, self.lines.tolist()):
+            texts.setdefault(line, []).append(word)
+        return [" ".join(words) for _, words in sorted(texts.items())]
+
+    def to_dict(self) -> dict[str, Any]:
+        """
+        Compact stored form: the words as one string and the columns as little endian bytes.
+        """
+        return {
+            "text": " ".join(self.words),
+            "boxes": self.boxes.astype("<f4").tobytes(),
+            "conf": self.confidences.tobytes(),
+            "lines": self.lines.astype("<u4").tobytes(),
+        }
+
+    @classmethod
+    def from_dict(cls, stored: dict[str, Any] | None) -> "WordBoxes":
+        """
+        WordBoxes from its stored form.
+        """
+        if not stored or not stored.get("text"):
+            return cls.empty()
+        return cls(
+            stored["text"].split(" "),
+            np.frombuffer(stored["boxes"], "<f4").reshape(-1, 4),
+            np.frombuffer(stored["conf"], np.uint8),
+            np.frombuffer(stored["lines"], "<u4"),
+        )
+
+
+@dataclass(frozen=True)
+class WordHit:
+    """
+    A word found by a GridIndex query.  distance is from the query point to the box, 0 for region queries.
+    """
+
+    page: int
+    word: str
+    box: tuple[float, float, float, float]
+    confidence: int
+    line: int
+    distance: float = 0.0
+
+
+class GridIndex:
+    """
+    Uniform grid over the words of each page of a document.
+
+    Args:
+        pages: the words of each page, in page order.
+        cell: side of a grid cell, in page units.  About the height of a few lines of text works well.
+    """
+
+    def __init__(self, pages: Sequence[WordBoxes], cell: float = 50.0):
+        self.pages = list(pages)
+        self.cell = cell
+        self._cells: list[dict[tuple[int, int], list[int]]] = [self._bucket(p) for p in self.pages]
+
+    @classmethod
+    def from_document(cls, document: dict[str, Any], cell: float = 50.0) -> "GridIndex":
+        """
+        Index of the words stored on the pages of a processed document.
+        """
+        return cls([WordBoxes.from_dict(p.get("words")) for p in document.get("pages_data", [])], cell)
+
+    def _bucket(self, page: WordBoxes) -> dict[tuple[int, int], list[int]]:
+        cells: dict[tuple[int, int], list[int]] = {}
+        spans = np.floor(page.boxes / self.cell).astype(np.int64)
+        for i, (cx0, cy0, cx1, cy1) in enumerate(spans.tolist()):
+            for cx in range(cx0, cx1 + 1):
+                for cy in range(cy0, cy1 + 1):
+                    cells.setdefault((cx, cy), []).append(i)
+        return cells
+
+    def _hit(self, page: int, i: int, distance: float = 0.0) -> WordHit:
+        words = self.pages[page]
+        x0, y0, x1, y1 = words.boxes[i].tolist()
+        return WordHit(page, words.words[i], (x0, y0, x1, y1), int(words.confidences[i]), int(words.lines[i]), distance)
+
+    def region(self, page: int, rect: Sequence[float], min_confidence: int = 0) -> list[WordHit]:
+        """
+        Words of page whose box overlaps rect (x0, y0, x1, y1), in reading order.
+        """
+        x0, y0, x1, y1 = rect
+        cells = self._cells[page]
+        cx0, cy0, cx1, cy1 = (math.floor(v / self.cell) for v in (x0, y0, x1, y1))
+        candidates: set[int] = set()
+        if (cx1 - cx0 + 1) * (cy1 - cy0 + 1) > len(cells):
+            # a region larger than the occupied part of the page, test the occupied cells instead
+            for (cx, cy), ids in cells.items():
+                if cx0 <= cx <= cx1 and cy0 <= cy <= cy1:
+                    candidates.update(ids)
+        else:
+            for cx in range(cx0, cx1 + 1):
+                for cy in range(cy0, cy1 + 1):
+                    candidates.update(cells.get((cx, cy), ()))
+        if not candidates:
+            return []
+        ids = np.fromiter(sorted(candidates), np.int64)
+        words = self.pages[page]
+        boxes = words.boxes[ids]
+        keep = (
+            (boxes[:, 0] <= x1)
+            & (boxes[:, 2] >= x0)
+            & (boxes[:, 1] <= y1)
+            & (boxes[:, 3] >= y0)
+            & (words.confidences[ids] >= min_confidence)
+        )
+        return [self._hit(page, i) for i in ids[keep].tolist()]
+
+    def text(self, page: int, rect: Sequence[float], min_confidence: int = 0) -> str:
+        """
+        Text in rect, one line per line of the page.
+        """
+        lines: dict[int, list[str]] = {}
+        for hit in self.region(page, rect, min_confidence):
+            lines.setdefault(hit.line, []).append(hit.word)
+        return "\n".join(" ".join(words) for _, words in sorted(lines.items()))
+
+    def nearest(self, page: int, point: Sequence[float], k: int = 1, pattern: str | None = None) -> list[WordHit]:
+        """
+        The k words of page closest to point (x, y), nearest first, optionally only words matching the regular
+        expression pattern.  Distance is to the nearest edge of a box, 0 inside it.
+        """
+        cells = self._cells[page]
+        if not cells:
+            return []
+        x, y = point
+        matcher = re.compile(pattern, re.IGNORECASE) if pattern else None
+        words = self.pages[page]
+        px, py = math.floor(x / self.cell), math.floor(y / self.cell)
+        keys = np.asarray(list(cells), np.int64)
+        reach = int(max(np.abs(keys[:, 0] - px).max(), np.abs(keys[:, 1] - py).max()))
+        seen: set[int] = set()
+        found: dict[int, float] = {}
+        for ring in range(reach + 1):
+            for cx in range(px - ring, px + ring + 1):
+                for cy in range(py - ring, py + ring + 1):
+                    if max(abs(cx - px), abs(cy - py)) != ring:
+                        continue
+                    for i in cells.get((cx, cy), ()):
+                        if i in seen:
+                            continue
+                        seen.add(i)
+                        if matcher and not matcher.search(words.words[i]):
+                            continue
+                        x0, y0, x1, y1 = words.boxes[i].tolist()
+                        found[i] = math.hypot(max(x0 - x, 0, x - x1), max(y0 - y, 0, y - y1))
+            # words in cells beyond this ring are at least ring cells away
+            if len(found) >= k and sorted(found.values())[k - 1] <= ring * self.cell:
+                break
+        best = sorted(found.items(), key=lambda item: item[1])[:k]
+        return [self._hit(page, i, distance) for i, distance in best]
@@ -0,0 +1,104 @@
+# pylint: disable=redefined-outer-name
+# pylint: disable=missing-function-docstring
+# pylint: disable=missing-module-docstring
+import mongomock
+import pytest
+
+from docuparse import codec
+from docuparse.processors import merge_pages
+from docuparse.store import MongoDBDataReader, MongoDBDataWriter
+
+
+class Connection:  # pylint: disable=too-few-public-methods
+    def __init__(self):
+        self.db = mongomock.MongoClient().db
+        self.collection = self.db.documents
+
+
+def image(text, language="Latin", **extra):
+    return {
+        "rotation": 0,
+        "script_language": language,
+        "format": "PNG",
+        "mode": "RGB",
+        "filename": "",
+        "info": {"dpi": [96.0, 96.0]},
+        "text": text,
+        **extra,
+    }
+
+
+@pytest.fixture
+def document():
+    pages = [
+        {"images": [image("LOT 1 BLOCK A"), image("CRYSTAL FALLS", "Cyrillic")], "combined_text": []},
+        {"images": [], "combined_text": []},
+        {"images": [image("SHEET 3 OF 3", timed_out=False)], "combined_text": []},
+    ]
+    for page, native in zip(pages, ["native text", "", "more native"]):
+        page["combined_text"] = [i["text"] for i in page["images"]] + [native]
+    return {**merge_pages(pages), "processing_seconds": 1.5}
+
+
+@pytest.mark.parametrize("compress_over", [0, 10**6])
+def test_round_trip(document, compress_over):
+    encoded = codec.encode(document, compress_over)
+    assert encoded["_schema"] == codec.SCHEMA_VERSION
+    assert ("text_z" in encoded) == (compress_over == 0)
+    assert "pages_data" not in encoded and "merged_text" not in encoded
+    assert len(encoded["meta"]) == 2
+    assert all("text" not in i for p in encoded["pages"] for i in p["images"])
+    assert codec.decode(encoded) == document
+
+
+def test_round_trip_keeps_differing_texts(document):
+    document["pages_data"][0]["images"][0]["text"] = "not the segment"
+    del document["pages_data"][2]["images"][0]["text"]
+    document["merged_text"] = "edited"
+    assert codec.decode(codec.encode(document)) == document
+
+
+def test_other_documents_pass_through():
+    link = {"duplicate_of": "a.pdf", "similarity": 1.0}
+    assert codec.encode(link) is link
+    assert codec.decode(link) is link
+    with pytest.raises(ValueError):
+        codec.decode({"_id": "a", "_schema": 99})
+
+
+def test_projection():
+    assert codec.projection(None) is None
+    assert codec.projection({"entities": 1}) == {"entities": 1}
+    assert codec.projection({"merged_text": 0}) == {"merged_text": 0}
+    fields = codec.projection({"pages_data.combined_text": 1})
+    assert {"pages_data.combined_text", "_schema", "text", "text_z", "pages", "meta"} <= set(fields)
+
+
+def test_writer_stores_compact_and_reader_decodes(document):
+    connection = Connection()
+    writer = MongoDBDataWriter(connection, compact=True)  # type: ignore[arg-type]
+    assert writer.write_data({"a.pdf": dict(document)})
+    MongoDBDataWriter(connection, compact=False).write_data({"b.pdf": dict(document)})  # type: ignore[arg-type]
+    stored = connection.collection.find_one("a.pdf")
+    assert stored["_schema"] == codec.SCHEMA_VERSION and "pages_data" not in stored
+
+    reader = MongoDBDataReader(connection)  # type: ignore[arg-type]
+    for d in reader.read_data():
+        assert {k: v for k, v in d.items() if k != "_id"} == document
+    projected = list(reader.iter_data(projection={"pages_data.combined_text": 1}))
+    assert [p["pages_data"][0]["combined_text"] for p in projected] == [
+        ["LOT 1 BLOCK A", "CRYSTAL FALLS", "native text"]
+    ] * 2
+    assert MongoDBDataReader(connection, decode=False).read_data({"_id": "a.pdf"})[0]["_schema"] == 1  # type: ignore
+
+
+@pytest.mark.parametrize("compress_text", [False, True])
+def test_large_text_stays_searchable_unless_compressed(document, compress_text):
+    document["pages_data"][0]["combined_text"][-1] = "native text " * 400
+    document["merged_text"] = "".join(" ".join(p["combined_text"]) for p in document["pages_data"])
+    connection = Connection()
+    MongoDBDataWriter(connection, compress_text=compress_text).write_data({"a.pdf": dict(document)})  # type: ignore
+    stored = connection.collection.find_one("a.pdf")
+    assert ("text_z" in stored) == compress_text
+    assert (connection.collection.find_one({"text": {"$regex": "CRYSTAL FALLS"}}) is None) == compress_text
+    assert codec.decode(stored) == {**document, "_id": "a.pdf"}
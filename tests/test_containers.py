@@ -0,0 +1,194 @@
+# pylint: disable=redefined-outer-name
+# pylint: disable=missing-function-docstring
+# pylint: disable=missing-module-docstring
+import hashlib
+import io
+import tarfile
+import zipfile
+from typing import Any
+
+import pymupdf
+import pytest
+from PIL import Image
+
+from docuparse.containers import ArchiveDataSource, ArchiveMember, FileDataDirectory, document_fields, is_archive
+from docuparse.ocr import OCREngine
+
+
+class MemoryWriter:
+    def __init__(self, existing: tuple[str, ...] = ()):
+        self.data: dict[str, Any] = {k: {} for k in existing}
+        self.order: list[str] = []
+
+    def write_data(self, data: dict[str, Any], force: bool = False) -> bool:
+        self.data.update(data)
+        self.order.extend(data)
+        return True
+
+    def exists(self, uri: str) -> bool:
+        return uri in self.data
+
+    def close(self) -> None:
+        pass
+
+
+@pytest.fixture(autouse=True)
+def recognized(monkeypatch):
+    def perform_ocr(self, image=None, file_name="", timeout=None):
+        return {"text": f"{image.size[0]}x{image.size[1]}", "file_path": f"{file_name}_image_0"}
+
+    monkeypatch.setattr(OCREngine, "perform_ocr", perform_ocr)
+
+
+def png_bytes(width: int) -> bytes:
+    buffer = io.BytesIO()
+    Image.new("RGB", (width, 10), "white").save(buffer, format="PNG")
+    return buffer.getvalue()
+
+
+def pdf_bytes() -> bytes:
+    with pymupdf.open() as doc:
+        page = doc.new_page()
+        page.insert_text((72, 72), "BLOCK A")
+        page.insert_image(pymupdf.Rect(100, 100, 200, 200), stream=png_bytes(30))
+        return doc.tobytes()
+
+
+MEMBERS = {"plats/a.pdf": pdf_bytes, "scans/b.png": lambda: png_bytes(20), "notes.txt": lambda: b"skip"}
+
+
+@pytest.fixture
+def zip_archive(tmp_path):
+    path = tmp_path / "bundle.zip"
+    with zipfile.ZipFile(path, "w") as archive:
+        for name, data in MEMBERS.items():
+            archive.writestr(name, data())
+    return path
+
+
+@pytest.fixture
+def tar_archive(tmp_path):
+    path = tmp_path / "bundle.tar.gz"
+    with tarfile.open(path, "w:gz") as archive:
+        for name, data in MEMBERS.items():
+            content = data()
+            info = tarfile.TarInfo(name)
+            info.size = len(content)
+            archive.addfile(info, io.BytesIO(content))
+    return path
+
+
+def run(container, writer, force=False):
+    container.writers = [writer]
+    container.process_files(force=force)
+    return writer.data
+
+
+@pytest.mark.parametrize("workers", [1, 2])
+@pytest.mark.parametrize("archive", ["zip_archive", "tar_archive"])
+def test_archive(request, archive, workers):
+    data = run(ArchiveDataSource(request.getfixturevalue(archive), workers=workers), MemoryWriter())
+    assert sorted(data) == ["plats/a.pdf", "scans/b.png"]
+    assert data["scans/b.png"]["merged_text"] == "20x10"
+    assert data["plats/a.pdf"]["pages_data"][0]["combined_text"][0] == "30x10"
+    assert "BLOCK A" in data["plats/a.pdf"]["merged_text"]
+
+
+def test_archive_skips_existing(zip_archive):
+    writer = MemoryWriter(existing=("plats/a.pdf",))
+    data = run(ArchiveDataSource(zip_archive), writer)
+    assert data["plats/a.pdf"] == {}
+    assert data["scans/b.png"]["merged_text"] == "20x10"
+    data = run(ArchiveDataSource(zip_archive), writer, force=True)
+    assert data["plats/a.pdf"]["merged_text"]
+
+
+@pytest.mark.parametrize("archive", ["zip_archive", "tar_archive"])
+def test_archive_estimates_from_headers(request, archive, monkeypatch):
+    def read(self, *args, **kwargs):
+        raise AssertionError("whole member read")
+
+    monkeypatch.setattr(zipfile.ZipFile, "read", read)
+    estimates = {e.doc_id: e for e in ArchiveDataSource(request.getfixturevalue(archive)).estimates(list(MEMBERS)[:2])}
+    assert estimates["scans/b.png"].image_pixels == 200
+    assert estimates["plats/a.pdf"].cost > estimates["scans/b.png"].cost
+
+
+def test_directory(tmp_path):
+    (tmp_path / "b.png").write_bytes(png_bytes(20))
+    data = run(FileDataDirectory(tmp_path, workers=2), MemoryWriter())
+    assert data == {str(tmp_path / "b.png"): data[str(tmp_path / "b.png")]}
+    assert data[str(tmp_path / "b.png")]["merged_text"] == "20x10"
+
+
+def test_document_fields(zip_archive):
+    data = run(ArchiveDataSource(zip_archive), MemoryWriter())
+    document = data["plats/a.pdf"]
+    assert document["page_count"] == 1
+    assert document["source_directory"] == "plats"
+    with zipfile.ZipFile(zip_archive) as archive:
+        assert document["content_hash"] == hashlib.sha256(archive.read("plats/a.pdf")).hexdigest()
+    assert document["processed_at"].tzinfo is not None
+    assert document["quality"] is None
+    scored = {
+        "pages_data": [{"images": [{"ocr_quality": {"quality_score": 0.5}}, {"ocr_quality": {"quality_score": 1}}]}]
+    }
+    assert document_fields("data\\plats\\a.pdf", scored, "h")["quality"] == 0.75
+    assert document_fields("data\\plats\\a.pdf", scored, "h")["source_directory"] == "data/plats"
+
+
+def test_is_archive():
+    assert is_archive("records.ZIP")
+    assert is_archive("records.tar.gz")
+    assert not is_archive("data/test/plats")
+
+
+def test_largest_first_and_report(tmp_path):
+    for width in (20, 400, 100):
+        (tmp_path / f"{width}.png").write_bytes(png_bytes(width))
+    container = FileDataDirectory(tmp_path)
+    writer = MemoryWriter()
+    container.writers = [writer]
+    report = container.process_files()
+    assert writer.order == [str(tmp_path / f"{w}.png") for w in (400, 100, 20)]
+    assert report.documents == 3
+    assert report.written == 3
+    assert report.predicted_seconds == pytest.approx(report.estimated_cost)
+
+
+def test_dry_run_report(zip_archive):
+    container = ArchiveDataSource(zip_archive, workers=2)
+    writer = MemoryWriter()
+    container.writers = [writer]
+    report = container.process_files(dry_run=True)
+    assert not writer.data
+    assert report.documents == 2
+    assert report.largest[0][0] == "plats/a.pdf"
+    assert 0 < report.predicted_seconds < report.estimated_cost
+    assert "predicted run time" in report.summary()
+
+
+def test_auto_workers(zip_archive):
+    container = ArchiveDataSource(zip_archive, workers=0, cpus=4)
+    container.writers = [MemoryWriter()]
+    report = container.process_files(dry_run=True)
+    assert report.workers == 2
+    assert report.layout.endswith("= 4 cpus")
+
+
+def test_auto_workers_read_zip_members_themselves(zip_archive, monkeypatch):
+    sent = []
+    sources = ArchiveDataSource._sources  # pylint: disable=protected-access
+
+    def spy(self, names, parallel=False):
+        for doc_id, source in sources(self, names, parallel):
+            if parallel:
+                sent.append(source)
+            yield doc_id, source
+
+    monkeypatch.setattr(ArchiveDataSource, "_sources", spy)
+    container = ArchiveDataSource(zip_archive, workers=0, cpus=4)
+    assert container.layout().workers > 1
+    data = run(container, MemoryWriter())
+    assert data["scans/b.png"]["merged_text"] == "20x10"
+    assert sent and all(isinstance(source, ArchiveMember) for source in sent)
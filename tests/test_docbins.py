@@ -0,0 +1,92 @@
+# pylint: disable=redefined-outer-name
+# pylint: disable=missing-function-docstring
+# pylint: disable=missing-module-docstring
+import spacy
+
+from docuparse.docbins import DocBinStore, text_hash
+from docuparse.text_analysis import NLPEnricher
+
+
+class CountingRuler:  # pylint: disable=too-few-public-methods
+    def __init__(self):
+        self.nlp = spacy.blank("en")
+        self.nlp.add_pipe("entity_ruler", name="ner").add_patterns([{"label": "GPE", "pattern": "Travis"}])
+        self.texts = []
+        pipe = self.nlp.pipe
+
+        def counting_pipe(texts, as_tuples=False, **kwargs):
+            texts = list(texts)
+            if as_tuples:
+                self.texts.extend(t for t, _ in texts)
+            return pipe(texts, as_tuples=as_tuples, **kwargs)
+
+        self.nlp.pipe = counting_pipe
+
+
+def test_store_round_trip(tmp_path):
+    nlp = spacy.blank("en")
+    store = DocBinStore(tmp_path, shard_size=2)
+    for i in range(5):
+        store.add(nlp(f"page {i}"), "a.pdf", i)
+    assert len(list(tmp_path.glob("*.spacy"))) == 2
+    store.close()
+    reopened = DocBinStore(tmp_path)
+    assert reopened.has("a.pdf", 4, text_hash("page 4"))
+    assert not reopened.has("a.pdf", 4, text_hash("changed"))
+    assert reopened.load("a.pdf", 3, nlp.vocab).text == "page 3"
+    assert reopened.load("b.pdf", 0, nlp.vocab) is None
+    assert [(k.page, d.text) for k, d in reopened.iter_docs(nlp.vocab)] == [(i, f"page {i}") for i in range(5)]
+    assert [k.page for k, _ in reopened.iter_docs(nlp.vocab, shards=[1])] == [2, 3]
+
+
+def test_store_replaces_page(tmp_path):
+    nlp = spacy.blank("en")
+    store = DocBinStore(tmp_path)
+    store.add(nlp("old"), "a.pdf", 0)
+    store.flush()
+    store.add(nlp("new"), "a.pdf", 0)
+    store.close()
+    docs = list(DocBinStore(tmp_path).iter_docs(nlp.vocab))
+    assert [d.text for _, d in docs] == ["new"]
+
+
+def test_enricher_reuses_stored_docs(tmp_path):
+    ruler = CountingRuler()
+    documents = [
+        {"_id": "a.pdf", "pages_data": [{"combined_text": ["County of Travis"]}, {"combined_text": ["lot 1"]}]},
+    ]
+    first = dict(NLPEnricher(nlp=ruler.nlp, docbins=DocBinStore(tmp_path)).enrich(documents))
+    assert ruler.texts == ["County of Travis", "lot 1"]
+
+    documents[0]["pages_data"][1]["combined_text"] = ["lot 2"]
+    second = dict(NLPEnricher(nlp=ruler.nlp, docbins=DocBinStore(tmp_path)).enrich(documents))
+    assert ruler.texts == ["County of Travis", "lot 1", "lot 2"]
+    assert first == second
+    assert second["a.pdf"][0]["text"] == "Travis"
+
+
+def test_enricher_reannotates_for_another_pipeline_or_force(tmp_path):
+    ruler = CountingRuler()
+    documents = [{"_id": "a.pdf", "pages_data": [{"combined_text": ["County of Travis"]}]}]
+    list(NLPEnricher(nlp=ruler.nlp, docbins=DocBinStore(tmp_path)).enrich(documents))
+    list(NLPEnricher(nlp=ruler.nlp, docbins=DocBinStore(tmp_path)).enrich(documents, force=True))
+    assert len(ruler.texts) == 2
+
+    other = CountingRuler()
+    other.nlp.add_pipe("sentencizer")
+    enricher = NLPEnricher(nlp=other.nlp, docbins=DocBinStore(tmp_path))
+    list(enricher.enrich(documents))
+    assert other.texts == ["County of Travis"]
+    assert DocBinStore(tmp_path).has("a.pdf", 0, pipeline=enricher.pipeline)
+    assert not DocBinStore(tmp_path).has("a.pdf", 0, pipeline=NLPEnricher(nlp=ruler.nlp).pipeline)
+
+
+def test_store_reads_manifests_without_pipeline(tmp_path):
+    nlp = spacy.blank("en")
+    store = DocBinStore(tmp_path)
+    store.add(nlp("page"), "a.pdf", 0)
+    store.close()
+    (tmp_path / "shard-00000.json").write_text(f'[["a.pdf", 0, "{text_hash("page")}"]]', encoding="utf8")
+    reopened = DocBinStore(tmp_path)
+    assert reopened.has("a.pdf", 0, text_hash("page")) and not reopened.has("a.pdf", 0, pipeline="en_x-1:ner")
+    assert reopened.load("a.pdf", 0, nlp.vocab) is reopened.load("a.pdf", 0, nlp.vocab)
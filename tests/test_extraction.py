@@ -0,0 +1,68 @@
+# pylint: disable=redefined-outer-name
+# pylint: disable=missing-function-docstring
+# pylint: disable=missing-module-docstring
+import pytest
+
+from docuparse.extraction import ExtractionEngine, benchmark, normalize
+
+PAGE = (
+    "GRAND MESA AT CRYSTAL FALLS II, SECTION 5  LOTS 1 AND 2, BLOCK A.  N 45°12'30\" E 120.50 "
+    "S 8*05' W  DOC. NO. 2018000123  Recorded Plat GM9 (201800051)  R.P.L.S. NO. 4567  lot 12A"
+)
+
+
+@pytest.fixture(scope="module")
+def engine():
+    return ExtractionEngine(["Crystal Falls", "Grand Mesa", "Cap Rock"])
+
+
+def test_extract(engine):
+    found = [(e.kind, e.value) for e in engine.extract(PAGE, page=3)]
+    assert found == [
+        ("subdivision", "Grand Mesa"),
+        ("subdivision", "Crystal Falls"),
+        ("section", "5"),
+        ("lot", "1,2"),
+        ("block", "A"),
+        ("bearing", "N45°12'30\"E"),
+        ("bearing", "S8*05'W"),
+        ("instrument", "2018000123"),
+        ("instrument", "201800051"),
+        ("registration", "4567"),
+        ("lot", "12A"),
+    ]
+    assert {e.page for e in engine.extract(PAGE, page=3)} == {3}
+
+
+def test_offsets(engine):
+    for e in engine.extract(PAGE):
+        assert PAGE[e.start : e.end] == e.text
+
+
+@pytest.mark.parametrize(
+    "kind, text, value",
+    [("lot", "Lots 3 thru 7", "3,7"), ("block", "block 12", "12"), ("registration", "P.E. 89353", "89353")],
+)
+def test_normalize(kind, text, value):
+    assert normalize(kind, text) == value
+
+
+def test_extract_document(engine):
+    document = {"pages_data": [{"combined_text": ["Cap Rock"]}, {"combined_text": ["LOT 4", "BLOCK 2"]}]}
+    assert [(e.kind, e.page) for e in engine.extract_document(document)] == [
+        ("subdivision", 0),
+        ("lot", 1),
+        ("block", 1),
+    ]
+
+
+def test_from_file(tmp_path):
+    path = tmp_path / "names.txt"
+    path.write_text("Cap Rock\n\nFairways at Crystal Falls\n", encoding="utf8")
+    assert ExtractionEngine.from_file(str(path)).names == ["Cap Rock", "Fairways at Crystal Falls"]
+
+
+def test_benchmark_agrees(engine):
+    report = benchmark(engine, [PAGE, "nothing", "Fairways LOT 9"])
+    assert report["agreement"] == 1.0
+    assert report["extractions"] == 12
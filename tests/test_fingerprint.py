@@ -0,0 +1,154 @@
+# pylint: disable=redefined-outer-name
+# pylint: disable=missing-function-docstring
+# pylint: disable=missing-module-docstring
+import io
+import random
+
+import mongomock
+import pymupdf
+import pytest
+from PIL import Image, ImageDraw
+
+from docuparse.containers import FileDataDirectory
+from docuparse.fingerprint import FingerprintIndex, fingerprint, minhash, similarity, text_shingles
+from docuparse.ocr import OCREngine
+
+WORDS = "lot block survey easement bearing north south east west feet chain line corner monument tract parcel".split()
+
+
+def plat(seed: int, noise: int = 0) -> Image.Image:
+    rng = random.Random(seed)
+    image = Image.new("L", (400, 300), "white")
+    draw = ImageDraw.Draw(image)
+    for _ in range(40):
+        draw.line([rng.randrange(400), rng.randrange(300), rng.randrange(400), rng.randrange(300)], fill=0, width=3)
+    noisy = random.Random(noise)
+    for _ in range(noise):
+        draw.point((noisy.randrange(400), noisy.randrange(300)), fill=0)
+    return image
+
+
+def png(image: Image.Image, **kwargs) -> bytes:
+    buffer = io.BytesIO()
+    image.save(buffer, format="PNG", **kwargs)
+    return buffer.getvalue()
+
+
+def text_pdf(seed: int, extra: str = "") -> bytes:
+    rng = random.Random(seed)
+    with pymupdf.open() as doc:
+        page = doc.new_page()
+        text = " ".join(rng.choice(WORDS) for _ in range(200)) + extra
+        page.insert_textbox(pymupdf.Rect(36, 36, 576, 756), text)
+        return doc.tobytes()
+
+
+@pytest.fixture
+def index():
+    return FingerprintIndex(mongomock.MongoClient().db.fingerprints)
+
+
+def test_minhash_estimates_jaccard():
+    a = {str(i) for i in range(1000)}
+    b = {str(i) for i in range(100, 1100)}
+    assert similarity(minhash(a), minhash(a)) == 1.0
+    assert similarity(minhash(a), minhash(b)) == pytest.approx(900 / 1100, abs=0.1)
+    assert minhash(set()) == ()
+
+
+def test_text_shingles():
+    assert text_shingles("Lot 1 Block A Survey", 2) == {"lot 1", "1 block", "block a", "a survey"}
+    assert not text_shingles("")
+
+
+def test_exact_duplicate(index):
+    data = png(plat(1))
+    index.add(fingerprint("a.png", data))
+    match = index.match(fingerprint("copy.png", data))
+    assert match.duplicate_of == "a.png"
+    assert match.exact
+
+
+def test_near_duplicate_raster(index):
+    index.add(fingerprint("plat.png", png(plat(1))))
+    index.add(fingerprint("other.png", png(plat(2))))
+    resave = fingerprint("plat rev 3.png", png(plat(1, noise=30), compress_level=1))
+    match = index.match(resave)
+    assert match.duplicate_of == "plat.png"
+    assert not match.exact
+    assert index.match(fingerprint("new.png", png(plat(3)))) is None
+
+
+def test_near_duplicate_text(index):
+    index.add(fingerprint("a.pdf", text_pdf(1)))
+    fp = fingerprint("a rev 2.pdf", text_pdf(1, " recorded"))
+    assert fp.kind == "text"
+    assert index.match(fp).duplicate_of == "a.pdf"
+    assert index.match(fingerprint("b.pdf", text_pdf(2))) is None
+
+
+def test_index_persists(index):
+    index.add(fingerprint("plat.png", png(plat(1))))
+    reopened = FingerprintIndex(index.collection)
+    assert reopened.match(fingerprint("plat rev 3.png", png(plat(1, noise=30)))).duplicate_of == "plat.png"
+
+
+class MemoryWriter:
+    def __init__(self):
+        self.data = {}
+
+    def write_data(self, data, force=False):
+        self.data.update(data)
+        return True
+
+    def exists(self, uri):
+        return uri in self.data
+
+
+def test_container_links_duplicates(tmp_path, monkeypatch, index):
+    recognized = []
+
+    def perform_ocr(self, image=None, file_name="", timeout=None):
+        recognized.append(file_name)
+        return {"text": "", "file_path": file_name}
+
+    monkeypatch.setattr(OCREngine, "perform_ocr", perform_ocr)
+    (tmp_path / "plat.png").write_bytes(png(plat(1)))
+    (tmp_path / "plat copy.png").write_bytes(png(plat(1)))
+    container = FileDataDirectory(tmp_path, fingerprints=index)
+    container.writers = [MemoryWriter()]
+    assert len(container.process_files(dry_run=True).duplicates) == 1
+
+    report = container.process_files()
+    (tmp_path / "plat rev 3.png").write_bytes(png(plat(1, noise=30)))
+    rerun = container.process_files()
+    assert len(recognized) == 1
+    assert len(report.duplicates) == 1
+    assert rerun.duplicates[0][1] == recognized[0]
+    links = {k: v["duplicate_of"] for k, v in container.writers[0].data.items() if "duplicate_of" in v}
+    assert len(links) == 2
+    assert str(tmp_path / "plat rev 3.png") in links
+    assert set(links.values()) == {recognized[0]}
+
+
+class RefusingWriter(MemoryWriter):
+    def write_data(self, data, force=False):
+        self.data.update(data)
+        return False
+
+
+def test_fingerprints_indexed_only_once_written(tmp_path, monkeypatch, index):
+    monkeypatch.setattr(OCREngine, "perform_ocr", lambda self, image=None, file_name="", timeout=None: {"text": ""})
+    (tmp_path / "plat.png").write_bytes(png(plat(1)))
+    (tmp_path / "plat copy.png").write_bytes(png(plat(1)))
+    container = FileDataDirectory(tmp_path, fingerprints=index)
+    container.writers = [RefusingWriter()]
+    report = container.process_files()
+    assert len(report.duplicates) == 1 and report.written == 0
+    assert index.collection.count_documents({}) == 0
+    assert not any("duplicate_of" in v for v in container.writers[0].data.values())
+
+    container.writers = [MemoryWriter()]
+    container.process_files()
+    assert index.collection.count_documents({}) == 1
+    assert len(container.writers[0].data) == 2
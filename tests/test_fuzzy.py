@@ -0,0 +1,106 @@
+# pylint: disable=redefined-outer-name
+# pylint: disable=missing-function-docstring
+# pylint: disable=missing-module-docstring
+import pytest
+
+from docuparse.fuzzy import TrigramIndex, TrigramIndexWriter, edit_distance, trigrams
+
+DOCUMENTS = {
+    "plats/a.pdf": {
+        "pages_data": [
+            {"combined_text": ["JESCRIBED as follows", "McLAUGHLIN,. AM"]},
+            {"combined_text": ["DEDICATED to the public"]},
+        ]
+    },
+    "plats/b.pdf": {"pages_data": [{"combined_text": ["described by metes and bounds"]}]},
+    "notes.png": {"merged_text": "mclaughlin survey"},
+}
+
+
+@pytest.fixture
+def index():
+    index = TrigramIndex()
+    for doc_id, document in DOCUMENTS.items():
+        index.add_document(doc_id, document)
+    return index
+
+
+def test_trigrams():
+    assert trigrams("lot") == {"$lo", "lot", "ot$"}
+
+
+@pytest.mark.parametrize(
+    "a, b, limit, expected",
+    [("described", "jescribed", 2, 1), ("kitten", "sitting", 3, 3), ("kitten", "sitting", 2, 3), ("a", "abcd", 1, 2)],
+)
+def test_edit_distance(a, b, limit, expected):
+    assert edit_distance(a, b, limit) == expected
+
+
+def test_similar(index):
+    assert index.similar("DESCRIBED", 1) == [("described", 0), ("jescribed", 1)]
+    assert index.similar("dedicatd", 1) == [("dedicated", 1)]
+    assert not index.similar("subdivision", 2)
+
+
+def test_candidates_prune(index):
+    candidates = {index.terms[i] for i in index.candidates("described", 1)}
+    assert "described" in candidates
+    assert "follows" not in candidates
+
+
+def test_search_pages(index):
+    results = index.search("described")
+    assert [r.doc_id for r in results] == ["plats/b.pdf", "plats/a.pdf"]
+    assert results[1].pages[0].page == 0
+    assert results[1].pages[0].snippet == "jescribed"
+
+
+def test_search_all_words(index):
+    assert [r.doc_id for r in index.search("mclaughlin survey")] == ["notes.png"]
+    assert sorted(r.doc_id for r in index.search("mclaughlin")) == ["notes.png", "plats/a.pdf"]
+
+
+def test_replace_document(index):
+    index.add("plats/b.pdf", ["nothing relevant"])
+    assert [r.doc_id for r in index.search("described", 0)] == []
+
+
+def test_writer_incremental_and_persistent(tmp_path):
+    path = tmp_path / "fuzzy.json"
+    writer = TrigramIndexWriter(path, save_every=2)
+    assert writer.write_data({"plats/a.pdf": DOCUMENTS["plats/a.pdf"]})
+    assert not path.exists()
+    assert writer.exists("plats/a.pdf")
+    assert not writer.write_data({"plats/a.pdf": DOCUMENTS["plats/b.pdf"]})
+    assert writer.write_data({"plats/b.pdf": DOCUMENTS["plats/b.pdf"]})
+    assert not path.exists()
+    assert sorted(TrigramIndex(path).documents) == ["plats/a.pdf", "plats/b.pdf"]
+    writer.write_data({"notes.png": DOCUMENTS["notes.png"]})
+    writer.close()
+    assert path.exists() and not writer.index.segments_path.exists()
+    reopened = TrigramIndex(path)
+    assert sorted(reopened.documents) == sorted(DOCUMENTS)
+    assert [r.doc_id for r in reopened.search("mclaughlin survey")] == ["notes.png"]
+    reopened.remove("notes.png")
+    assert [r.doc_id for r in reopened.search("mclaughlin")] == ["plats/a.pdf"]
+
+
+def test_segments_replay_replacements_and_removals(tmp_path):
+    path = tmp_path / "fuzzy.json"
+    index = TrigramIndex(path)
+    index.add_document("plats/a.pdf", DOCUMENTS["plats/a.pdf"])
+    index.add_document("notes.png", DOCUMENTS["notes.png"])
+    index.save()
+    index.add("plats/a.pdf", ["nothing relevant"])
+    index.remove("notes.png")
+    index.append()
+    index.add_document("plats/b.pdf", DOCUMENTS["plats/b.pdf"])
+    index.append()
+    with open(index.segments_path, "a", encoding="utf8") as f:
+        f.write('{"removed": ["plats/b.pdf"]')
+
+    reopened = TrigramIndex(path)
+    assert sorted(reopened.documents) == ["plats/a.pdf", "plats/b.pdf"]
+    assert [r.doc_id for r in reopened.search("described", 1)] == ["plats/b.pdf"]
+    assert not reopened.search("mclaughlin") and not reopened.unsaved
@@ -0,0 +1,52 @@
+# pylint: disable=missing-function-docstring
+# pylint: disable=missing-module-docstring
+import threading
+
+from docuparse.memory import MemoryBudget, image_memory, peak_rss
+
+
+def test_image_memory_scales_with_components():
+    assert image_memory(100, 100, 1) < image_memory(100, 100, 3) < image_memory(100, 100, 4)
+    assert image_memory(100, 100, 1, 1) == image_memory(100, 100, 1, 8)
+
+
+def test_unbounded_budget_admits_everything():
+    budget = MemoryBudget()
+    budget.acquire(10)
+    budget.acquire(10**12)
+    assert budget.in_flight == 10 + 10**12
+    assert budget.waits == 0
+
+
+def test_oversized_image_runs_alone():
+    budget = MemoryBudget(limit=10)
+    with budget.reserve(100):
+        assert budget.in_flight == 100
+    assert budget.in_flight == 0
+    assert budget.peak == 100
+
+
+def test_acquire_waits_for_release():
+    budget = MemoryBudget(limit=10)
+    budget.acquire(8)
+    admitted = threading.Event()
+
+    def second():
+        budget.acquire(5)
+        admitted.set()
+
+    thread = threading.Thread(target=second)
+    thread.start()
+    assert not admitted.wait(0.1)
+    budget.release(8)
+    assert admitted.wait(5)
+    thread.join()
+    assert budget.in_flight == 5
+    assert budget.peak == 8
+    assert budget.waits == 1
+
+
+def test_peak_rss():
+    self_bytes, child_bytes = peak_rss()
+    assert self_bytes > 0
+    assert child_bytes >= 0
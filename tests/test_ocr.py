@@ -0,0 +1,153 @@
+# pylint: disable=redefined-outer-name
+# pylint: disable=missing-function-docstring
+# pylint: disable=missing-module-docstring
+import os
+from array import array
+
+import pytesseract
+import pytest
+from PIL import Image
+
+from docuparse import get_logger
+from docuparse.ocr import CPUBudget, CPULayout, OCREngine, confidence_quality, words_from_data
+
+logger = get_logger()
+
+tesseract_data: dict[str, list] = {
+    "text": ["", "LOT", "12", " ", "BLOCK", "A"],
+    "conf": [-1, 96, 91.5, -1, "40", 88],
+    "left": [0, 2, 10, 0, 2, 14],
+    "top": [0, 1, 1, 0, 6, 6],
+    "width": [20, 6, 3, 0, 10, 2],
+    "height": [10, 4, 4, 0, 3, 3],
+    "block_num": [1, 1, 1, 1, 1, 1],
+    "par_num": [1, 1, 1, 1, 1, 1],
+    "line_num": [0, 1, 1, 1, 2, 2],
+}
+
+
+@pytest.fixture(autouse=True)
+def no_readability(monkeypatch):
+    monkeypatch.setattr(OCREngine, "readability_score", lambda self, text: 0.0)
+
+
+@pytest.fixture
+def image():
+    return Image.new("RGB", (40, 20), "white")
+
+
+def test_words_from_data():
+    text, confidences = words_from_data(tesseract_data)
+    assert text == "LOT 12 BLOCK A"
+    assert confidences == array("B", [96, 91, 40, 88])
+
+
+def test_confidence_quality():
+    quality = confidence_quality([96, 91, 40, 88])
+    assert quality["word_count"] == 4
+    assert quality["mean_confidence"] == 78.75
+    assert quality["p10_confidence"] == 40.0
+    assert quality["low_confidence_ratio"] == 0.25
+    assert quality["quality_score"] == 0.7875
+
+
+def test_confidence_quality_empty():
+    quality = confidence_quality([])
+    assert quality["word_count"] == 0
+    assert quality["quality_score"] == 0.0
+
+
+def test_tesseract_engine_single_call(monkeypatch, image):
+    calls = []
+
+    def image_to_data(*args, **kwargs):
+        calls.append(kwargs)
+        return tesseract_data
+
+    monkeypatch.setattr(pytesseract, "image_to_data", image_to_data)
+    monkeypatch.setattr(pytesseract, "image_to_string", lambda *a, **k: pytest.fail("image_to_string called"))
+    engine = OCREngine(image)
+    engine.get_ocr_text()
+    quality = engine.ocr_quality(engine.image_data["text"])
+    assert len(calls) == 1
+    assert engine.image_data["word_confidences"] == bytes([96, 91, 40, 88])
+    boxes = engine.image_data["word_boxes"]
+    assert boxes.words == ["LOT", "12", "BLOCK", "A"]
+    assert boxes.boxes[0].tolist() == [2, 1, 8, 5]
+    assert boxes.lines.tolist() == [0, 0, 1, 1]
+    assert quality["engine"] == "tesseract"
+    assert quality["mean_confidence"] == 78.75
+
+
+def test_dictionary_engine(monkeypatch, image):
+    monkeypatch.setattr(pytesseract, "image_to_string", lambda *a, **k: "lot\nqzxv")
+    monkeypatch.setattr(OCREngine, "is_english_word", lambda self, word: word == "lot")
+    engine = OCREngine(image, quality_engine="dictionary")
+    engine.get_ocr_text()
+    quality = engine.ocr_quality(engine.image_data["text"], 50)
+    assert engine.image_data["text"] == "lot qzxv"
+    assert quality["engine"] == "dictionary"
+    assert quality["quality_score"] == 0.5
+
+
+def test_unknown_engine():
+    with pytest.raises(ValueError):
+        OCREngine(quality_engine="abbyy")
+
+
+def test_cpu_budget_layouts():
+    budget = CPUBudget(8)
+    assert budget.auto() == CPULayout(8, 1, 1)
+    assert budget.auto(documents=2) == CPULayout(2, 1, 4)
+    assert budget.layout(3).tesseract_threads == 2
+    assert [layout.cpus for layout in budget.layouts()] == [8, 8, 8, 8]
+    assert CPUBudget(8, ocr_threads=2).auto() == CPULayout(4, 2, 1)
+
+
+def test_cpu_layout_apply(monkeypatch):
+    monkeypatch.setenv("OMP_THREAD_LIMIT", "8")
+    CPULayout(2, 1, 3).apply()
+    assert os.environ["OMP_THREAD_LIMIT"] == "3"
+    assert "6 cpus" in CPULayout(2, 1, 3).describe()
+
+
+def test_cpu_layout_limit_restores(monkeypatch):
+    monkeypatch.setenv("OMP_THREAD_LIMIT", "8")
+    with CPULayout(1, 1, 2).limit():
+        assert os.environ["OMP_THREAD_LIMIT"] == "2"
+    assert os.environ["OMP_THREAD_LIMIT"] == "8"
+    monkeypatch.delenv("OMP_THREAD_LIMIT")
+    with CPULayout(1, 1, 2).limit():
+        assert os.environ["OMP_THREAD_LIMIT"] == "2"
+    assert "OMP_THREAD_LIMIT" not in os.environ
+
+
+@pytest.mark.parametrize("timeouts, timed_out", [(1, False), (2, True)])
+def test_timeout_retries_smaller(monkeypatch, timeouts, timed_out):
+    sizes = []
+
+    def image_to_data(image, timeout=0, **kwargs):
+        sizes.append((image.size, timeout))
+        if len(sizes) <= timeouts:
+            raise RuntimeError("Tesseract process timeout")
+        return tesseract_data
+
+    monkeypatch.setattr(pytesseract, "image_to_data", image_to_data)
+    engine = OCREngine(Image.new("RGB", (40, 20), "white"), timeout=5)
+    engine.get_ocr_text()
+    assert sizes[:2] == [((40, 20), 5), ((20, 10), 5)]
+    assert engine.image_data["timed_out"] is timed_out
+    assert engine.image_data["text"] == ("" if timed_out else "LOT 12 BLOCK A")
+    if timeouts == 1:
+        # found on the half size retry, so scaled back up to the image
+        assert engine.image_data["word_boxes"].boxes[0].tolist() == [4, 2, 16, 10]
+    assert "ocr_seconds" in engine.image_data
+
+
+def test_non_timeout_errors_propagate(monkeypatch, image):
+    def image_to_data(*args, **kwargs):
+        raise RuntimeError("tesseract crashed")
+
+    monkeypatch.setattr(pytesseract, "image_to_data", image_to_data)
+    with pytest.raises(RuntimeError):
+        OCREngine(image, timeout=5).get_ocr_text()
@@ -0,0 +1,109 @@
+# pylint: disable=redefined-outer-name
+# pylint: disable=missing-function-docstring
+# pylint: disable=missing-module-docstring
+import pytesseract
+import pytest
+from PIL import Image
+
+from docuparse.orientation import OrientationDetector, benchmark, benchmark_images, parse_osd, thumbnail
+
+OSD_OUTPUT = """Page number: 0
+Orientation in degrees: 270
+Rotate: 90
+Orientation confidence: 4.37
+Script: Latin
+Script confidence: 1.90
+"""
+
+
+@pytest.fixture
+def osd_calls(monkeypatch):
+    calls = []
+
+    def image_to_osd(image, config="", **kwargs):
+        calls.append((image.size, config))
+        return OSD_OUTPUT
+
+    monkeypatch.setattr(pytesseract, "image_to_osd", image_to_osd)
+    return calls
+
+
+def test_parse_osd():
+    orientation = parse_osd(OSD_OUTPUT)
+    assert orientation.rotation == 90
+    assert orientation.rotation_confidence == 4.37
+    assert orientation.script_language == "Latin"
+    assert orientation.script_confidence == 1.9
+    assert orientation.as_dict()["rotation_to_zero"] == 270
+
+
+def test_thumbnail():
+    image = Image.new("RGB", (4000, 1000))
+    assert thumbnail(image, 1000).size == (1000, 250)
+    assert thumbnail(image, 0) is image
+    assert thumbnail(image, 5000) is image
+
+
+def test_detect_runs_on_thumbnail(osd_calls):
+    OrientationDetector(max_side=500).detect(Image.new("RGB", (2000, 1000)))
+    assert osd_calls == [((500, 250), "")]
+
+
+def test_detect_reuses_confident_result(osd_calls):
+    detector = OrientationDetector(reuse_confidence=3.0)
+    first = detector.detect(Image.new("RGB", (100, 100)), "doc.pdf")
+    second = detector.detect(Image.new("RGB", (100, 100)), "doc.pdf")
+    other = detector.detect(Image.new("RGB", (100, 100)), "other.pdf")
+    assert len(osd_calls) == 2
+    assert not first.reused
+    assert second.reused
+    assert second.rotation == 90
+    assert not other.reused
+    detector.forget("doc.pdf")
+    detector.detect(Image.new("RGB", (100, 100)), "doc.pdf")
+    assert len(osd_calls) == 3
+
+
+def test_detect_does_not_reuse_low_confidence(osd_calls):
+    detector = OrientationDetector(reuse_confidence=10.0)
+    detector.detect(Image.new("RGB", (100, 100)), "doc.pdf")
+    detector.detect(Image.new("RGB", (100, 100)), "doc.pdf")
+    assert len(osd_calls) == 2
+
+
+def test_osd_retry(monkeypatch):
+    configs = []
+
+    def image_to_osd(image, config="", **kwargs):
+        configs.append(config)
+        if not config:
+            raise pytesseract.TesseractError(1, "Too few characters. Skipping this page")
+        return OSD_OUTPUT
+
+    monkeypatch.setattr(pytesseract, "image_to_osd", image_to_osd)
+    assert OrientationDetector().detect(Image.new("RGB", (10, 10))).rotation == 90
+    assert len(configs) == 2
+
+
+def test_osd_failure(monkeypatch):
+    def image_to_osd(image, config="", **kwargs):
+        raise pytesseract.TesseractError(1, "Invalid resolution")
+
+    monkeypatch.setattr(pytesseract, "image_to_osd", image_to_osd)
+    orientation = OrientationDetector().detect(Image.new("RGB", (10, 10)))
+    assert orientation.rotation == 0
+    assert orientation.rotation_confidence == 0.0
+
+
+def test_benchmark(osd_calls):
+    report = benchmark([("blank", Image.new("RGB", (10, 10)))], rotations=(0, 90))
+    assert report["summary"]["samples"] == 2
+    assert report["summary"]["full_accuracy"] == 0.5
+    assert report["summary"]["agreement"] == 1.0
+
+
+def test_benchmark_images_reads_stencil_masks():
+    # the Fairways plat holds one colour image and 45 JBIG2 stencil masks
+    images = list(benchmark_images("data/test/plats/Fairways at Crystal Falls Sec 6 Addressing Rev 3 - 2020-07-23.pdf"))
+    assert len(images) == 46
+    assert all(image.mode == "RGB" for _, image in images)
@@ -0,0 +1,138 @@
+# pylint: disable=redefined-outer-name
+# pylint: disable=missing-function-docstring
+# pylint: disable=missing-module-docstring
+import time
+
+import pymupdf
+import pytest
+from PIL import Image
+
+from docuparse.ocr import OCREngine, OCRPool
+from docuparse.processors import ImageProcessor, PDFProcessor
+from docuparse.report import RunReport
+
+
+@pytest.fixture
+def recognized(monkeypatch):
+    seen = []
+
+    def perform_ocr(self, image=None, file_name="", timeout=None):
+        seen.append(image.size)
+        return {"text": f"{image.size[0]}x{image.size[1]}", "file_path": f"{file_name}_image_0"}
+
+    monkeypatch.setattr(OCREngine, "perform_ocr", perform_ocr)
+    return seen
+
+
+@pytest.fixture
+def tiff(tmp_path):
+    path = tmp_path / "frames.tiff"
+    frames = [Image.new("RGB", (10 + i, 10), "white") for i in range(3)]
+    frames[0].save(path, save_all=True, append_images=frames[1:])
+    return path
+
+
+@pytest.fixture
+def pdf(tmp_path):
+    png = tmp_path / "image.png"
+    Image.new("RGB", (12, 10), "white").save(png)
+    path = tmp_path / "sample.pdf"
+    with pymupdf.open() as doc:
+        page = doc.new_page()
+        page.insert_text((72, 72), "LOT 1")
+        page.insert_image(pymupdf.Rect(100, 100, 200, 200), filename=str(png))
+        doc.save(path)
+    return path
+
+
+@pytest.mark.parametrize("workers", [1, 2])
+def test_multi_frame_tiff(recognized, tiff, workers):
+    result = ImageProcessor(OCRPool(workers=workers, cache_size=0)).process_file(tiff)
+    assert [p["combined_text"] for p in result["pages_data"]] == [["10x10"], ["11x10"], ["12x10"]]
+    assert result["merged_text"] == "10x1011x1012x10"
+
+
+def test_image_and_pdf_share_schema(recognized, tiff, pdf):
+    pool = OCRPool()
+    image_result = ImageProcessor(pool).process_file(tiff)
+    pdf_result = PDFProcessor(pool).process_file(pdf)
+    assert image_result.keys() == pdf_result.keys()
+    assert pdf_result["pages_data"][0]["combined_text"][0] == "12x10"
+    assert "LOT 1" in pdf_result["merged_text"]
+
+
+def test_pool_cache(recognized):
+    pool = OCRPool(cache_size=4)
+    first = pool.perform_ocr(Image.new("RGB", (10, 10), "white"), "a.pdf")
+    second = pool.perform_ocr(Image.new("RGB", (10, 10), "white"), "b.pdf")
+    assert len(recognized) == 1
+    assert second["cached"]
+    assert second["file_path"] == "b.pdf_image_0"
+    assert first["text"] == second["text"]
+
+
+def test_pool_wraps_engine():
+    engine = OCREngine()
+    pool = PDFProcessor(engine).ocr_engine
+    assert pool.engine() is engine
+    with pytest.raises(ValueError):
+        OCRPool(workers=2, engine=engine)
+
+
+def test_document_budget_skips_remaining_frames(monkeypatch, tiff):
+    timeouts = []
+
+    def perform_ocr(self, image=None, file_name="", timeout=None):
+        timeouts.append(timeout)
+        time.sleep(0.05)
+        return {"text": "slow", "file_path": file_name}
+
+    monkeypatch.setattr(OCREngine, "perform_ocr", perform_ocr)
+    result = ImageProcessor(OCRPool(cache_size=0, timeout=10), document_timeout=0.01).process_file(tiff)
+    images = [p["images"][0] for p in result["pages_data"]]
+    assert result["document_timed_out"]
+    assert [i.get("skipped", False) for i in images] == [False, True, True]
+    assert 0 < timeouts[0] <= 0.01
+
+
+def test_report_lists_stragglers():
+    report = RunReport("plats")
+    report.add_document("fast.pdf", {"pages_data": [{"images": [{"text": "a"}]}]})
+    report.add_document(
+        "slow.pdf",
+        {"processing_seconds": 12.5, "pages_data": [{"images": [{"text": "", "timed_out": True}]}]},
+    )
+    assert [s["doc_id"] for s in report.stragglers] == ["slow.pdf"]
+    assert "slow.pdf: 12.5s, 1 image(s) timed out" in report.summary()
+
+
+@pytest.mark.parametrize("workers", [1, 2])
+def test_memory_budget_released(recognized, tiff, pdf, workers):
+    pool = OCRPool(workers=workers, cache_size=0, memory_limit=1)
+    ImageProcessor(pool).process_file(tiff)
+    PDFProcessor(pool).process_file(pdf)
+    assert pool.memory.in_flight == 0
+    assert pool.memory.peak > 0
+
+
+@pytest.mark.parametrize("mode", ["L", "RGBA", "CMYK"])
+def test_pixmap_to_rgb(tmp_path, mode):
+    path = tmp_path / "image.tiff"
+    Image.new(mode, (7, 5)).save(path)
+    image = PDFProcessor._pil_image(pymupdf.Pixmap(str(path)))  # pylint: disable=protected-access
+    assert image.mode == "RGB"
+    assert image.size == (7, 5)
+
+
+def test_stencil_masks_are_recognized(recognized):
+    # all but one image of this plat are JBIG2 stencil masks without a colorspace
+    path = "data/test/plats/Fairways at Crystal Falls Sec 6 Addressing Rev 3 - 2020-07-23.pdf"
+    result = PDFProcessor(OCRPool(cache_size=0)).process_file(path)
+    images = result["pages_data"][0]["images"]
+    assert len(images) == len(recognized) == 46
+    assert all(i["text"] for i in images)
+    with pymupdf.open(path) as doc:
+        mask = pymupdf.Pixmap(doc, doc[0].get_images()[1][0])
+    image = PDFProcessor._pil_image(mask)  # pylint: disable=protected-access
+    assert mask.colorspace is None
+    assert (image.mode, image.size) == ("L", (mask.width, mask.height))
@@ -0,0 +1,96 @@
+# pylint: disable=redefined-outer-name
+# pylint: disable=missing-function-docstring
+# pylint: disable=missing-module-docstring
+import os
+
+import numpy as np
+import pymupdf
+import pytest
+from PIL import Image
+
+from docuparse.ocr import OCREngine, OCRPool
+from docuparse.processors import PDFProcessor
+from docuparse.rastercache import RasterCache
+
+
+@pytest.fixture
+def recognized(monkeypatch):
+    seen = []
+
+    def perform_ocr(self, image=None, file_name="", timeout=None):
+        seen.append(image.getpixel((0, 0)))
+        return {"text": f"{image.size[0]}x{image.size[1]}", "file_path": f"{file_name}_image_0"}
+
+    monkeypatch.setattr(OCREngine, "perform_ocr", perform_ocr)
+    return seen
+
+
+@pytest.fixture
+def pdf(tmp_path):
+    png = tmp_path / "image.png"
+    Image.new("RGB", (12, 10), (200, 10, 10)).save(png)
+    path = tmp_path / "sample.pdf"
+    with pymupdf.open() as doc:
+        page = doc.new_page()
+        page.insert_text((72, 72), "LOT 1")
+        page.insert_image(pymupdf.Rect(100, 100, 200, 200), filename=str(png))
+        doc.save(path)
+    return path
+
+
+def test_round_trip_is_memory_mapped(tmp_path):
+    cache = RasterCache(tmp_path / "cache")
+    image = Image.new("RGB", (30, 20), (1, 2, 3))
+    key = cache.key("abc", 7)
+    assert cache.get(key) is None
+    cache.put(key, image)
+    cached = cache.get(key)
+    assert cached.size == (30, 20)
+    assert cached.tobytes() == image.tobytes()
+    assert isinstance(np.load(next(cache.directory.glob("*/*.npy")), mmap_mode="r"), np.memmap)
+    assert (cache.stats.hits, cache.stats.misses) == (1, 1)
+
+
+def test_key_covers_file_xref_and_transform(tmp_path):
+    cache = RasterCache(tmp_path)
+    keys = {
+        cache.key("a", 1),
+        cache.key("b", 1),
+        cache.key("a", 2),
+        RasterCache(tmp_path, transform="gray").key("a", 1),
+    }
+    assert len(keys) == 4
+
+
+def test_evicts_least_recently_used(tmp_path):
+    image = Image.new("RGB", (100, 100))
+    cache = RasterCache(tmp_path)
+    cache.put("00old", image)
+    cache.put("01used", image)
+    entry = cache.size() // 2
+    os.utime(tmp_path / "00" / "00old.npy", (1, 1))
+    os.utime(tmp_path / "01" / "01used.npy", (2, 2))
+    assert cache.get("01used") is not None
+    cache.max_bytes = int(entry * 2.5)
+    cache.put("02new", image)
+    assert cache.get("00old") is None
+    assert cache.get("01used") is not None
+    assert cache.get("02new") is not None
+    assert cache.stats.evicted == 1
+    assert cache.size() <= cache.max_bytes
+
+
+def test_rerun_reads_cached_rasters(recognized, pdf, tmp_path, monkeypatch):
+    cache = RasterCache(tmp_path / "cache")
+    processor = PDFProcessor(OCRPool(cache_size=0), raster_cache=cache)
+    first = processor.process_file(pdf)
+    assert (cache.stats.hits, cache.stats.misses) == (0, 1)
+
+    def no_pixmaps(*args):
+        raise AssertionError("image decoded again")
+
+    monkeypatch.setattr(pymupdf, "Pixmap", no_pixmaps)
+    second = processor.process_bytes(pdf.read_bytes(), str(pdf))
+    assert cache.stats.hits == 1
+    assert first["merged_text"] == second["merged_text"]
+    assert recognized == [(200, 10, 10), (200, 10, 10)]
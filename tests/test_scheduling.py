@@ -0,0 +1,62 @@
+# pylint: disable=redefined-outer-name
+# pylint: disable=missing-function-docstring
+# pylint: disable=missing-module-docstring
+import io
+
+import pymupdf
+import pytest
+from PIL import Image
+
+from docuparse.scheduling import CostEstimate, CostModel, assign, estimate, estimate_member, largest_first, makespan
+
+
+def png_bytes(width: int, height: int) -> bytes:
+    buffer = io.BytesIO()
+    Image.new("RGB", (width, height), "white").save(buffer, format="PNG")
+    return buffer.getvalue()
+
+
+@pytest.fixture
+def pdf(tmp_path):
+    path = tmp_path / "plat.pdf"
+    with pymupdf.open() as doc:
+        page = doc.new_page()
+        page.insert_text((72, 72), "LOT 1")
+        page.insert_image(pymupdf.Rect(0, 0, 100, 100), stream=png_bytes(1000, 500))
+        doc.new_page().insert_image(pymupdf.Rect(0, 0, 100, 100), stream=png_bytes(1000, 1000))
+        doc.save(path)
+    return path
+
+
+def test_estimate_pdf(pdf):
+    model = CostModel(per_document=1, per_page=0.5, per_text_page=0.25, per_megapixel=2)
+    e = estimate(str(pdf), pdf, model)
+    assert (e.pages, e.text_pages, e.image_pixels) == (2, 1, 1_500_000)
+    assert e.cost == 1 + 1 + 0.25 + 3
+    assert estimate("plat.pdf", pdf.read_bytes(), model) == CostEstimate("plat.pdf", 2, 1, 1_500_000, e.cost)
+
+
+def test_estimate_image():
+    e = estimate("scan.png", png_bytes(2000, 1000), CostModel(per_document=0, per_page=0, per_megapixel=1))
+    assert (e.pages, e.image_pixels, e.cost) == (1, 2_000_000, 2.0)
+
+
+def test_estimate_unreadable():
+    assert estimate("broken.pdf", b"not a pdf").cost == CostModel().per_document
+
+
+def test_estimate_member():
+    model = CostModel(per_document=0, per_page=0, per_megapixel=1, per_megabyte=10)
+    assert estimate_member("scan.png", 123, png_bytes(2000, 1000)[:1024], model).image_pixels == 2_000_000
+    assert estimate_member("plat.pdf", 2_000_000, b"%PDF-1.7", model) == CostEstimate("plat.pdf", cost=20.0)
+    assert estimate_member("scan.tif", 500_000, b"II*\0", model).cost == 5.0
+
+
+def test_largest_first_makespan():
+    estimates = [CostEstimate(str(c), cost=c) for c in (1, 7, 3, 5, 2, 2)]
+    assert [e.cost for e in largest_first(estimates)] == [7, 5, 3, 2, 2, 1]
+    assert makespan(estimates, 1) == 20
+    assert makespan(estimates, 2) == 10
+    assert makespan(estimates, 10) == 7
+    assert makespan([], 4) == 0
+    assert sorted(len(b) for b in assign(estimates, 3)) == [1, 2, 3]
@@ -0,0 +1,89 @@
+# pylint: disable=redefined-outer-name
+# pylint: disable=missing-function-docstring
+# pylint: disable=missing-module-docstring
+import json
+
+import pytest
+
+from docuparse.search import IndexBuilder, LocalIndex, page_hits, page_texts, tokenize
+
+DOCUMENTS = [
+    {
+        "_id": "plats/a.pdf",
+        "pages_data": [{"combined_text": ["LOT 1 BLOCK A", "easement"]}, {"combined_text": ["lot 2"]}],
+    },
+    {"_id": "plats/b.pdf", "pages_data": [{"combined_text": ["Survey of block B"]}]},
+    {"_id": "scans/c.png", "pages_data": [{"combined_text": ["easement easement drainage easement"]}]},
+]
+
+
+@pytest.fixture(params=[1, 1000])
+def index(request, tmp_path):
+    builder = IndexBuilder(tmp_path / "index", segment_postings=request.param)
+    builder.add_documents(DOCUMENTS)
+    with builder.finish() as index:
+        yield index
+
+
+def test_tokenize():
+    assert tokenize("LOT 1, Block-A") == ["lot", "1", "block", "a"]
+
+
+def test_page_texts():
+    assert page_texts(DOCUMENTS[0]) == ["LOT 1 BLOCK A easement", "lot 2"]
+    assert page_texts({}) == []
+
+
+def test_search_ranks_pages(index):
+    results = index.search("easement")
+    assert [r.doc_id for r in results] == ["scans/c.png", "plats/a.pdf"]
+    assert [h.page for h in results[1].pages] == [0]
+
+
+def test_search_page_locations(index):
+    results = index.search("lot")
+    assert [r.doc_id for r in results] == ["plats/a.pdf"]
+    assert sorted(h.page for h in results[0].pages) == [0, 1]
+    assert "page 1" in results[0].describe()
+
+
+def test_search_no_match(index):
+    assert not index.search("subdivision")
+    assert index.page_count == 4
+
+
+def test_reopen(tmp_path):
+    builder = IndexBuilder(tmp_path / "index", segment_postings=2)
+    builder.add_documents(DOCUMENTS)
+    builder.finish().close()
+    assert not list((tmp_path / "index").glob("segment-*"))
+    with LocalIndex(tmp_path / "index") as index:
+        assert index.search("block")[0].doc_id in ("plats/a.pdf", "plats/b.pdf")
+        assert list(index.postings("easement")) == [(0, 1), (3, 3)]
+
+
+def test_lexicon_bisects_and_converts_json(tmp_path):
+    builder = IndexBuilder(tmp_path / "index", segment_postings=2)
+    builder.add_documents(DOCUMENTS)
+    builder.finish().close()
+    lexicon = LocalIndex.load_lexicon(tmp_path / "index")
+    terms = [term for term, _, _ in lexicon]
+    assert terms == sorted(terms) and len(set(terms)) == len(terms) == len(lexicon)
+    entries = {term: [offset, pages] for term, offset, pages in lexicon}
+    assert all(lexicon.get(term) == tuple(entry) for term, entry in entries.items())
+    assert lexicon.get("zzz") is None and lexicon.get("", (0, 0)) == (0, 0)
+    lexicon.close()
+
+    for name in ("terms.bin", "lexicon.bin"):
+        (tmp_path / "index" / name).unlink()
+    (tmp_path / "index" / "lexicon.json").write_text(json.dumps(entries), encoding="utf8")
+    with LocalIndex(tmp_path / "index") as index:
+        assert list(index.postings("easement")) == [(0, 1), (3, 3)]
+    assert not (tmp_path / "index" / "lexicon.json").exists()
+
+
+def test_page_hits():
+    hits = page_hits(["nothing here", "Drainage easement along lot 4"], "easement lot")
+    assert [h.page for h in hits] == [1]
+    assert hits[0].score == 2
+    assert "easement" in hits[0].snippet
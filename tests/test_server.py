@@ -0,0 +1,185 @@
+# pylint: disable=redefined-outer-name
+# pylint: disable=missing-function-docstring
+# pylint: disable=missing-module-docstring
+import base64
+import hashlib
+import http.client
+import io
+import json
+import socket
+import threading
+import time
+
+import pymupdf
+import pytest
+from PIL import Image
+
+from docuparse.containers import DataContainer
+from docuparse.ocr import OCREngine
+from docuparse.server import OCRService, ServiceHTTPServer, UnixServiceServer, sniff_suffix
+
+release = threading.Event()
+
+
+class MemoryWriter:
+    def __init__(self):
+        self.data = {}
+
+    def write_data(self, data, force=False):
+        self.data.update(data)
+        return True
+
+    def exists(self, uri):
+        return uri in self.data
+
+    def close(self):
+        pass
+
+
+@pytest.fixture(autouse=True)
+def recognized(monkeypatch):
+    def perform_ocr(self, image=None, file_name="", timeout=None):
+        release.wait(5)
+        return {"text": f"{image.size[0]}x{image.size[1]}", "file_path": f"{file_name}_image_0"}
+
+    release.set()
+    monkeypatch.setattr(OCREngine, "perform_ocr", perform_ocr)
+    monkeypatch.setattr("docuparse.server.english_words", frozenset)
+
+
+def png_bytes(width=20):
+    buffer = io.BytesIO()
+    Image.new("RGB", (width, 10), "white").save(buffer, format="PNG")
+    return buffer.getvalue()
+
+
+def pdf_bytes():
+    with pymupdf.open() as doc:
+        page = doc.new_page()
+        page.insert_text((72, 72), "LOT 1")
+        page.insert_image(pymupdf.Rect(100, 100, 200, 200), stream=png_bytes())
+        return doc.tobytes()
+
+
+@pytest.fixture
+def served():
+    writer = MemoryWriter()
+    container = DataContainer()
+    container.writers = [writer]
+    service = OCRService(container, max_queue=0, queue_timeout=5)
+    service.start()
+    server = ServiceHTTPServer(("127.0.0.1", 0), service)
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    yield server, writer
+    release.set()
+    server.shutdown()
+    server.server_close()
+    service.close()
+
+
+def request(server, method, path, body=None):
+    connection = http.client.HTTPConnection(*server.server_address, timeout=10)
+    connection.request(method, path, body=body)
+    response = connection.getresponse()
+    payload = json.loads(response.read())
+    connection.close()
+    return response, payload
+
+
+def test_process_pdf(served):
+    server, writer = served
+    response, document = request(server, "POST", "/process?name=plat.pdf", pdf_bytes())
+    assert response.status == 200
+    assert document["merged_text"].startswith("20x10")
+    assert document["pages_data"][0]["combined_text"][1] == "LOT 1\n"
+    # packed word boxes travel as base64
+    assert len(base64.b64decode(document["pages_data"][0]["words"]["boxes"])) == 2 * 16
+    assert float(response.getheader("X-Total-Seconds")) >= float(response.getheader("X-Process-Seconds"))
+    assert not writer.data
+
+    response, document = request(server, "POST", "/process?store=1", png_bytes(30))
+    assert response.status == 200
+    assert document["merged_text"] == "30x10"
+    assert list(writer.data) == [f"{hashlib.sha256(png_bytes(30)).hexdigest()}.png"]
+
+    _, metrics = request(server, "GET", "/metrics")
+    assert metrics["processed"] == 2
+    assert set(metrics["total_seconds"]) == {"p50", "p95", "max"}
+
+
+def test_bad_requests(served):
+    server, _ = served
+    assert request(server, "POST", "/process", b"plain text")[0].status == 415
+    assert request(server, "POST", "/process?name=notes.txt", png_bytes())[0].status == 415
+    assert request(server, "POST", "/process")[0].status == 400
+    assert request(server, "GET", "/nothing")[0].status == 404
+    response, error = request(server, "POST", "/process?name=broken.pdf", b"%PDF-1.7 truncated")
+    assert response.status == 422
+    assert "broken.pdf" in error["error"]
+    assert request(server, "GET", "/metrics")[1]["failed"] == 1
+
+
+def test_full_queue_is_turned_away(served):
+    server, _ = served
+    release.clear()
+    # a size no other test uses, so the shared ocr cache does not answer it
+    first = threading.Thread(target=request, args=(server, "POST", "/process", png_bytes(41)))
+    first.start()
+    for _ in range(100):
+        if server.service.in_flight:
+            break
+        time.sleep(0.01)
+    assert request(server, "GET", "/health")[1] == {"status": "ok", "workers": 1, "in_flight": 1, "queued": 0}
+    response, error = request(server, "POST", "/process", png_bytes())
+    assert response.status == 503
+    assert response.getheader("Retry-After") == "1"
+    assert "queued" in error["error"]
+    release.set()
+    first.join()
+    assert request(server, "GET", "/metrics")[1]["rejected"] == 1
+
+
+def test_unexpected_errors_are_server_errors(served, monkeypatch):
+    server, writer = served
+
+    def fail(data, force=False):
+        raise KeyError("no collection")
+
+    monkeypatch.setattr(writer, "write_data", fail)
+    response, error = request(server, "POST", "/process?name=scan.png&store=1", png_bytes(33))
+    assert response.status == 500
+    assert "scan.png" in error["error"]
+    assert request(server, "GET", "/metrics")[1]["failed"] == 1
+
+
+class UnixConnection(http.client.HTTPConnection):
+    def __init__(self, path):
+        super().__init__("localhost", timeout=10)
+        self.path = path
+
+    def connect(self):
+        self.sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        self.sock.connect(self.path)
+
+
+def test_unix_socket(tmp_path):
+    service = OCRService(DataContainer())
+    path = str(tmp_path / "docuparse.sock")
+    server = UnixServiceServer(path, service)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    try:
+        connection = UnixConnection(path)
+        connection.request("POST", "/process?name=scan.png", body=png_bytes(12))
+        response = connection.getresponse()
+        assert response.status == 200
+        assert json.loads(response.read())["merged_text"] == "12x10"
+    finally:
+        server.shutdown()
+        server.server_close()
+
+
+def test_sniff_suffix():
+    assert sniff_suffix(pdf_bytes()) == ".pdf"
+    assert sniff_suffix(png_bytes()) == ".png"
+    assert sniff_suffix(b"hello") == ""
@@ -0,0 +1,91 @@
+# pylint: disable=redefined-outer-name
+# pylint: disable=missing-function-docstring
+# pylint: disable=missing-module-docstring
+import mongomock
+import pytest
+
+from docuparse.stats import CorpusStats, local_stats, mongo_stats
+from docuparse.store import JSONLDataReader, JSONLDataWriter, MongoDBDataReader, MongoDBDataWriter
+
+
+class Connection:  # pylint: disable=too-few-public-methods
+    def __init__(self):
+        self.db = mongomock.MongoClient().db
+        self.collection = self.db.documents
+
+
+def document(pages, rotations, quality, seconds, directory="plats"):
+    images = [{"rotation": r, "text": "LOT"} if r is not None else {"text": "LOT"} for r in rotations]
+    pages_data = [{"images": images, "combined_text": ["LOT"] * len(images)}]
+    pages_data += [{"images": [], "combined_text": []} for _ in range(pages - 1)]
+    return {
+        "merged_text": "LOT",
+        "pages_data": pages_data,
+        "page_count": pages,
+        "quality": quality,
+        "processing_seconds": seconds,
+        "source_directory": directory,
+    }
+
+
+@pytest.fixture
+def documents():
+    return {
+        "plats/a.pdf": document(1, [0, 90], 0.91, 2.5),
+        "plats/b.pdf": document(3, [0, 270, None], 0.35, 40.0),
+        "plats/c.pdf": document(12, [], None, 7.25),
+        "maps/d.png": document(1, [180], 0.8, 1.0, directory="maps"),
+        "plats/e.pdf": {"duplicate_of": "plats/a.pdf", "source_directory": "plats"},
+    }
+
+
+@pytest.fixture
+def reader(documents):
+    connection = Connection()
+    for number, (doc_id, value) in enumerate(documents.items()):
+        # a collection written before and after the compact schema
+        MongoDBDataWriter(connection, compact=number % 2 == 0).write_data({doc_id: dict(value)})  # type: ignore
+    return MongoDBDataReader(connection)  # type: ignore[arg-type]
+
+
+def without_timing(stats: CorpusStats):
+    return {k: v for k, v in stats.as_dict().items() if k != "seconds"}
+
+
+def test_mongo_stats(reader):
+    stats = mongo_stats(reader, slowest=2)
+    assert stats.documents == 4 and stats.duplicates == 1
+    assert (stats.pages, stats.min_pages, stats.max_pages, stats.mean_pages) == (17, 1, 12, 4.25)
+    assert stats.page_counts == {"0": 0, "1": 2, "2-4": 1, "5-9": 0, "10-19": 1, "20-49": 0, "50-99": 0, "100+": 0}
+    assert stats.quality == {"0.0-0.2": 0, "0.2-0.4": 1, "0.4-0.6": 0, "0.6-0.8": 0, "0.8-1.0": 2, "unknown": 1}
+    assert stats.mean_quality == round((0.91 + 0.35 + 0.8) / 3, 4)
+    assert stats.rotations == {"0": 2, "90": 1, "180": 1, "270": 1, "unknown": 1}
+    assert stats.processing_seconds == 50.75
+    assert [d["_id"] for d in stats.slowest] == ["plats/b.pdf", "plats/c.pdf"]
+    assert stats.slowest[0] == {"_id": "plats/b.pdf", "processing_seconds": 40.0, "page_count": 3}
+    assert "slowest:" in stats.describe()
+
+
+def test_mongo_stats_of_a_directory(reader):
+    stats = mongo_stats(reader, {"source_directory": "maps"})
+    assert (stats.documents, stats.duplicates, stats.pages) == (1, 0, 1)
+    assert stats.rotations == {"180": 1}
+    assert mongo_stats(reader, {"source_directory": "nowhere"}).documents == 0
+
+
+def test_local_stats_match_mongo(reader, documents, tmp_path):
+    writer = JSONLDataWriter(tmp_path)
+    for doc_id, value in documents.items():
+        writer.write_data({doc_id: value})
+    writer.close()
+    local = local_stats(JSONLDataReader(tmp_path).iter_data(), slowest=2)
+    assert without_timing(local) == without_timing(mongo_stats(reader, slowest=2))
+    maps = local_stats(JSONLDataReader(tmp_path).iter_data({"source_directory": "maps"}))
+    assert without_timing(maps) == without_timing(mongo_stats(reader, {"source_directory": "maps"}))
+
+
+def test_empty_collection():
+    stats = mongo_stats(MongoDBDataReader(Connection()))  # type: ignore[arg-type]
+    assert without_timing(stats) == without_timing(local_stats([]))
+    assert stats.documents == 0 and stats.mean_quality is None and not stats.slowest
+    assert "documents: 0" in stats.describe()
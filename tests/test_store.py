@@ -4,18 +4,27 @@
 # pylint: disable=unused-argument
 # pylint: disable=bare-except
 # flake8: noqa: E722
-# from pathlib import Path
+import gzip
+import json
 from typing import Any
 
 import mongomock
 import pytest
 from pymongo import MongoClient
 
-from docuparse import get_logger
-from docuparse.store import (  # FileDataWriter,
+from docuparse import Config, get_logger
+from docuparse.store import (
+    COMMON_QUERIES,
+    INDEXES,
+    IndexSpec,
+    JSONLDataReader,
+    JSONLDataWriter,
+    MongoClientRegistry,
     MongoDBConnection,
     MongoDBDataReader,
     MongoDBDataWriter,
+    PoolMetrics,
+    plan_stages,
 )
 
 logger = get_logger()
@@ -32,7 +41,7 @@ def mock_mongo_client(monkeypatch):
 
 @pytest.fixture
 def mongodb_connection(mock_mongo_client):
-    connection = MongoDBConnection("mongodb://localhost:27017/", "test_db")
+    connection = MongoDBConnection("mongodb://localhost:27017/", "test_db", registry=MongoClientRegistry())
     return connection
 
 
@@ -74,14 +83,50 @@ def test_lookup_real():
     assert not reader1.close()
 
 
-# def test_file_writer():
-#     f = FileDataWriter("data/test/test_file")
-#     f1 = FileDataWriter(Path("data/test/test_file"))
-#     # assert f.write_data(test_data)
-#     # assert f1.write_data(test_data)
-#     # assert not f.close()
-#     # assert f.exists()
-#     # assert f.exists("data/test/test_file")
+def test_jsonl_writer(tmp_path):
+    writer = JSONLDataWriter(tmp_path, buffer_bytes=1 << 20)
+    assert writer.write_data({"a.pdf": {"merged_text": "lot 1"}, "b.pdf": {"merged_text": "lot 2"}})
+    assert writer.exists("a.pdf") and not writer.exists("c.pdf")
+    assert not writer.write_data({"a.pdf": {"merged_text": "again"}})
+    assert not (tmp_path / writer.shard).exists()
+    assert writer.write_data({"a.pdf": {"merged_text": "lot 1 forced"}}, force=True)
+    assert writer.read("a.pdf") == {"merged_text": "lot 1 forced", "_id": "a.pdf"}
+    writer.close()
+
+    lines = (tmp_path / writer.shard).read_text(encoding="utf8").splitlines()
+    assert [json.loads(line)["merged_text"] for line in lines] == ["lot 1", "lot 2", "lot 1 forced"]
+    reader = JSONLDataReader(tmp_path)
+    assert reader.get("a.pdf")["merged_text"] == "lot 1 forced"
+    assert reader.read_data({"merged_text": "lot 2"}) == [{"merged_text": "lot 2", "_id": "b.pdf"}]
+    assert reader.length() == 1
+
+
+@pytest.mark.parametrize("compress", [False, True])
+def test_jsonl_shards_and_concurrent_writers(tmp_path, compress):
+    first = JSONLDataWriter(tmp_path, compress=compress, shard_bytes=200, buffer_bytes=0)
+    second = JSONLDataWriter(tmp_path, compress=compress, buffer_bytes=0)
+    for i in range(10):
+        first.write_data({f"{i}.pdf": {"text": "x" * 50}})
+    second.write_data({"other.pdf": {"text": "y"}})
+    first.close()
+    second.close()
+    shards = sorted(p.name for p in tmp_path.glob("shard-*") if not p.name.endswith(".idx"))
+    assert len(shards) > 2
+    if compress:
+        texts = []
+        for shard in shards:
+            with gzip.open(tmp_path / shard, "rt", encoding="utf8") as f:
+                texts += [json.loads(line)["text"] for line in f]
+        assert sorted(texts) == ["x" * 50] * 10 + ["y"]
+
+    reader = JSONLDataReader(tmp_path)
+    assert len(reader.read_data()) == 11
+    assert reader.get("other.pdf") == {"text": "y", "_id": "other.pdf"}
+    assert not first.exists("late.pdf")
+    second.write_data({"late.pdf": {}})
+    second.close()
+    reader.refresh()
+    assert reader.get("late.pdf") == {"_id": "late.pdf"}
 
 
 def test_write_force_real():
@@ -118,6 +163,151 @@ def test_write_force_real():
         logger.error("mongo write without force failed")
 
 
+def test_iter_data(mongodb_connection):
+    mongodb_connection.collection.insert_many([{"_id": str(i), "merged_text": f"lot {i}"} for i in range(5)])
+    reader = MongoDBDataReader(mongodb_connection)
+    assert [d["_id"] for d in reader.iter_data({"_id": {"$gt": "2"}}, batch_size=2)] == ["3", "4"]
+    assert list(reader.iter_data(projection={"merged_text": 0}))[0] == {"_id": "0"}
+
+
+def test_create_text_index_replaces_other_text_index(mongodb_connection):
+    mongodb_connection.collection.create_index([("title", "text")], name="old_text")
+    reader = MongoDBDataReader(mongodb_connection)
+    assert reader.create_text_index() == "docuparse_text"
+    indexes = mongodb_connection.collection.index_information()
+    assert "old_text" not in indexes
+    assert list(indexes["docuparse_text"]["key"]) == [("merged_text", "text"), ("text", "text")]
+
+
+def test_create_text_index_replaces_older_docuparse_index(mongodb_connection):
+    mongodb_connection.collection.create_index([("merged_text", "text")], name="docuparse_text")
+    MongoDBDataReader(mongodb_connection).create_text_index()
+    indexes = mongodb_connection.collection.index_information()
+    assert list(indexes["docuparse_text"]["key"]) == [("merged_text", "text"), ("text", "text")]
+
+
+def test_registry_shares_one_client_per_uri(mock_mongo_client):
+    registry = MongoClientRegistry()
+    a = MongoDBConnection("mongodb://u:p@localhost:27017/", "db", "a", registry=registry)
+    b = MongoDBConnection("mongodb://u:p@localhost:27017/", "db", "b", registry=registry)
+    other = MongoDBConnection("mongodb://elsewhere:27017/", "db", "a", registry=registry)
+    assert a.client is b.client
+    assert other.client is not a.client
+    assert registry.stats()["localhost:27017/"]["users"] == 2
+
+    a.close()
+    assert registry.stats()["localhost:27017/"]["users"] == 1
+    b.close()
+    assert "localhost:27017/" not in registry.stats()
+    b.connect()
+    assert b.client is not None and b.client is not other.client
+
+
+def test_registry_forgets_clients_after_fork(mock_mongo_client, monkeypatch):
+    registry = MongoClientRegistry()
+    parent = registry.acquire("mongodb://localhost:27017/")
+    monkeypatch.setattr("os.getpid", lambda: -1)
+    assert not registry.stats()
+    assert registry.acquire("mongodb://localhost:27017/") is not parent
+
+
+def test_pool_metrics():
+    metrics = PoolMetrics()
+    for _ in range(3):
+        metrics.connection_created(None)
+        metrics.connection_check_out_started(None)
+    metrics.connection_checked_out(None)
+    metrics.connection_checked_out(None)
+    metrics.connection_check_out_failed(None)
+    metrics.connection_checked_in(None)
+    metrics.connection_closed(None)
+    assert metrics.as_dict() == {
+        "open": 2,
+        "checked_out": 1,
+        "peak_checked_out": 2,
+        "checkouts": 2,
+        "waiting": 0,
+        "peak_waiting": 3,
+        "failed_checkouts": 1,
+        "created": 3,
+    }
+
+
+def test_config_connection_string_without_credentials(monkeypatch):
+    for name in ("MONGO_USER", "MONGO_PASSWORD", "MONGO_SERVER", "MONGO_PORT"):
+        monkeypatch.delenv(name, raising=False)
+    assert Config().mongo_connection_string == "mongodb://localhost:27017/"
+    monkeypatch.setenv("MONGO_SERVER", "db.local")
+    assert Config().mongo_connection_string == "mongodb://db.local:27017/"
+
+
+def test_ensure_indexes(mongodb_connection):
+    assert sorted(mongodb_connection.ensure_indexes()) == sorted(spec.name for spec in INDEXES)
+    assert not mongodb_connection.ensure_indexes()
+    changed = IndexSpec("quality", (("quality", -1),))
+    assert mongodb_connection.ensure_indexes((changed,)) == ["quality"]
+    assert list(mongodb_connection.collection.index_information()["quality"]["key"]) == [("quality", -1)]
+
+
+def test_ensure_indexes_on_server_text_index_shape(mongodb_connection, monkeypatch):
+    # a server reports text indexes by their internal keys and lists the indexed fields as weights
+    reported = {
+        "_id_": {"key": [("_id", 1)]},
+        "docuparse_text": {"key": [("_fts", "text"), ("_ftsx", 1)], "weights": {"merged_text": 1, "text": 1}},
+        **{spec.name: {"key": list(spec.keys)} for spec in INDEXES if spec.name != "docuparse_text"},
+    }
+    monkeypatch.setattr(mongodb_connection.collection, "index_information", lambda: reported)
+    dropped = []
+    monkeypatch.setattr(mongodb_connection.collection, "drop_index", dropped.append)
+    assert not mongodb_connection.ensure_indexes()
+    MongoDBDataReader(mongodb_connection).create_text_index()
+    assert not dropped
+    reported["docuparse_text"]["weights"] = {"merged_text": 1}
+    monkeypatch.setattr(
+        mongodb_connection.collection, "create_indexes", lambda models: [m.document["name"] for m in models]
+    )
+    assert mongodb_connection.ensure_indexes() == ["docuparse_text"]
+    assert dropped == ["docuparse_text"]
+
+
+class ExplainedCursor:
+    def __init__(self, stage):
+        self.stage = stage
+
+    def sort(self, *args):
+        return self
+
+    def limit(self, *args):
+        return self
+
+    def explain(self):
+        inner = {"stage": self.stage, "indexName": "content_hash"} if self.stage == "IXSCAN" else {"stage": "COLLSCAN"}
+        return {"queryPlanner": {"winningPlan": {"stage": "FETCH", "inputStage": inner}}}
+
+
+def test_collection_scans(mongodb_connection, monkeypatch):
+    def find(query_filter):
+        return ExplainedCursor("IXSCAN" if "content_hash" in query_filter else "COLLSCAN")
+
+    monkeypatch.setattr(mongodb_connection.collection, "find", find)
+    plans = mongodb_connection.query_plans()
+    assert plans["documents by content hash"] == ["FETCH", "IXSCAN"]
+    scans = mongodb_connection.collection_scans()
+    assert "documents by content hash" not in scans and "long documents" in scans
+
+
+def test_common_queries_lead_with_indexed_fields():
+    leading = {spec.keys[0][0] for spec in INDEXES}
+    for query in COMMON_QUERIES:
+        fields = [f for f in query.filter if f != "$text"] or [f for f, _ in query.sort]
+        assert set(fields) <= leading, query.name
+
+
+def test_plan_stages():
+    plan = {"stage": "SORT", "inputStage": {"stage": "OR", "inputStages": [{"stage": "IXSCAN"}, {"stage": "COLLSCAN"}]}}
+    assert plan_stages(plan) == ["SORT", "OR", "IXSCAN", "COLLSCAN"]
+
+
 def run_test():
     logger.info("begin pymongo testing")
     logger.info("end pymongo testing")
@@ -0,0 +1,114 @@
+# pylint: disable=redefined-outer-name
+# pylint: disable=missing-function-docstring
+# pylint: disable=missing-module-docstring
+import mongomock
+import pytest
+import spacy
+
+from docuparse.store import MongoDBDataReader, MongoDBDataWriter
+from docuparse.text_analysis import NLPEnricher, load_pipeline
+
+
+def ruler_pipeline():
+    nlp = spacy.blank("en")
+    ruler = nlp.add_pipe("entity_ruler", name="ner")
+    ruler.add_patterns([{"label": "PERSON", "pattern": "McLaughlin"}, {"label": "GPE", "pattern": "Travis"}])
+    nlp.add_pipe("sentencizer", name="parser")
+    return nlp
+
+
+class Connection:  # pylint: disable=too-few-public-methods
+    def __init__(self):
+        self.db = mongomock.MongoClient().db
+        self.collection = self.db.documents
+
+
+@pytest.fixture
+def connection():
+    connection = Connection()
+    connection.collection.insert_many(
+        [
+            {
+                "_id": "a.pdf",
+                "pages_data": [{"combined_text": ["County of Travis"]}, {"combined_text": ["McLaughlin"]}],
+            },
+            {"_id": "b.png", "merged_text": "nothing here"},
+        ]
+    )
+    return connection
+
+
+def test_load_pipeline_keeps_components(monkeypatch):
+    loads = []
+
+    def load(name, enable=(), exclude=()):
+        loads.append(name)
+        nlp = ruler_pipeline()
+        nlp.select_pipes(enable=enable)
+        return nlp
+
+    monkeypatch.setattr(spacy, "load", load)
+    load_pipeline.cache_clear()
+    nlp = load_pipeline("model", ("ner",))
+    assert nlp.pipe_names == ["ner"]
+    assert not nlp.disabled
+    assert load_pipeline("model", ("ner",)) is nlp
+    assert loads == ["model"]
+    load_pipeline.cache_clear()
+
+
+def test_load_pipeline_excludes_other_components(tmp_path, monkeypatch):
+    ruler_pipeline().to_disk(tmp_path)
+    excluded = []
+    load = spacy.load
+
+    def spy(name, **kwargs):
+        excluded.append(kwargs["exclude"])
+        return load(name, **kwargs)
+
+    monkeypatch.setattr(spacy, "load", spy)
+    load_pipeline.cache_clear()
+    assert load_pipeline(str(tmp_path), ("ner",)).pipe_names == ["ner"]
+    assert load_pipeline(str(tmp_path), ()).pipe_names == []
+    assert excluded == [["parser"], ["ner", "parser"]]
+    load_pipeline.cache_clear()
+
+
+def test_enrich_pages():
+    enricher = NLPEnricher(nlp=ruler_pipeline(), batch_size=1)
+    documents = [
+        {"_id": "a.pdf", "pages_data": [{"combined_text": ["County of Travis"]}, {"combined_text": ["McLaughlin"]}]},
+        {"_id": "b.png", "merged_text": "McLaughlin"},
+    ]
+    results = dict(enricher.enrich(documents))
+    assert [(e["text"], e["label"], e["page"]) for e in results["a.pdf"]] == [
+        ("Travis", "GPE", 0),
+        ("McLaughlin", "PERSON", 1),
+    ]
+    assert results["b.png"][0]["start"] == 0
+
+
+def test_enrich_collection_bulk(connection, monkeypatch):
+    batches = []
+
+    def bulk_write(operations, ordered=True):
+        # mongomock does not accept the UpdateOne of recent pymongo, so apply the updates one by one
+        batches.append(len(operations))
+        matched = 0
+        for operation in operations:
+            # pylint: disable=protected-access
+            matched += connection.collection.update_one(operation._filter, operation._doc).matched_count
+        return type("Result", (), {"matched_count": matched})()
+
+    monkeypatch.setattr(connection.collection, "bulk_write", bulk_write)
+    enricher = NLPEnricher("test-model", nlp=ruler_pipeline())
+    reader = MongoDBDataReader(connection)
+    writer = MongoDBDataWriter(connection)
+    assert enricher.enrich_collection(reader, writer, bulk_size=1) == 2
+    assert batches == [1, 1]
+    stored = connection.collection.find_one("a.pdf")
+    assert [e["text"] for e in stored["entities"]] == ["Travis", "McLaughlin"]
+    assert stored["nlp_model"] == "test-model"
+    assert enricher.enrich_collection(reader, writer) == 0
+    assert enricher.enrich_collection(reader, writer, force=True) == 2
+    assert batches == [1, 1, 2]
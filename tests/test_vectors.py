@@ -0,0 +1,106 @@
+# pylint: disable=redefined-outer-name
+# pylint: disable=missing-function-docstring
+# pylint: disable=missing-module-docstring
+import numpy as np
+import pytest
+import spacy
+
+from docuparse.vectors import IVFIndex, VectorStore, embed_texts, normalize, similar_documents, top_k
+
+
+@pytest.fixture
+def nlp():
+    nlp = spacy.blank("en")
+    for word, vector in {
+        "lot": [1, 0, 0],
+        "block": [0.9, 0.1, 0],
+        "river": [0, 1, 0],
+        "creek": [0, 0.9, 0.1],
+        "survey": [0, 0, 1],
+    }.items():
+        nlp.vocab.set_vector(word, np.array(vector, dtype=np.float32))
+    return nlp
+
+
+def document(doc_id, *pages):
+    return {"_id": doc_id, "pages_data": [{"combined_text": [p]} for p in pages]}
+
+
+def test_embed_and_normalize(nlp):
+    vectors = np.stack(list(embed_texts(nlp, ["lot lot", "unknown words"])))
+    assert np.allclose(vectors[0], [1, 0, 0])
+    assert np.allclose(normalize(vectors), [[1, 0, 0], [0, 0, 0]])
+
+
+def test_top_k():
+    scores = np.array([0.1, 0.9, 0.5, 0.7])
+    assert top_k(scores, 2).tolist() == [1, 3]
+    assert top_k(scores, 10).tolist() == [1, 3, 2, 0]
+    assert not len(top_k(scores, 0))
+
+
+def test_store_search_and_reopen(tmp_path, nlp):
+    store = VectorStore(tmp_path)
+    added = store.add_documents(
+        nlp,
+        [document("a.pdf", "lot block", "river"), document("b.pdf", "block"), document("c.pdf", "creek survey")],
+        flush_rows=2,
+    )
+    assert added == len(store) == 4
+    assert store.path.stat().st_size == 4 * 3 * 4
+
+    hits = store.search(np.array([1, 0, 0]), k=2, chunk_rows=1)
+    assert [(h.doc_id, h.page) for h in hits] == [("a.pdf", 0), ("b.pdf", 0)]
+    assert hits[0].score == pytest.approx(0.9986, abs=1e-3)
+
+    reopened = VectorStore(tmp_path)
+    assert reopened.keys == store.keys
+    assert np.allclose(reopened.matrix, store.matrix)
+    with pytest.raises(ValueError):
+        VectorStore(tmp_path, dim=5)
+
+
+def test_reopen_after_interrupted_add(tmp_path, nlp):
+    store = VectorStore(tmp_path)
+    store.add_documents(nlp, [document("a.pdf", "lot"), document("b.pdf", "river")])
+    with open(store.path, "ab") as f:
+        np.ones((2, 3), dtype=np.float32).tofile(f)
+    with open(store.keys_path, "a", encoding="utf8") as f:
+        f.write('["c.pdf", 0]\n["c.pdf"')
+
+    reopened = VectorStore(tmp_path)
+    assert reopened.keys == [("a.pdf", 0), ("b.pdf", 0), ("c.pdf", 0)]
+    assert reopened.path.stat().st_size == 3 * 3 * 4
+    reopened.add([("d.pdf", 0)], np.array([[0, 0, 1]]))
+    assert VectorStore(tmp_path).keys[-1] == ("d.pdf", 0)
+    assert np.allclose(VectorStore(tmp_path).matrix[-1], [0, 0, 1])
+
+
+def test_similar_documents(tmp_path, nlp):
+    store = VectorStore(tmp_path)
+    store.add_documents(nlp, [document("a.pdf", "lot"), document("b.pdf", "block"), document("c.pdf", "river")])
+    neighbors = similar_documents(store, "a.pdf", k=2)
+    assert [n.doc_id for n in neighbors] == ["b.pdf", "c.pdf"]
+    with pytest.raises(KeyError):
+        similar_documents(store, "missing.pdf")
+
+
+def test_ivf_matches_brute_force(tmp_path):
+    rng = np.random.default_rng(1)
+    centers = normalize(rng.normal(size=(8, 16)).astype(np.float32))
+    rows = centers[np.arange(400) % 8] + rng.normal(scale=0.05, size=(400, 16)).astype(np.float32)
+    store = VectorStore(tmp_path)
+    store.add([(f"{i}.pdf", 0) for i in range(400)], rows)
+
+    index = IVFIndex(store, nprobe=2)
+    index.build(nlist=8)
+    reloaded = IVFIndex(store, nprobe=2)
+    assert reloaded.indexed == 400 and len(reloaded.members) == 400
+
+    query = rows[5]
+    exact = {n.doc_id for n in store.search(query, 10)}
+    approximate = {n.doc_id for n in reloaded.search(query, 10)}
+    assert len(exact & approximate) >= 9
+
+    store.add([("new.pdf", 0)], query.reshape(1, -1))
+    assert "new.pdf" in {n.doc_id for n in reloaded.search(query, 2)}
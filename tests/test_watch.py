@@ -0,0 +1,150 @@
+# pylint: disable=redefined-outer-name
+# pylint: disable=missing-function-docstring
+# pylint: disable=missing-module-docstring
+# pylint: disable=protected-access
+import io
+import os
+import time
+
+import pytest
+from PIL import Image
+
+from docuparse.containers import FileDataDirectory
+from docuparse.ocr import OCREngine
+from docuparse.watch import FileState, Watcher, WatchStats, pdf_complete
+
+
+class MemoryWriter:
+    def __init__(self, existing=()):
+        self.data = {k: {} for k in existing}
+        self.writes = []
+
+    def write_data(self, data, force=False):
+        self.data.update(data)
+        self.writes.extend(data)
+        return True
+
+    def exists(self, uri):
+        return uri in self.data
+
+    def close(self):
+        pass
+
+
+class Clock:
+    def __init__(self):
+        self.now = 100.0
+
+    def __call__(self):
+        return self.now
+
+
+@pytest.fixture(autouse=True)
+def recognized(monkeypatch):
+    def perform_ocr(self, image=None, file_name="", timeout=None):
+        return {"text": f"{image.size[0]}x{image.size[1]}", "file_path": f"{file_name}_image_0"}
+
+    monkeypatch.setattr(OCREngine, "perform_ocr", perform_ocr)
+
+
+def png(path, width):
+    buffer = io.BytesIO()
+    Image.new("RGB", (width, 10), "white").save(buffer, format="PNG")
+    path.write_bytes(buffer.getvalue())
+
+
+@pytest.fixture
+def watched(tmp_path):
+    png(tmp_path / "stored.png", 5)
+    writer = MemoryWriter(existing=(str(tmp_path / "stored.png"),))
+    container = FileDataDirectory(tmp_path)
+    container.writers = [writer]
+    clock = Clock()
+    watcher = Watcher(container, settle=2.0, interval=0, clock=clock)
+    watcher.start()
+    return watcher, writer, clock, tmp_path
+
+
+def test_settle_then_process_new_files(watched):
+    watcher, writer, clock, directory = watched
+    (directory / "notes.txt").write_text("skip")
+    (directory / "copying.png.part").write_bytes(b"")
+    png(directory / "new.png", 20)
+    watcher.poll()
+    assert not writer.writes
+
+    clock.now += 1
+    png(directory / "new.png", 30)  # still being written
+    os.utime(directory / "new.png", ns=(1, 1))
+    watcher.poll()
+    clock.now += 1.5
+    watcher.poll()
+    assert not writer.writes
+
+    clock.now += 1
+    watcher.poll()
+    assert writer.writes == [str(directory / "new.png")]
+    assert writer.data[str(directory / "new.png")]["merged_text"] == "30x10"
+    assert watcher.stats.latencies == [3.5]
+
+    clock.now += 5
+    watcher.poll()
+    assert writer.writes == [str(directory / "new.png")]
+
+
+def test_changed_files_are_reprocessed(watched):
+    watcher, writer, clock, directory = watched
+    png(directory / "stored.png", 40)
+    os.utime(directory / "stored.png", ns=(2, 2))
+    watcher.poll()
+    clock.now += 2
+    watcher.poll()
+    assert writer.writes == [str(directory / "stored.png")]
+    assert writer.data[str(directory / "stored.png")]["merged_text"] == "40x10"
+
+
+def test_incomplete_pdf_waits(watched):
+    watcher, writer, clock, directory = watched
+    (directory / "plat.pdf").write_bytes(b"%PDF-1.7 truncated")
+    assert not pdf_complete(directory / "plat.pdf")
+    watcher.poll()
+    clock.now += 2
+    watcher.poll()
+    assert not writer.writes and str(directory / "plat.pdf") in watcher._incomplete
+    clock.now += 20
+    watcher.poll()
+    assert watcher.stats.failed == 1 and str(directory / "plat.pdf") not in watcher._incomplete
+
+
+def test_settled_forgets_removed_files(watched):
+    watcher, _, _, _ = watched
+    assert watcher.settled({"a": FileState(1, 1)}, 0) == []
+    assert watcher.settled({}, 10) == []
+    assert "a" not in watcher._seen
+
+
+def test_stats_describe():
+    stats = WatchStats()
+    assert stats.describe() == "written: 0, failed: 0"
+    for latency in (3.0, 1.0, 2.0):
+        stats.record(latency)
+    assert stats.describe() == "written: 3, failed: 0, seconds to written: median 2.0, max 3.0"
+
+
+def test_warm_pool(tmp_path):
+    writer = MemoryWriter()
+    container = FileDataDirectory(tmp_path, workers=2)
+    container.writers = [writer]
+    watcher = Watcher(container, settle=0, interval=0)
+    watcher.start()
+    try:
+        png(tmp_path / "a.png", 20)
+        png(tmp_path / "b.png", 30)
+        for _ in range(200):
+            watcher.poll()
+            if len(writer.writes) == 2:
+                break
+            time.sleep(0.05)
+    finally:
+        watcher.stop()
+    assert sorted(writer.writes) == [str(tmp_path / "a.png"), str(tmp_path / "b.png")]
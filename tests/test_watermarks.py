@@ -0,0 +1,136 @@
+# pylint: disable=redefined-outer-name
+# pylint: disable=missing-function-docstring
+# pylint: disable=missing-module-docstring
+import io
+
+import numpy as np
+import pymupdf
+import pytest
+from PIL import Image, ImageDraw
+
+from docuparse.ocr import OCREngine, OCRPool
+from docuparse.orientation import Orientation, OrientationDetector
+from docuparse.processors import PDFProcessor
+from docuparse.report import RunReport
+from docuparse.watermarks import mask_overlay
+
+
+def scan(overlay=None, ink=(0, 0, 0), size=(400, 300), paper="white"):
+    """
+    Rows of text-like strokes, optionally under a translucent diagonal band.
+    """
+    image = Image.new("RGB", size, paper)
+    draw = ImageDraw.Draw(image)
+    for y in range(20, size[1] - 20, 24):
+        for x in range(20, size[0] - 40, 30):
+            draw.rectangle((x, y, x + 18, y + 3), fill=ink)
+    if overlay:
+        band = Image.new("L", size, 0)
+        ImageDraw.Draw(band).line((0, size[1], size[0], 0), fill=255, width=size[1] // 5)
+        image = Image.composite(Image.blend(image, Image.new("RGB", size, overlay), 0.5), image, band)
+    return image
+
+
+def dark_pixels(image):
+    return int((np.asarray(image.convert("L")) <= 110).sum())
+
+
+@pytest.mark.parametrize(
+    "image", [scan((170, 170, 170)), scan((230, 30, 30)), scan((170, 170, 170)).convert("L")], ids=["grey", "red", "L"]
+)
+def test_overlay_masked_in_place_and_ink_kept(image):
+    dark = dark_pixels(image)
+    masked, found = mask_overlay(image)
+    assert found["detected"] is True
+    assert found["coverage"] > 0.05
+    assert masked is image
+    assert dark_pixels(masked) == dark
+    band = np.asarray(masked)[150, 180:220]
+    assert (band == 255).all()
+
+
+def test_large_overlay_detected_on_reduced_copy():
+    image = scan((170, 170, 170), size=(2400, 1800))
+    masked, found = mask_overlay(image)
+    assert found["detected"] is True
+    assert (np.asarray(masked.convert("L"))[900, 1150:1250] == 255).all()
+
+
+@pytest.mark.parametrize(
+    "image",
+    [
+        scan(),
+        scan(ink=(170, 170, 170)),
+        scan(ink=(160, 160, 160), paper=(225, 220, 205)),
+        scan(ink=(30, 60, 200)),
+        scan(ink=(200, 30, 30)),
+        Image.new("1", (50, 50)),
+    ],
+    ids=["clean", "faint", "faded on off-white", "blue ink", "red ink", "1"],
+)
+def test_images_without_overlay_untouched(image):
+    before = image.tobytes()
+    masked, found = mask_overlay(image)
+    assert found["detected"] is False
+    assert masked is image
+    assert masked.tobytes() == before
+
+
+def test_engine_reports_watermark(monkeypatch):
+    monkeypatch.setattr(OrientationDetector, "detect", lambda self, image, document="": Orientation())
+    engine = OCREngine(scan((170, 170, 170)), remove_watermarks=True)
+    engine.load_and_preprocess_image(correct_rotation=False)
+    assert engine.image_data["watermark"]["detected"] is True
+    engine = OCREngine(scan((170, 170, 170)), remove_watermarks=False)
+    engine.load_and_preprocess_image(correct_rotation=False)
+    assert "watermark" not in engine.image_data
+
+
+def png(colour):
+    buffer = io.BytesIO()
+    Image.new("RGB", (10, 10), colour).save(buffer, format="PNG")
+    return buffer.getvalue()
+
+
+@pytest.fixture
+def watermarked_pdf(tmp_path):
+    path = tmp_path / "plat.pdf"
+    with pymupdf.open() as doc:
+        layer = doc.add_ocg("Watermark", on=True)
+        page = doc.new_page()
+        page.insert_text((72, 72), "LOT 1")
+        page.insert_text((200, 400), "COPY", oc=layer, fontsize=60)
+        page.insert_image(pymupdf.Rect(300, 300, 400, 400), stream=png("red"), oc=layer)
+        page.insert_image(pymupdf.Rect(100, 100, 200, 200), stream=png("blue"))
+        annot = page.add_stamp_annot(pymupdf.Rect(50, 500, 250, 560), stamp=0)
+        annot.set_info(content="Recorded book 12 page 4")
+        annot.update()
+        doc.save(path)
+    return path
+
+
+def test_pdf_watermark_layers_and_stamps(monkeypatch, watermarked_pdf):
+    recognized = []
+
+    def perform_ocr(self, image=None, file_name="", timeout=None):
+        recognized.append(image.getpixel((0, 0)))
+        return {"text": "image", "file_path": f"{file_name}_image_0"}
+
+    monkeypatch.setattr(OCREngine, "perform_ocr", perform_ocr)
+    result = PDFProcessor(OCRPool(cache_size=0), remove_watermarks=True).process_file(watermarked_pdf)
+    page = result["pages_data"][0]
+    assert page["combined_text"] == ["image", "LOT 1\n"]
+    assert recognized == [(0, 0, 255)]
+    assert result["watermark_layers"] == ["Watermark"]
+    assert page["watermarks"] == {
+        "annotations": [{"type": "Stamp", "content": "Recorded book 12 page 4"}],
+        "hidden_images": 1,
+    }
+    report = RunReport("plats")
+    report.add_document("plat.pdf", result)
+    assert report.watermarks == {"images": 0, "layers": 1, "annotations": 1}
+    assert "1 layer(s) switched off" in report.summary()
+
+    kept = PDFProcessor(OCRPool(cache_size=0), remove_watermarks=False).process_file(watermarked_pdf)
+    assert "COPY" in kept["merged_text"]
+    assert "watermark_layers" not in kept
@@ -0,0 +1,115 @@
+# pylint: disable=redefined-outer-name
+# pylint: disable=missing-function-docstring
+# pylint: disable=missing-module-docstring
+import numpy as np
+import pymupdf
+import pytest
+from PIL import Image
+
+from docuparse.ocr import OCREngine, OCRPool
+from docuparse.processors import PDFProcessor
+from docuparse.store import JSONLDataReader, JSONLDataWriter
+from docuparse.wordboxes import GridIndex, WordBoxes
+
+native_words = [
+    (10, 10, 40, 20, "LOT", 0, 0, 0),
+    (45, 10, 60, 20, "12", 0, 0, 1),
+    (10, 300, 50, 310, "BLOCK", 1, 0, 0),
+    (400, 700, 460, 712, "Surveyor", 2, 0, 0),
+    (465, 700, 500, 712, "Smith", 2, 0, 1),
+    (400, 720, 430, 732, "LOT", 2, 1, 0),
+]
+
+
+@pytest.fixture
+def words():
+    return WordBoxes.from_pymupdf(native_words)
+
+
+def test_stored_round_trip(words):
+    stored = words.to_dict()
+    assert isinstance(stored["boxes"], bytes)
+    restored = WordBoxes.from_dict(stored)
+    assert restored.words == words.words
+    assert np.array_equal(restored.boxes, words.boxes)
+    assert restored.lines.tolist() == [0, 0, 1, 2, 2, 3]
+    assert restored.line_texts() == ["LOT 12", "BLOCK", "Surveyor Smith", "LOT"]
+    assert len(WordBoxes.from_dict(WordBoxes.empty().to_dict())) == 0
+
+
+def test_concat_keeps_lines_apart(words):
+    joined = WordBoxes.concat([words, WordBoxes.empty(), words])
+    assert len(joined) == 12
+    assert joined.lines.tolist()[6:] == [4, 4, 5, 6, 6, 7]
+
+
+def test_placed_maps_pixels_to_rect():
+    ocr = WordBoxes(["A"], np.float32([[50, 100, 100, 200]]), np.uint8([90]), np.uint32([0]))
+    assert ocr.placed((200, 400), (100, 100, 200, 300)).boxes[0].tolist() == [125, 150, 150, 200]
+
+
+@pytest.mark.parametrize("angle", [90, 180, 270])
+def test_unrotated_matches_pil_rotation(angle):
+    image = Image.new("L", (40, 20))
+    image.paste(255, (5, 2, 11, 5))
+    found = Image.Image.rotate(image, angle, expand=True).getbbox()
+    boxes = WordBoxes(["A"], np.float32([found]), np.uint8([90]), np.uint32([0]))
+    assert boxes.unrotated(angle, image.size).boxes[0].tolist() == [5, 2, 11, 5]
+
+
+def test_region_and_text(words):
+    index = GridIndex([words], cell=50)
+    title_block = (390, 690, 612, 792)
+    assert [hit.word for hit in index.region(0, title_block)] == ["Surveyor", "Smith", "LOT"]
+    assert index.text(0, title_block) == "Surveyor Smith\nLOT"
+    assert index.region(0, (200, 200, 300, 300)) == []
+    assert len(index.region(0, (-1e9, -1e9, 1e9, 1e9))) == len(words)
+    assert [hit.word for hit in index.region(0, (0, 0, 612, 792), min_confidence=101)] == []
+
+
+def test_nearest(words):
+    index = GridIndex([words], cell=50)
+    nearest = index.nearest(0, (420, 730))
+    assert nearest[0].word == "LOT"
+    assert nearest[0].distance == 0
+    assert [hit.word for hit in index.nearest(0, (420, 730), k=3)] == ["LOT", "Surveyor", "Smith"]
+    assert index.nearest(0, (0, 0), pattern="^lot$")[0].box == (10, 10, 40, 20)
+    assert [hit.word for hit in index.nearest(0, (0, 0), k=10)] == ["LOT", "12", "BLOCK", "Surveyor", "LOT", "Smith"]
+    assert not GridIndex([WordBoxes.empty()]).nearest(0, (0, 0))
+
+
+def test_pdf_pages_keep_native_and_ocr_words(monkeypatch, tmp_path):
+    def perform_ocr(self, image=None, file_name="", timeout=None):
+        boxes = WordBoxes(["Plat"], np.float32([[0, 0, 5, 5]]), np.uint8([80]), np.uint32([0]))
+        return {"text": "Plat", "word_boxes": boxes}
+
+    monkeypatch.setattr(OCREngine, "perform_ocr", perform_ocr)
+    png = tmp_path / "image.png"
+    Image.new("RGB", (10, 10), "white").save(png)
+    path = tmp_path / "sample.pdf"
+    with pymupdf.open() as doc:
+        page = doc.new_page()
+        page.insert_text((72, 72), "LOT 1")
+        page.insert_image(pymupdf.Rect(100, 100, 200, 200), filename=str(png))
+        doc.save(path)
+
+    result = PDFProcessor(OCRPool(cache_size=0)).process_file(path)
+    page = result["pages_data"][0]
+    assert "word_boxes" not in page["images"][0]
+    index = GridIndex.from_document(result)
+    assert index.text(0, (0, 0, 612, 90)) == "LOT 1"
+    assert [(hit.word, hit.box, hit.confidence) for hit in index.region(0, (100, 100, 200, 200))] == [
+        ("Plat", (100, 100, 150, 150), 80)
+    ]
+    assert "words" not in PDFProcessor(OCRPool(cache_size=0), word_boxes=False).process_file(path)["pages_data"][0]
+
+
+@pytest.mark.parametrize("compress", [False, True])
+def test_jsonl_round_trip(tmp_path, compress):
+    words = WordBoxes.from_pymupdf(native_words)
+    writer = JSONLDataWriter(tmp_path, compress=compress)
+    writer.write_data({"plat.pdf": {"pages_data": [{"words": words.to_dict()}]}})
+    writer.close()
+    stored = JSONLDataReader(tmp_path).get("plat.pdf")
+    assert stored["pages_data"][0]["words"] == words.to_dict()
+    assert GridIndex.from_document(stored).text(0, (0, 0, 100, 100)) == "LOT 12"